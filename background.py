@@ -0,0 +1,177 @@
+"""
+Engine searches on a worker thread, so the window keeps drawing while the
+computer thinks.
+
+    engine = BackgroundEngine(Searcher(), on_done=callback)
+    job = engine.think(position, time_limit=2.0)   # returns at once
+    ...                                            # callback(job) runs on the worker
+    engine.ponder(position, predicted_reply)       # think on the opponent's time
+    job = engine.ponderhit(reply, time_limit=2.0)  # the ponder search goes on, or None
+
+One search runs at a time; starting a new one cancels the old one, whose result
+is dropped. Pondering searches the position after the predicted reply with no
+time limit; on a hit it gets the normal time limit from that moment and keeps
+the work done so far, on a miss it is cancelled. Every search shares the
+Searcher's transposition table, so even a miss leaves useful entries behind.
+
+A thread and not a process, so the table is shared; the search is pure Python
+and holds the GIL in 5 ms slices, which leaves the event-driven window plenty of
+turns to redraw.
+"""
+
+import itertools
+import threading
+import time
+
+from rules import Position
+from search import Searcher
+
+PONDER_DEPTH = 64  # a ponder search runs until it is hit, missed or reaches this
+
+
+class SearchJob(object):
+    """One search handed to the worker. result is the Searcher.search dict once done."""
+
+    def __init__(self, job_id: int, position: Position, limits: dict, ponder_move: tuple = None):
+        self.id = job_id
+        self.position = position  # private copy, searched from
+        self.limits = limits  # Searcher.search keyword arguments
+        self.ponder_move = ponder_move  # reply the search guesses, None once it is a real search
+        self.deadline = None  # perf_counter time a ponder hit gave the search
+        self.started = False  # the Searcher has set its limits, a deadline now goes to it directly
+        self.result = None
+        self.cancelled = False
+        self._done = threading.Event()
+
+    def done(self) -> bool:
+        return self._done.is_set()
+
+    def wait(self, timeout: float = None) -> dict or None:
+        """:returns the result once the search has ended, None on timeout"""
+        self._done.wait(timeout)
+        return self.result
+
+
+class BackgroundEngine(object):
+    """
+    Owns a worker thread and the Searcher it runs. on_done(job) is called on the
+    worker thread for every finished search that was not cancelled or is still
+    pondering. Call close() when done.
+    """
+
+    def __init__(self, searcher: Searcher = None, on_done=None):
+        self.searcher = searcher if searcher is not None else Searcher()
+        self.on_done = on_done
+        self._ids = itertools.count(1)
+        self._lock = threading.Condition()
+        self._pending = None
+        self._running = None
+        self._pondered = None
+        self._closed = False
+        self._thread = threading.Thread(target=self._work, name="engine", daemon=True)
+        self._thread.start()
+
+    def think(self, position: Position, **limits) -> SearchJob:
+        """Start searching the position with Searcher.search limits, dropping any other search"""
+        return self._submit(SearchJob(next(self._ids), position.copy(), limits))
+
+    def ponder(self, position: Position, move: tuple, history: list = ()) -> SearchJob:
+        """Search the position after the opponent's expected move until ponderhit or cancel"""
+        position = position.copy()
+        history = list(history) + [position.hash]
+        position.make_move(move)
+        return self._submit(SearchJob(next(self._ids), position, {"max_depth": PONDER_DEPTH, "history": history},
+                                      ponder_move=move))
+
+    def ponderhit(self, move: tuple, time_limit: float = None) -> SearchJob or None:
+        """
+        The opponent played move. If the ponder search guessed it, it becomes the real
+        search with time_limit seconds from now.
+        :returns that job, or None after cancelling a ponder search that guessed wrong
+        """
+        deliver = None
+        with self._lock:
+            job = self._running or self._pending or self._pondered
+            self._pondered = None
+            if job is None or job.ponder_move is None:
+                return None
+            if job.ponder_move != move:
+                self._cancel()
+                return None
+            job.ponder_move = None
+            if job.done():
+                deliver = job
+            elif time_limit is not None:
+                job.deadline = time.perf_counter() + time_limit
+                if job.started:
+                    self.searcher.set_time_limit(time_limit)
+        if deliver is not None and self.on_done:
+            self.on_done(deliver)
+        return job
+
+    def cancel(self) -> None:
+        """Drop the search going on or waiting, its result is not delivered"""
+        with self._lock:
+            self._cancel()
+
+    def close(self) -> None:
+        with self._lock:
+            self._closed = True
+            self._cancel()
+            self._lock.notify()
+        self._thread.join()
+
+    @property
+    def busy(self) -> bool:
+        with self._lock:
+            return self._running is not None or self._pending is not None
+
+    def _cancel(self) -> None:
+        for job in (self._pending, self._running):
+            if job is not None:
+                job.cancelled = True
+        if self._running is not None:
+            self.searcher.stop = True
+        self._pending = None
+        self._pondered = None
+
+    def _submit(self, job: SearchJob) -> SearchJob:
+        with self._lock:
+            self._cancel()
+            self._pending = job
+            self._lock.notify()
+        return job
+
+    def _started(self, job: SearchJob) -> None:
+        """
+        Called by the search once it has set its limits, which would overwrite a
+        ponder hit's time limit given before: that one is applied now.
+        """
+        with self._lock:
+            job.started = True
+            if job.deadline is not None:
+                self.searcher.set_time_limit(job.deadline - time.perf_counter())
+
+    def _work(self) -> None:
+        while True:
+            with self._lock:
+                while self._pending is None and not self._closed:
+                    self._lock.wait()
+                if self._closed:
+                    return
+                job, self._pending = self._pending, None
+                self._running = job
+                self.searcher.stop = False
+            result = None
+            try:
+                result = self.searcher.search(job.position, on_start=lambda: self._started(job), **job.limits)
+            finally:
+                with self._lock:
+                    self._running = None
+                    job.result = result
+                    job._done.set()
+                    deliver = result is not None and not job.cancelled and job.ponder_move is None
+                    if not job.cancelled and job.ponder_move is not None:
+                        self._pondered = job  # finished before the opponent moved, kept for ponderhit
+            if deliver and self.on_done:
+                self.on_done(job)
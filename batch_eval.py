@@ -0,0 +1,153 @@
+"""
+Vectorized evaluation of many positions at once with NumPy.
+
+Positions are packed into an ``N x 64`` int8 array of piece codes (0 for an empty
+square, then ``PACKED_CODES``) in rules.py square order, plus an ``N`` bool array
+that is True where black is to move. Scores come back as an ``N`` int32 array.
+
+Material and piece-square terms use the tables of evaluation.py, so with
+``mobility_weight=0`` every score equals ``evaluation.evaluate`` of the same
+position. Mobility is the number of squares each knight, bishop, rook, queen and
+king can move to (empty or enemy), computed for the whole batch with bitboard
+flood fills and table matrix products.
+"""
+
+import numpy as np
+
+from compact import PIECE_CODES as PACKED_CODES
+from evaluation import SQUARE_VALUES, PIECE_VALUES
+from tables import KNIGHT_TARGETS, KING_TARGETS, ROOK_DIRECTIONS, BISHOP_DIRECTIONS
+
+MOBILITY_WEIGHT = 4  # centipawns per reachable square
+
+# sorted string keys for mapping str(piece) / board entries to codes in one searchsorted call
+_KEYS = np.array(sorted(("0",) + PACKED_CODES))
+_KEY_CODES = np.array([0 if key == "0" else PACKED_CODES.index(key) + 1 for key in _KEYS], dtype=np.int8)
+
+# (13, 64) material + piece-square value of every code on every square, white's point of view
+_SQUARE_VALUES = np.zeros((13, 64), dtype=np.int32)
+for _code, _el in enumerate(PACKED_CODES, 1):
+    _SQUARE_VALUES[_code] = SQUARE_VALUES[_el]
+_MATERIAL = np.array([0] + [PIECE_VALUES[el[1]] if el[0] == "w" else -PIECE_VALUES[el[1]] for el in PACKED_CODES],
+                     dtype=np.int32)
+
+
+def _leaper_matrix(targets: tuple) -> np.ndarray:
+    """(64, 64) matrix with [from, to] set for every table target. float32 because
+    BLAS only does floating point products and the counts stay exact."""
+    matrix = np.zeros((64, 64), dtype=np.float32)
+    for sq, squares in enumerate(targets):
+        matrix[sq, list(squares)] = 1
+    return matrix
+
+
+_KNIGHT_MATRIX = _leaper_matrix(KNIGHT_TARGETS)
+_KING_MATRIX = _leaper_matrix(KING_TARGETS)
+
+_NOT_FILE_A = np.uint64(0xFEFEFEFEFEFEFEFE)
+_NOT_FILE_H = np.uint64(0x7F7F7F7F7F7F7F7F)
+_ALL = np.uint64(0xFFFFFFFFFFFFFFFF)
+# (shift, mask of squares a step may land on) per ray direction; positive shifts go to higher squares
+_ROOK_SHIFTS = [(dy * 8 + dx, _NOT_FILE_A if dx > 0 else _NOT_FILE_H if dx < 0 else _ALL)
+                for dx, dy in ROOK_DIRECTIONS]
+_BISHOP_SHIFTS = [(dy * 8 + dx, _NOT_FILE_A if dx > 0 else _NOT_FILE_H if dx < 0 else _ALL)
+                  for dx, dy in BISHOP_DIRECTIONS]
+_BYTE_BITS = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+
+
+def _shift(bits: np.ndarray, shift: int) -> np.ndarray:
+    if shift > 0:
+        return np.left_shift(bits, np.uint64(shift))
+    return np.right_shift(bits, np.uint64(-shift))
+
+
+def _popcount(bits: np.ndarray) -> np.ndarray:
+    if hasattr(np, "bitwise_count"):
+        return np.bitwise_count(bits).astype(np.int32)
+    return _BYTE_BITS[bits.view(np.uint8).reshape(-1, 8)].sum(axis=1, dtype=np.int32)
+
+
+def _bitboards(mask: np.ndarray) -> np.ndarray:
+    """:returns N uint64 bitboards of an N x 64 bool array"""
+    return np.packbits(mask, axis=1, bitorder="little").view("<u8").reshape(-1)
+
+
+def pack_codes(strings) -> np.ndarray:
+    """:returns int8 codes of an array of "wP"/"bK"/"0" strings, same shape"""
+    strings = np.asarray(strings, dtype=_KEYS.dtype)
+    return _KEY_CODES[np.searchsorted(_KEYS, strings)]
+
+
+def pack_positions(positions: list) -> tuple:
+    """:returns (codes N x 64 int8, black_to_move N bool) of rules.Position objects"""
+    codes = pack_codes([position.board for position in positions]).reshape(len(positions), 64)
+    black_to_move = np.array([position.turn == "b" for position in positions], dtype=bool)
+    return codes, black_to_move
+
+
+def pack_fields(fields: list, turns: list) -> tuple:
+    """
+    :returns (codes N x 64 int8, black_to_move N bool) of ``ChessBoard.get_field()``
+    layouts. The Piece objects are turned into strings by NumPy's own str() cast.
+    """
+    strings = np.array(fields, dtype=object).reshape(len(fields), 64).astype(str)
+    return pack_codes(strings), np.asarray(turns) == "b"
+
+
+def _slider_mobility(movers: np.ndarray, empty: np.ndarray, free: np.ndarray, shifts: list) -> np.ndarray:
+    """
+    :returns per position count of squares the movers reach along the directions.
+    Rays are flood filled through empty squares for the whole batch at once (Kogge-Stone).
+    Two movers' rays in one direction never meet on an empty square, so counting the
+    union per direction is exact.
+    """
+    total = np.zeros(movers.shape[0], dtype=np.int32)
+    for shift, landing in shifts:
+        generator = movers
+        propagator = empty & landing
+        generator = generator | (propagator & _shift(generator, shift))
+        propagator = propagator & _shift(propagator, shift)
+        generator = generator | (propagator & _shift(generator, 2 * shift))
+        propagator = propagator & _shift(propagator, 2 * shift)
+        generator = generator | (propagator & _shift(generator, 4 * shift))
+        total += _popcount(_shift(generator, shift) & landing & free)
+    return total
+
+
+def _mobility(codes: np.ndarray, color_offset: int) -> np.ndarray:
+    empty = codes == 0
+    own = (codes > color_offset) & (codes <= color_offset + 6)
+    free = ~own
+
+    knights = (codes == color_offset + 2).astype(np.float32)
+    kings = (codes == color_offset + 6).astype(np.float32)
+    leapers = ((knights @ _KNIGHT_MATRIX + kings @ _KING_MATRIX) * free).sum(axis=1).astype(np.int32)
+
+    queens = codes == color_offset + 5
+    empty_bits = _bitboards(empty)
+    free_bits = _bitboards(free)
+    straight = _bitboards((codes == color_offset + 4) | queens)
+    diagonal = _bitboards((codes == color_offset + 3) | queens)
+    return leapers + _slider_mobility(straight, empty_bits, free_bits, _ROOK_SHIFTS) + \
+        _slider_mobility(diagonal, empty_bits, free_bits, _BISHOP_SHIFTS)
+
+
+def evaluate_terms(codes: np.ndarray) -> dict:
+    """:returns {"material", "piece_square", "mobility"} arrays, each from white's point of view"""
+    codes = np.asarray(codes, dtype=np.int8)
+    material = _MATERIAL[codes].sum(axis=1)
+    return {
+        "material": material,
+        "piece_square": _SQUARE_VALUES[codes, np.arange(64)].sum(axis=1) - material,
+        "mobility": _mobility(codes, 0) - _mobility(codes, 6),
+    }
+
+
+def evaluate_batch(codes: np.ndarray, black_to_move: np.ndarray,
+                   mobility_weight: int = MOBILITY_WEIGHT) -> np.ndarray:
+    """:returns N int32 scores in centipawns from the point of view of the side to move"""
+    codes = np.asarray(codes, dtype=np.int8)
+    scores = _SQUARE_VALUES[codes, np.arange(64)].sum(axis=1)
+    if mobility_weight:
+        scores = scores + mobility_weight * (_mobility(codes, 0) - _mobility(codes, 6))
+    return np.where(black_to_move, -scores, scores).astype(np.int32)
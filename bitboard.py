@@ -0,0 +1,338 @@
+"""
+Bitboard backend for the rules in rules.py.
+
+Every piece code has a 64-bit integer with bit ``y * 8 + x`` set for each square
+it stands on, so a whole set of pawn pushes or the hits of a slider are a few
+shifts and masks instead of a walk over ``field[y][x]``. ``BitboardPosition``
+keeps the ``Position`` API and move format, so ``Game`` and every caller can use
+either backend and the two can be checked against each other.
+
+Legal moves are generated legal rather than filtered: checkers and pin lines
+come from the ray masks of the King's square, and every piece's targets are
+masked with them.
+"""
+
+from rules import Position, WHITE, BLACK, EMPTY, PROMOTION_SYMBOLS, \
+    WHITE_KINGSIDE, WHITE_QUEENSIDE, BLACK_KINGSIDE, BLACK_QUEENSIDE, _CORNER_RIGHTS
+from zobrist import PIECE_KEYS, CASTLING_KEYS, BLACK_TO_MOVE_KEY, en_passant_key
+from tables import KNIGHT_ATTACKS, KING_ATTACKS, PAWN_ATTACKS, ROOK_RAY_MASKS, BISHOP_RAY_MASKS
+
+FULL = (1 << 64) - 1
+FILE_A = 0x0101010101010101  # x == 0
+FILE_H = FILE_A << 7  # x == 7
+ROW_2 = 0xFF << 16  # black pawns land here after their first step
+ROW_5 = 0xFF << 40  # white pawns land here after their first step
+LAST_ROWS = 0xFF | 0xFF << 56
+
+PIECE_CODES = tuple(color + symbol for color in (WHITE, BLACK) for symbol in "PNBRQK")
+
+
+def _slider_attacks(rays: list, sq: int, occupied: int) -> int:
+    attacks = 0
+    for ray, rising in rays:
+        bits = ray[sq]
+        blockers = bits & occupied
+        if blockers:
+            if rising:
+                first = (blockers & -blockers).bit_length() - 1
+            else:
+                first = blockers.bit_length() - 1
+            bits ^= ray[first]
+        attacks |= bits
+    return attacks
+
+
+def rook_attacks(sq: int, occupied: int) -> int:
+    return _slider_attacks(ROOK_RAY_MASKS, sq, occupied)
+
+
+def bishop_attacks(sq: int, occupied: int) -> int:
+    return _slider_attacks(BISHOP_RAY_MASKS, sq, occupied)
+
+
+def _nearest(bits: int, rising: bool) -> int:
+    """:returns the square of the set bit nearest the start of a ray"""
+    return (bits & -bits).bit_length() - 1 if rising else bits.bit_length() - 1
+
+
+def squares(bits: int):
+    """Yield the square index of every set bit"""
+    while bits:
+        low = bits & -bits
+        yield low.bit_length() - 1
+        bits ^= low
+
+
+class BitboardPosition(Position):
+    """
+    Position backed by one bitboard per piece code plus one per color.
+    ``board`` is kept alongside to look up the piece on a square in O(1).
+    """
+
+    def __init__(self, board: list = None, turn: str = WHITE, castling: int = 0,
+                 en_passant: int or None = None, halfmove: int = 0, fullmove: int = 1):
+        super().__init__(board, turn, castling, en_passant, halfmove, fullmove)
+        self.pieces = dict.fromkeys(PIECE_CODES, 0)
+        self.occupied = {WHITE: 0, BLACK: 0}
+        for sq, el in enumerate(self.board):
+            if el != EMPTY:
+                self.pieces[el] |= 1 << sq
+                self.occupied[el[0]] |= 1 << sq
+
+    def copy(self):
+        position = Position.__new__(BitboardPosition)
+        position.board = self.board[:]
+        position.turn = self.turn
+        position.castling = self.castling
+        position.en_passant = self.en_passant
+        position.halfmove = self.halfmove
+        position.fullmove = self.fullmove
+        position.hash = self.hash
+        position.pieces = self.pieces.copy()
+        position.occupied = self.occupied.copy()
+        return position
+
+    def king_square(self, color: str) -> int or None:
+        king = self.pieces[color + "K"]
+        return king.bit_length() - 1 if king else None
+
+    def is_attacked(self, sq: int, by_color: str) -> bool:
+        return self._attacked(sq, by_color, self.occupied[WHITE] | self.occupied[BLACK])
+
+    def _attacked(self, sq: int, by_color: str, occupied: int) -> bool:
+        """is_attacked with the given occupied squares, to look through a King about to move"""
+        pieces = self.pieces
+        # a pawn of by_color hits sq if a pawn of the other color on sq would hit it back
+        if PAWN_ATTACKS[BLACK if by_color == WHITE else WHITE][sq] & pieces[by_color + "P"]:
+            return True
+        if KNIGHT_ATTACKS[sq] & pieces[by_color + "N"] or KING_ATTACKS[sq] & pieces[by_color + "K"]:
+            return True
+        queens = pieces[by_color + "Q"]
+        straight = pieces[by_color + "R"] | queens
+        if straight and rook_attacks(sq, occupied) & straight:
+            return True
+        diagonal = pieces[by_color + "B"] | queens
+        return bool(diagonal and bishop_attacks(sq, occupied) & diagonal)
+
+    def pseudo_legal_moves(self) -> list:
+        us = self.turn
+        own = self.occupied[us]
+        moves = []
+        self._pawn_moves(moves, self.pieces[us + "P"], FULL, self.en_passant)
+        self._piece_moves(moves, ~own, 0, {})
+        for frm in squares(self.pieces[us + "K"]):
+            for to in squares(KING_ATTACKS[frm] & ~own):
+                moves.append((frm, to, None))
+        moves += self._castling_moves()
+        return moves
+
+    def _check_masks(self) -> tuple:
+        """
+        Look from the King of the side to move along the rays that hold an enemy slider.
+        :returns (checkers, evasions, pins) as bitboards: the pieces giving check, the
+        squares a non-King move must land on to answer a single check (capture or
+        block) and {pinned square: its pin line, pinner included}
+        """
+        pieces = self.pieces
+        us = self.turn
+        them = BLACK if us == WHITE else WHITE
+        king = pieces[us + "K"].bit_length() - 1
+        own = self.occupied[us]
+        occupied = own | self.occupied[them]
+        checkers = PAWN_ATTACKS[us][king] & pieces[them + "P"] | KNIGHT_ATTACKS[king] & pieces[them + "N"]
+        evasions = checkers
+        pins = {}
+        queens = pieces[them + "Q"]
+        for ray_masks, sliders in ((ROOK_RAY_MASKS, pieces[them + "R"] | queens),
+                                   (BISHOP_RAY_MASKS, pieces[them + "B"] | queens)):
+            if not sliders:
+                continue
+            for rays, rising in ray_masks:
+                ray = rays[king]
+                if not ray & sliders:
+                    continue
+                first = _nearest(ray & occupied, rising)
+                if 1 << first & sliders:
+                    checkers |= 1 << first
+                    evasions |= ray & ~rays[first]
+                elif 1 << first & own:
+                    beyond = rays[first] & occupied
+                    if beyond:
+                        second = _nearest(beyond, rising)
+                        if 1 << second & sliders:
+                            pins[first] = ray & ~rays[second]
+        return checkers, evasions, pins
+
+    def legal_moves(self) -> list:
+        """
+        :returns all moves of the side to move that don't leave its King hit.
+
+        Targets are masked with the check evasion squares and pin lines, so no move
+        is tried on the board except en passant captures, which can uncover a line
+        through two squares at once. The King keeps off the squares the other side
+        hits with the King lifted off the board.
+        """
+        pieces = self.pieces
+        us = self.turn
+        king_bits = pieces[us + "K"]
+        if not king_bits:
+            return self.pseudo_legal_moves()
+        king = king_bits.bit_length() - 1
+        them = BLACK if us == WHITE else WHITE
+        own = self.occupied[us]
+        occupied = own | self.occupied[them]
+        checkers, evasions, pins = self._check_masks()
+        moves = []
+
+        if not checkers & (checkers - 1):  # no or a single check: the other pieces may move
+            target = evasions if checkers else FULL
+            pinned = 0
+            for sq in pins:
+                pinned |= 1 << sq
+            self._pawn_moves(moves, pieces[us + "P"] & ~pinned, target, None)
+            for frm in squares(pieces[us + "P"] & pinned):
+                self._pawn_moves(moves, 1 << frm, target & pins[frm], None)
+            self._piece_moves(moves, ~own & target, pinned, pins)
+            if self.en_passant is not None:
+                for frm in squares(PAWN_ATTACKS[them][self.en_passant] & pieces[us + "P"]):
+                    move = frm, self.en_passant, None
+                    undo = self.make_move(move)
+                    if not self._attacked(king, them, self.occupied[WHITE] | self.occupied[BLACK]):
+                        moves.append(move)
+                    self.unmake_move(move, undo)
+
+        lifted = occupied ^ king_bits
+        for to in squares(KING_ATTACKS[king] & ~own):
+            if not self._attacked(to, them, lifted):
+                moves.append((king, to, None))
+        if not checkers:
+            for move in self._castling_moves():
+                if not self._attacked(move[1], them, occupied):
+                    moves.append(move)
+        return moves
+
+    def _pawn_moves(self, moves: list, pawns: int, target: int, en_passant: int or None) -> None:
+        """Add the moves of a set of pawns landing on target, and the en passant captures if a square is given"""
+        us = self.turn
+        enemy = self.occupied[BLACK if us == WHITE else WHITE]
+        empty = ~(self.occupied[us] | enemy) & FULL
+        if en_passant is not None:
+            enemy |= 1 << en_passant
+        if us == WHITE:
+            single = (pawns >> 8) & empty
+            pawn_moves = ((single & target, 8), (((single & ROW_5) >> 8) & empty & target, 16),
+                          (((pawns & ~FILE_A) >> 9) & enemy & target, 9),
+                          (((pawns & ~FILE_H) >> 7) & enemy & target, 7))
+        else:
+            single = (pawns << 8) & empty
+            pawn_moves = ((single & target, -8), (((single & ROW_2) << 8) & empty & target, -16),
+                          (((pawns & ~FILE_A) << 7) & enemy & target, -7),
+                          (((pawns & ~FILE_H) << 9) & enemy & target & FULL, -9))
+        for bits, back in pawn_moves:
+            promotions = bits & LAST_ROWS
+            for to in squares(bits ^ promotions):
+                moves.append((to + back, to, None))
+            for to in squares(promotions):
+                for promotion in PROMOTION_SYMBOLS:
+                    moves.append((to + back, to, promotion))
+
+    def _piece_moves(self, moves: list, targets: int, pinned: int, pins: dict) -> None:
+        """Add the Knight, Bishop, Rook and Queen moves landing on targets, pinned pieces along their pin line"""
+        pieces = self.pieces
+        us = self.turn
+        occupied = self.occupied[WHITE] | self.occupied[BLACK]
+        for frm in squares(pieces[us + "N"] & ~pinned):  # a pinned Knight can never move
+            for to in squares(KNIGHT_ATTACKS[frm] & targets):
+                moves.append((frm, to, None))
+        queens = pieces[us + "Q"]
+        for sliders, attacks in ((pieces[us + "B"] | queens, bishop_attacks), (pieces[us + "R"] | queens, rook_attacks)):
+            for frm in squares(sliders):
+                bits = attacks(frm, occupied) & targets
+                if 1 << frm & pinned:
+                    bits &= pins[frm]
+                for to in squares(bits):
+                    moves.append((frm, to, None))
+
+    def _move_bits(self, el: str, frm: int, to: int) -> None:
+        bits = 1 << frm | 1 << to
+        self.pieces[el] ^= bits
+        self.occupied[el[0]] ^= bits
+        self.board[to] = el
+        self.board[frm] = EMPTY
+
+    def _remove(self, sq: int) -> None:
+        el = self.board[sq]
+        self.pieces[el] ^= 1 << sq
+        self.occupied[el[0]] ^= 1 << sq
+        self.board[sq] = EMPTY
+
+    def _put(self, el: str, sq: int) -> None:
+        self.pieces[el] |= 1 << sq
+        self.occupied[el[0]] |= 1 << sq
+        self.board[sq] = el
+
+    def make_move(self, move: tuple) -> tuple:
+        frm, to, promotion = move
+        board = self.board
+        el = board[frm]
+        moved = el[1]
+        us = self.turn
+        captured = board[to]
+        undo = captured, self.castling, self.en_passant, self.halfmove, self.fullmove, self.hash
+        key = self.hash ^ BLACK_TO_MOVE_KEY ^ CASTLING_KEYS[self.castling] ^ \
+            en_passant_key(board, self.en_passant, us) ^ PIECE_KEYS[el][frm] ^ PIECE_KEYS[el][to]
+
+        if captured != EMPTY:
+            key ^= PIECE_KEYS[captured][to]
+            self._remove(to)
+        self._move_bits(el, frm, to)
+        if moved == "P":
+            if to == self.en_passant:
+                taken = to + 8 if us == WHITE else to - 8
+                key ^= PIECE_KEYS[board[taken]][taken]
+                self._remove(taken)
+            if promotion:
+                key ^= PIECE_KEYS[el][to] ^ PIECE_KEYS[us + promotion][to]
+                self._remove(to)
+                self._put(us + promotion, to)
+        elif moved == "K":
+            self.castling &= ~(WHITE_KINGSIDE | WHITE_QUEENSIDE if us == WHITE else BLACK_KINGSIDE | BLACK_QUEENSIDE)
+            if to - frm == 2:  # 0-0
+                key ^= PIECE_KEYS[board[frm + 3]][frm + 3] ^ PIECE_KEYS[board[frm + 3]][frm + 1]
+                self._move_bits(board[frm + 3], frm + 3, frm + 1)
+            elif frm - to == 2:  # 0-0-0
+                key ^= PIECE_KEYS[board[frm - 4]][frm - 4] ^ PIECE_KEYS[board[frm - 4]][frm - 1]
+                self._move_bits(board[frm - 4], frm - 4, frm - 1)
+
+        if self.castling:
+            self.castling &= ~(_CORNER_RIGHTS.get(frm, 0) | _CORNER_RIGHTS.get(to, 0))
+
+        self.en_passant = (frm + to) // 2 if moved == "P" and abs(to - frm) == 16 else None
+        self.halfmove = 0 if moved == "P" or captured != EMPTY else self.halfmove + 1
+        if us == BLACK:
+            self.fullmove += 1
+        self.turn = them = BLACK if us == WHITE else WHITE
+        self.hash = key ^ CASTLING_KEYS[self.castling] ^ en_passant_key(board, self.en_passant, them)
+        return undo
+
+    def unmake_move(self, move: tuple, undo: tuple) -> None:
+        frm, to, promotion = move
+        board = self.board
+        captured, self.castling, self.en_passant, self.halfmove, self.fullmove, self.hash = undo
+        them = self.turn
+        us = self.turn = BLACK if them == WHITE else WHITE
+
+        if promotion:
+            self._remove(to)
+            self._put(us + "P", to)
+        el = board[to]
+        self._move_bits(el, to, frm)
+        if captured != EMPTY:
+            self._put(captured, to)
+        if el[1] == "P" and to == self.en_passant:
+            self._put(them + "P", to + 8 if us == WHITE else to - 8)
+        elif el[1] == "K":
+            if to - frm == 2:  # 0-0
+                self._move_bits(board[frm + 1], frm + 1, frm + 3)
+            elif frm - to == 2:  # 0-0-0
+                self._move_bits(board[frm - 1], frm - 1, frm - 4)
@@ -0,0 +1,185 @@
+"""
+Binary opening book, probed straight from a memory map.
+
+The file is a 16 byte header (``MAGIC`` and the record count) followed by 12 byte
+records ``(position hash, move, weight)`` sorted by hash. The hash is the Zobrist
+key of ``Position.hash`` and the move is packed by ``rules.pack_move``, so lookups
+need no parsing and no index in memory: a probe is a binary search over the
+mapped records, O(log n) page reads.
+
+    python book.py build book.bin games.pgn.gz more.pgn --plies 20
+    python book.py probe book.bin "rnbqkbnr/pppppppp/8/8/4P3/8/PPPP1PPP/RNBQKBNR b KQkq - 0 1"
+
+Weights count how often a move was played, 2 for a game the mover won and 1 for
+a draw or unknown result; moves only ever played in lost games are left out.
+"""
+
+import argparse
+import mmap
+import random
+import struct
+import sys
+import time
+
+from pgn import open_pgn, read_games, replay, PGNError, move_san
+from rules import Position, START_FEN, WHITE, move_name, pack_move, unpack_move
+
+MAGIC = b"CHESSBK2"
+HEADER = struct.Struct("<8sQ")
+RECORD = struct.Struct("<QHH")  # position hash, packed move, weight
+MAX_WEIGHT = 0xFFFF
+
+
+class OpeningBook(object):
+    """
+    Read only view of a book file. Use as a context manager or call close() when done.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._file = open(path, "rb")
+        try:
+            self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:  # an empty file can not be mapped
+            self._file.close()
+            raise ValueError(f"{path} is not an opening book")
+        magic, self.size = HEADER.unpack_from(self._map, 0)
+        if magic != MAGIC or len(self._map) != HEADER.size + self.size * RECORD.size:
+            self.close()
+            raise ValueError(f"{path} is not an opening book")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def __len__(self):
+        return self.size
+
+    def close(self) -> None:
+        if self._map is not None:
+            self._map.close()
+            self._map = None
+        self._file.close()
+
+    def _record(self, i: int) -> tuple:
+        return RECORD.unpack_from(self._map, HEADER.size + i * RECORD.size)
+
+    def _first(self, key: int) -> int:
+        """:returns index of the first record with the key or the place it would go"""
+        low, high = 0, self.size
+        while low < high:
+            middle = (low + high) // 2
+            if self._record(middle)[0] < key:
+                low = middle + 1
+            else:
+                high = middle
+        return low
+
+    def entries(self, position: Position) -> list:
+        """:returns [(move, weight)] of the position, heaviest first, legal moves only"""
+        key = position.hash
+        found = []
+        i = self._first(key)
+        while i < self.size:
+            record_key, code, weight = self._record(i)
+            if record_key != key:
+                break
+            found.append((unpack_move(code), weight))
+            i += 1
+        if found:
+            legal = position.legal_moves()
+            found = [(move, weight) for move, weight in found if move in legal]
+        return found
+
+    def moves_from(self, position: Position, from_square: int) -> list:
+        """:returns book moves of the piece on the square"""
+        return [move for move, weight in self.entries(position) if move[0] == from_square]
+
+    def choose(self, position: Position, rng: random.Random = None) -> tuple or None:
+        """:returns a book move picked with probability by weight, None out of book"""
+        entries = self.entries(position)
+        if not entries:
+            return None
+        rng = rng or random
+        return rng.choices([move for move, weight in entries], [weight for move, weight in entries])[0]
+
+
+def write_book(path: str, weights: dict) -> int:
+    """
+    Write {(position hash, packed move): weight} as a book file.
+    :returns number of records
+    """
+    records = sorted(((key, code, min(weight, MAX_WEIGHT))
+                      for (key, code), weight in weights.items() if weight > 0),
+                     key=lambda record: (record[0], -record[2], record[1]))
+    with open(path, "wb") as out:
+        out.write(HEADER.pack(MAGIC, len(records)))
+        for record in records:
+            out.write(RECORD.pack(*record))
+    return len(records)
+
+
+def build(paths: list, out_path: str, plies: int = 20, backend: str = "mailbox") -> dict:
+    """
+    Count the first plies of every game of the PGN files into a book.
+    :returns a summary with games, bad games, records and seconds
+    """
+    start = time.perf_counter()
+    weights = {}
+    games = bad = 0
+    for path in paths:
+        stream = open_pgn(path)
+        try:
+            for game in read_games(stream):
+                games += 1
+                result = game.headers.get("Result", "*")
+                try:
+                    for ply, (position, move) in enumerate(replay(game, backend)):
+                        if ply >= plies:
+                            break
+                        won = "1-0" if position.turn == WHITE else "0-1"
+                        lost = "0-1" if position.turn == WHITE else "1-0"
+                        key = position.hash, pack_move(position, move)
+                        weights[key] = weights.get(key, 0) + (2 if result == won else 0 if result == lost else 1)
+                except PGNError:
+                    bad += 1
+        finally:
+            if stream is not sys.stdin:
+                stream.close()
+    records = write_book(out_path, weights)
+    return {"games": games, "bad": bad, "records": records, "seconds": round(time.perf_counter() - start, 3)}
+
+
+def main(argv: list = None) -> int:
+    parser = argparse.ArgumentParser(description="Build or probe a binary opening book")
+    commands = parser.add_subparsers(dest="command", required=True)
+    build_parser = commands.add_parser("build", help="build a book from PGN files")
+    build_parser.add_argument("book")
+    build_parser.add_argument("pgn", nargs="+", help="PGN files, .gz allowed")
+    build_parser.add_argument("--plies", type=int, default=20, help="book depth in plies")
+    probe_parser = commands.add_parser("probe", help="list the book moves of a position")
+    probe_parser.add_argument("book")
+    probe_parser.add_argument("fen", nargs="?", default="startpos", help='FEN or "startpos"')
+    args = parser.parse_args(argv)
+
+    if args.command == "build":
+        summary = build(args.pgn, args.book, args.plies)
+        print(f"{summary['games']} games ({summary['bad']} bad) -> {summary['records']} records "
+              f"in {summary['seconds']:.2f}s")
+        return 0
+
+    position = Position.from_fen(START_FEN if args.fen == "startpos" else args.fen)
+    with OpeningBook(args.book) as book:
+        entries = book.entries(position)
+        total = sum(weight for move, weight in entries)
+        for move, weight in entries:
+            print(f"{move_san(position, move):<8} {move_name(move):<6} {weight:>6}  {100 * weight / total:5.1f}%")
+        if not entries:
+            print("out of book")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,124 @@
+"""
+Small positions for headless use, where a board of Piece objects weighs kilobytes.
+
+A CompactBoard keeps the 64 squares as one byte each in a bytearray (0 for an
+empty square, else the 1 based index of the piece in ``PIECE_CODES``, the codes
+of batch_eval.py) and the rest of the state in one int:
+
+    bit  0      black to move
+    bits 1-4    castling rights, as rules.py
+    bits 5-8    en passant file + 1, 0 for none; the row follows from the side to move
+    bits 9-16   halfmove clock, at most 255
+    bits 17-31  fullmove number, at most 32767
+
+pack() squeezes that into 36 immutable bytes, two squares a byte and the state
+int, 69 bytes of memory per position with the bytes object header. Packed
+positions compare and hash by value, so they do as set members, dict keys or
+file records by the million; unpack() gives the board back.
+
+    board = CompactBoard.from_field(chess_board.get_field(), turn, last_move)
+    data = board.pack()
+    field, last_move = CompactBoard.unpack(data).to_field()
+"""
+
+import struct
+
+from rules import Position, WHITE, BLACK, EMPTY, position_class
+
+PIECE_CODES = ("wP", "wN", "wB", "wR", "wQ", "wK", "bP", "bN", "bB", "bR", "bQ", "bK")
+PACKED_SIZE = 36
+STATE = struct.Struct("<I")
+
+_CODES = {el: code for code, el in enumerate(PIECE_CODES, 1)}
+_PIECES = (EMPTY,) + PIECE_CODES
+_LOW = bytes(b & 15 for b in range(256))
+_HIGH = bytes(b >> 4 for b in range(256))
+_SHIFTED = bytes(b << 4 & 255 for b in range(256))
+
+
+class CompactBoard(object):
+    """Mutable board of 64 byte squares and the packed state int, see the module docstring"""
+    __slots__ = ("squares", "state")
+
+    def __init__(self, squares: bytearray = None, state: int = 0):
+        self.squares = squares if squares is not None else bytearray(64)
+        self.state = state
+
+    @classmethod
+    def from_position(cls, position: Position):
+        en_passant = position.en_passant % 8 + 1 if position.en_passant is not None else 0
+        state = (position.turn == BLACK) | position.castling << 1 | en_passant << 5 | \
+            min(position.halfmove, 255) << 9 | min(position.fullmove, 32767) << 17
+        return cls(bytearray(_CODES[el] if el != EMPTY else 0 for el in position.board), state)
+
+    @classmethod
+    def from_field(cls, field: list, turn: str = WHITE, last_move: tuple = None):
+        """Board of a ``ChessBoard.get_field()`` layout, read the way Position.from_field does"""
+        return cls.from_position(Position.from_field(field, turn, last_move))
+
+    @classmethod
+    def unpack(cls, data: bytes):
+        """Inverse of pack()"""
+        if len(data) != PACKED_SIZE:
+            raise ValueError(f"a packed position is {PACKED_SIZE} bytes, not {len(data)}")
+        squares = bytearray(64)
+        squares[0::2] = data[:32].translate(_LOW)
+        squares[1::2] = data[:32].translate(_HIGH)
+        return cls(squares, STATE.unpack_from(data, 32)[0])
+
+    def pack(self) -> bytes:
+        """:returns the board as PACKED_SIZE bytes"""
+        low = int.from_bytes(self.squares[0::2], "little")
+        high = int.from_bytes(self.squares[1::2].translate(_SHIFTED), "little")
+        return (low | high).to_bytes(32, "little") + STATE.pack(self.state)
+
+    def piece(self, sq: int) -> str or int:
+        """:returns piece code on the square like "wP", EMPTY if none"""
+        return _PIECES[self.squares[sq]]
+
+    @property
+    def turn(self) -> str:
+        return BLACK if self.state & 1 else WHITE
+
+    @property
+    def castling(self) -> int:
+        return self.state >> 1 & 15
+
+    @property
+    def en_passant(self) -> int or None:
+        file = self.state >> 5 & 15
+        if not file:
+            return None
+        return (16 if self.state & 1 == 0 else 40) + file - 1
+
+    @property
+    def halfmove(self) -> int:
+        return self.state >> 9 & 255
+
+    @property
+    def fullmove(self) -> int:
+        return self.state >> 17
+
+    def to_position(self, backend: str = "mailbox") -> Position:
+        return position_class(backend)([_PIECES[code] for code in self.squares], self.turn, self.castling,
+                                       self.en_passant, self.halfmove, self.fullmove)
+
+    def to_field(self) -> tuple:
+        """
+        :returns (field, last_move): a ``ChessBoard.get_field()`` layout of new Piece
+        objects, with the moves counts and last move tile that carry the castling
+        rights and en passant square, as GameProcess.set_up places them
+        """
+        from models import PIECE_CLASSES  # needs pygame, the rest of the module does not
+
+        field = [[0] * 8 for _ in range(8)]
+        pieces, last_move = self.to_position().to_field()
+        for x, y, color, symbol, moves_count in pieces:
+            piece = PIECE_CLASSES[symbol](x, y, color)
+            for _ in range(moves_count):
+                piece.upgrade_moves_count()
+            field[y][x] = piece
+        return field, last_move
+
+    def copy(self):
+        return CompactBoard(self.squares[:], self.state)
@@ -1,10 +1,48 @@
 from models import *
+from background import BackgroundEngine
+from book import OpeningBook
+from gamefile import GameRecord, read_games, write_games
+from instrument import Profiler
+from rules import Game, Position, PROMOTION_SYMBOLS, position_class, square, tile, move_name, unpack_move
+from search import Searcher
+from tablebase import Tablebase
 import pygame
 
+PROMOTION_PIECES = {symbol: PIECE_CLASSES[symbol] for symbol in PROMOTION_SYMBOLS}
+ENGINE_DONE = pygame.USEREVENT + 1  # posted by the engine thread with the finished job as event.job
+GAME_END_TEXTS = {"stalemate": "Stalemate!", "repetition": "Draw!", "fifty moves": "Draw!"}
+DRAW_REASONS = {"stalemate": "No legal moves", "repetition": "Threefold repetition", "fifty moves": "Fifty move rule"}
+OVERLAY_KEY = pygame.K_F3  # shows and hides the profiler overlay
+OVERLAY_RECT = (590, 360, 310, 236)
+
 
 class GameProcess(object):
-    def __init__(self):
+    def __init__(self, backend: str = "mailbox", engine_color: str = None, engine_time: float = 1.0,
+                 fen: str = None, book_path: str = None, tablebase_dir: str = None,
+                 frame_rate: int = None, wake_interval: int = None, event_driven: bool = True,
+                 ponder: bool = False, profile_path: str = None, overlay: bool = False,
+                 load_path: str = None, load_index: int = -1, save_path: str = None):
         self.__run = True
+        self.__load_path = load_path  # gamefile.py file to start from, its game number load_index
+        self.__load_index = load_index
+        self.__save_path = save_path  # gamefile.py file Ctrl+S appends the game to
+        self.__redo = []  # packed moves taken back, the next one to play again last
+        self.__profile_path = profile_path  # instrument.Profiler report written here on exit, .json or pstats
+        self.__overlay = overlay  # draw the frame phase times and counters on screen
+        self.__profiler = Profiler() if profile_path or overlay else None  # None costs nothing
+        self.__event_driven = event_driven  # sleep in pygame.event.wait instead of polling
+        self.__frame_rate = frame_rate  # frames per second cap, None for no cap
+        self.__wake_interval = wake_interval  # ms between wake ups without events, for clocks; None sleeps
+        self.__fen = fen  # start position, the usual one if None
+        self.__book = OpeningBook(book_path) if book_path else None  # book.py file, played and shown
+        self.__backend = backend  # move generator of the rules engine, see rules.BACKENDS
+        self.__engine_color = engine_color  # "w" or "b" to let the computer play that side
+        self.__engine_time = engine_time  # seconds per computer move
+        self.__tablebase = Tablebase(tablebase_dir) if tablebase_dir else None  # see tablebase.py
+        self.__engine = BackgroundEngine(Searcher(tablebase=self.__tablebase), on_done=self.__engine_done) \
+            if engine_color else None
+        self.__ponder = ponder  # think on the opponent's time about its expected reply
+        self.__thinking = None  # SearchJob of the computer move being searched
         self.__field = [[0 for __ in range(8)] for _ in range(8)]
         self.__cell_size = 60
         self.__window = pygame.display.set_mode(size=(900, 600))
@@ -13,6 +51,8 @@ class GameProcess(object):
         self.__turn = "w"
         self.__last_move = None
         self.__is_check = False
+        self.__game = None  # headless rules engine, the board below only draws it
+        self.__promotion_move = None
         self.__chess_board = ChessBoard(x=50,
                                         y=50,
                                         cell_size=self.__cell_size,
@@ -26,38 +66,144 @@ class GameProcess(object):
     def set_possible_moves(self, possible_moves: list):
         self._possible_moves = possible_moves
         self.__chess_board.set_possible_moves(possible_moves)
+        self.set_book_moves()
+
+    def set_book_moves(self):
+        """Mark the opening book moves of the picked piece"""
+        book_moves = []
+        if self.__book is not None and self.__active_tile and self._possible_moves:
+            book_moves = [tile(move[1]) for move in
+                          self.__book.moves_from(self.__game.position, square(*self.__active_tile))]
+        self.__chess_board.set_book_moves(book_moves)
 
     def set_last_move(self, last_move):
         self.__last_move = last_move
         self.__chess_board.set_last_move(last_move)
 
-    def find_my_king(self, field: list) -> tuple:
+    def find_my_king(self) -> tuple:
         """:returns tuple of coordinates of the King on corresponding turn"""
-        for i, row in enumerate(field):
-            for j, el in enumerate(row):
-                if el != 0 and el.color == self.__turn and el.symbol == "K":
-                    return j, i
-
-    def all_enemy_hits(self, field_option: list) -> list:
-        """:returns the list of all tiles that enemy can hit or reach on given board"""
-        enemy_hits = []
-        for i, row in enumerate(field_option):
-            for j, el in enumerate(row):
-                if el != 0 and el.color != self.__turn:
-                    enemy_hits += el.get_possible_moves(field_option)
-        return sorted(list(set(enemy_hits)))  # sort for debug only
-
-
-    def is_check(self, field: list):  # fix for king
-        """True if given field checks the current player's King"""
-        return self.find_my_king(field) in self.all_enemy_hits(field)
-
-    def event_checker(self):
-        for event in pygame.event.get():  # key mapping of the game
+        return self.__game.king_tile()
+
+    def is_check(self):
+        """True if the current player's King is checked"""
+        return self.__game.is_check()
+
+    def commit_move(self, from_tile: tuple, to_tile: tuple, promotion: str = None):
+        """Play the move in the rules engine and pass the turn"""
+        move = self.__game.find_move(from_tile, to_tile, promotion)
+        self.__game.push(move)
+        if self.__redo and self.__redo[-1] == self.__game.packed[-1]:
+            self.__redo.pop()  # the move taken back is played again, the later ones stay
+        else:
+            self.__redo.clear()
+        self.__turn = self.__game.turn
+        if self.__engine is not None and self.__turn == self.__engine_color:
+            # a ponder search that guessed this move goes on as the real one
+            self.__thinking = self.__engine.ponderhit(move, self.__engine_time)
+        self.set_active_tile(None)
+        self.__field = self.__chess_board.get_field()
+        self.update_check()
+
+    def update_check(self):
+        """Mark the King of the side to move if it is checked, or show the mate or draw"""
+        self.__is_check = False
+        self.__chess_board.set_is_check(False)
+        self.__chess_board.set_verdict(self.verdict())
+        # the legal moves of the new position are generated here once and reused until the next move
+        termination = self.__game.termination()
+        self.__chess_board.set_game_end(GAME_END_TEXTS.get(termination))
+        if self.is_check():
+            self.__is_check = True
+            self.__chess_board.set_is_check(self.find_my_king())
+            if termination == "checkmate":
+                self.__chess_board.set_is_check("Mate")
+
+    def play_move(self, move: tuple):
+        """Show a move that was not clicked (computer player) on the board and commit it"""
+        frm, to, promotion = move
+        from_tile, to_tile = tile(frm), tile(to)
+        self.set_active_tile(from_tile)
+        self.set_possible_moves([to_tile])
+        self.__chess_board.make_move(to_tile)
+        self.set_last_move(to_tile)
+        if promotion:
+            self.__chess_board.add_piece(PROMOTION_PIECES[promotion](to_tile[0], to_tile[1], self.__turn))
+        self.set_possible_moves([])
+        self.commit_move(from_tile, to_tile, promotion)
+
+    def start_thinking(self):
+        """Play a book move right away or start the search on the engine thread"""
+        move = self.__book.choose(self.__game.position) if self.__book is not None else None
+        if move is not None:
+            self.play_move(move)
+        else:
+            self.__thinking = self.__engine.think(self.__game.position, time_limit=self.__engine_time,
+                                                  history=list(self.__game.history))
+
+    def __engine_done(self, job):
+        """Engine thread side: hand the result to the game loop"""
+        try:
+            pygame.event.post(pygame.event.Event(ENGINE_DONE, job=job))
+        except pygame.error:  # the window is gone
+            pass
+
+    def finish_thinking(self, job):
+        """Play the move of a finished search and start pondering on the expected reply"""
+        if job is not self.__thinking:
+            return
+        self.__thinking = None
+        if job.position.hash != self.__game.position.hash or job.result["move"] is None:
+            return
+        self.play_move(job.result["move"])
+        pv = job.result["pv"]
+        if self.__ponder and len(pv) > 1 and pv[0] == job.result["move"] and not self.game_over():
+            self.__engine.ponder(self.__game.position, pv[1], self.__game.history)
+
+    def wait_events(self) -> list:
+        """Sleep until an event comes or the wake interval passes. :returns all pending events"""
+        event = pygame.event.wait(self.__wake_interval or 0)
+        events = [] if event.type == pygame.NOEVENT else [event]
+        return events + pygame.event.get()
+
+    def toggle_overlay(self):
+        """Show or hide the profiler overlay; the profiler runs only while shown or saving to a file"""
+        self.__overlay = not self.__overlay
+        if self.__overlay:
+            if self.__profiler is None:
+                self.__profiler = Profiler()
+                self.__profiler.enable()
+        else:
+            if not self.__profile_path:
+                self.__profiler.disable()
+                self.__profiler = None
+            self.__chess_board.invalidate()
+
+    def event_checker(self, events: list = None):
+        for event in events if events is not None else pygame.event.get():  # key mapping of the game
             # print(event)
             if event.type == pygame.QUIT:
                 self.__run = False
 
+            if event.type == pygame.KEYDOWN:
+                ctrl = event.mod & pygame.KMOD_CTRL
+                if event.key == OVERLAY_KEY:
+                    self.toggle_overlay()
+                elif event.key == pygame.K_LEFT or (ctrl and event.key == pygame.K_z):
+                    self.undo()
+                elif event.key == pygame.K_RIGHT or (ctrl and event.key == pygame.K_y):
+                    self.redo()
+                elif ctrl and event.key == pygame.K_s:
+                    self.save_game()
+
+            if event.type in (pygame.VIDEOEXPOSE, pygame.WINDOWEXPOSED):  # window uncovered or restored
+                self.__chess_board.invalidate()
+
+            if event.type == ENGINE_DONE:
+                self.finish_thinking(event.job)
+
+            if self.__turn == self.__engine_color or self.game_over():  # not ours while the computer thinks
+                continue
+
             if event.type == pygame.MOUSEBUTTONUP:
                 x, y = self.__chess_board.get_tiles(event)  # index of clicked cell
 
@@ -69,54 +215,17 @@ class GameProcess(object):
                                 self.__chess_board.add_piece(pieces[i](self.__active_tile[0],
                                                                        self.__active_tile[1],
                                                                        self.__turn[0]))
-                                if self.__turn[0] == "b":
-                                    self.__turn = "w"
-                                else:
-                                    self.__turn = "b"
-                                self.set_active_tile(None)
-                                self.__field = self.__chess_board.get_field()
-                                self.__is_check = False
-
-                                if self.is_check(self.__field):
-                                    self.__is_check = True
-                                    self.__chess_board.set_is_check(self.find_my_king(self.__field))
-
+                                from_tile, to_tile = self.__promotion_move
+                                self.__promotion_move = None
+                                self.commit_move(from_tile, to_tile, PROMOTION_SYMBOLS[i])
                                 break
 
                 elif 0 <= x <= 7 and 0 <= y <= 7:
                     # print(x, y)
                     if not self.__active_tile:
                         if self.__field[y][x] != 0 and self.__field[y][x].color == self.__turn:
-                            possible_moves = self.__field[y][x].get_possible_moves(self.__field, self.__last_move)
                             self.set_active_tile((x, y))
-
-                            # Check if my move will not cause the check
-                            possible_moves_without_check = []
-                            for move in possible_moves:
-                                x, y = self.__active_tile
-
-                                field_to_check = self.__chess_board.make_field_prediction(move, (x, y))
-                                if not self.is_check(field_to_check):
-
-                                    # castle rules
-                                    if self.__field[y][x].symbol == "K" and abs(move[0] - x) > 1:
-                                        enemy_hits = self.all_enemy_hits(self.__field)
-                                        safe = True
-                                        if move[0] - x < 0:  # 0-0-0
-                                            for i in range(2):
-                                                if (x - i, y) in enemy_hits:
-                                                    safe = False
-                                                    break
-                                        elif move[0] - x > 0:  # 0-0-0
-                                            for i in range(2):
-                                                if (x + i, y) in enemy_hits:
-                                                    safe = False
-                                                    break
-                                        if not safe:
-                                            continue
-
-                                    possible_moves_without_check.append(move)
-                            self.set_possible_moves(possible_moves_without_check)
+                            self.set_possible_moves(self.__game.legal_destinations((x, y)))
 
                         else:
                             pass
@@ -127,6 +236,7 @@ class GameProcess(object):
                             self.set_possible_moves([])
 
                         elif (x, y) in self._possible_moves:  # make a move
+                            from_tile = self.__active_tile
 
                             # PAWN TRANSFORMATION BLOCK
                             if (y == 0 or y == len(self.__field) - 1) and \
@@ -138,22 +248,12 @@ class GameProcess(object):
                                 self.set_last_move((x, y))
                                 self.__field = self.__chess_board.get_field()
                                 self.set_active_tile((x, y))
+                                self.__promotion_move = from_tile, (x, y)
 
                             if len(self.__turn) == 1:
                                 self.__chess_board.make_move((x, y))
                                 self.set_last_move((x, y))
-
-                                if self.__turn == "b":
-                                    self.__turn = "w"
-                                else:
-                                    self.__turn = "b"
-                                self.set_active_tile(None)
-                                self.__field = self.__chess_board.get_field()
-                                self.__is_check = False
-
-                                if self.is_check(self.__field):
-                                    self.__is_check = True
-                                    self.__chess_board.set_is_check(self.find_my_king(self.__field))
+                                self.commit_move(from_tile, (x, y))
 
                             self.set_possible_moves([])
                             # print(self.__field[y][x], x, y, "DEACTIVADED")
@@ -162,21 +262,8 @@ class GameProcess(object):
                     pass
 
     def game_over(self):
-        """call when check to current color appears.
-        :returns True if no possible moves left (Check-Mate) else False"""
-        for y, row in enumerate(self.__field):
-            for x, el in enumerate(row):
-                if self.__field[y][x] != 0 and self.__field[y][x].color == self.__turn:
-
-                    possible_moves = self.__field[y][x].get_possible_moves(self.__field, self.__last_move)
-
-            #     # Check if my move will not cause the check
-                    for move in possible_moves:
-                        field_to_check = self.__chess_board.make_field_prediction(move, (x, y))
-                        if not self.is_check(field_to_check):
-                            # no castle possible
-                            return False
-        return True
+        """:returns True on checkmate, stalemate, threefold repetition or the fifty move rule"""
+        return self.__game.is_game_over()
     #
     def chess_board_fill(self):
         self.__chess_board.add_piece(Rook(7, 0, "b"))
@@ -199,21 +286,167 @@ class GameProcess(object):
         self.__chess_board.add_piece(Rook(0, 7, "w"))
         [self.__chess_board.add_piece(Pawn(i, 6, "w")) for i in range(8)]
 
+    def set_up(self, position: Position, moves: list = ()):
+        """
+        Start a new game from a rules position and the moves already played from it.
+        :raises ValueError if the position can not be played or a move is illegal
+        """
+        problems = position.problems()
+        if problems:
+            raise ValueError(f"can not play from {position.to_fen()}: {', '.join(problems)}")
+        if self.__engine is not None:
+            self.__engine.cancel()
+            self.__thinking = None
+        game = Game(position.to_backend(self.__backend))
+        for move in moves:
+            if move not in game.legal_moves():
+                raise ValueError(f"illegal move {move_name(move)} in {game.position.to_fen()}")
+            game.push(move)
+        self.__game = game
+        self.__redo = []
+        self.show_position()
+
+    def show_position(self):
+        """
+        Put the pieces of the game position on the board, with the moves counts and last move
+        that carry its castling rights and en passant square (Position.to_field).
+        """
+        position = self.__game.position
+        for row in self.__field:
+            row[:] = [0] * len(row)
+        pieces, last_move = position.to_field()
+        for x, y, color, symbol, moves_count in pieces:
+            piece = PIECE_CLASSES[symbol](x, y, color)
+            for _ in range(moves_count):
+                piece.upgrade_moves_count()
+            self.__chess_board.add_piece(piece)
+        self.__turn = position.turn
+        self.__promotion_move = None
+        self.__chess_board.set_last_move_from(None)
+        if self.__game.moves:
+            frm, to, promotion = self.__game.moves[-1]
+            self.__chess_board.set_last_move_from(tile(frm))
+            last_move = tile(to)
+        self.set_last_move(last_move)
+        self.set_active_tile(None)
+        self.set_possible_moves([])
+        self.update_check()
+
+    def undo(self):
+        """Take back the last move, and the computer's before it so that it is a human's turn"""
+        if len(self.__turn) > 1 or not self.__game.moves:  # not while picking a promotion
+            return
+        if self.__engine is not None:
+            self.__engine.cancel()
+            self.__thinking = None
+        while self.__game.moves:
+            self.__redo.append(self.__game.packed[-1])
+            self.__game.pop()
+            if self.__game.turn != self.__engine_color:
+                break
+        self.show_position()
+
+    def redo(self):
+        """Play the moves taken back again, up to the next human turn"""
+        if len(self.__turn) > 1 or not self.__redo:
+            return
+        if self.__engine is not None:
+            self.__engine.cancel()
+            self.__thinking = None
+        while self.__redo:
+            self.play_move(unpack_move(self.__redo[-1]))  # commit_move takes it off the redo list
+            if self.__turn != self.__engine_color or self.game_over():
+                break
+
+    def load_game(self, path: str, index: int = -1):
+        """Start from the end of a game of a gamefile.py file, to step through with undo and redo"""
+        records = list(read_games(path))
+        if not records:
+            raise ValueError(f"no games in {path}")
+        record = records[index]
+        self.set_up(record.start_position(self.__backend), [unpack_move(code) for code in record.moves])
+
+    def save_game(self) -> bool:
+        """Append the game so far to the save file. :returns False if there is none"""
+        if not self.__save_path:
+            return False
+        write_games(self.__save_path, [GameRecord.from_game(self.__game)])
+        return True
+
+    def verdict(self) -> str or None:
+        """:returns why the game is drawn, or the tablebase outcome of the position, like
+        "White mates in 7", or None"""
+        termination = self.__game.termination()
+        if termination in DRAW_REASONS:
+            return DRAW_REASONS[termination]
+        if self.__tablebase is None or termination:
+            return None
+        probed = self.__tablebase.probe(self.__game.position)
+        if probed is None:
+            return None
+        wdl, plies = probed
+        if not wdl:
+            return "Drawn ending"
+        winner = self.__turn if wdl > 0 else ("b" if self.__turn == "w" else "w")
+        return f"{'White' if winner == 'w' else 'Black'} mates in {(plies + 1) // 2}"
+
     def start(self):
 
         pygame.init()
-        self.chess_board_fill()
+        if self.__load_path:
+            self.load_game(self.__load_path, self.__load_index)
+        elif self.__fen:
+            self.set_up(Position.from_fen(self.__fen))
+        else:
+            self.chess_board_fill()
+            self.__game = Game(position_class(self.__backend).from_field(self.__chess_board.get_field(),
+                                                                         self.__turn, self.__last_move))
+        pygame.event.set_blocked(pygame.MOUSEMOTION)  # nothing follows the pointer, don't wake up for it
+        clock = pygame.time.Clock() if self.__frame_rate else None
+        if self.__profiler is not None:
+            self.__profiler.enable()
         while self.__run:
-            self.__window.fill((50, 90, 50))
-
-            self.__chess_board.draw_board()
-            if len(self.__turn) > 1:
-                self.__chess_board.draw_transformation_options(self.__turn[0], self.__window)
-            self.__chess_board.draw_all_pieces()
-            if self.__is_check:
-                if self.game_over():
-                    self.__chess_board.set_is_check("Mate")
+            profiler = self.__profiler  # every phase is marked only while there is one
+            if profiler:
+                profiler.frame()
+            # only the tiles and panel that changed are drawn and sent to the screen
+            dirty = self.__chess_board.render(self.__turn[0] if len(self.__turn) > 1 else None)
+            if profiler:
+                profiler.mark("render")
+                if self.__overlay:
+                    dirty.append(profiler.draw_overlay(self.__window, OVERLAY_RECT))
+                    profiler.mark("overlay")
+            if dirty:
+                pygame.display.update(dirty)
             self.__field = self.__chess_board.get_field()
-            self.event_checker()
-
-            pygame.display.update()
+            if profiler:
+                profiler.mark("display")
+            engine_turn = self.__turn == self.__engine_color and self.__thinking is None and not self.game_over()
+            if profiler:
+                profiler.mark("game_over")
+            if engine_turn:
+                self.start_thinking()
+                if profiler:
+                    profiler.mark("engine")
+            elif self.__event_driven:
+                events = self.wait_events()
+                if profiler:
+                    profiler.mark("wait")
+                self.event_checker(events)
+                if profiler:
+                    profiler.mark("events")
+            else:
+                self.event_checker()
+                if profiler:
+                    profiler.mark("events")
+            if clock:
+                clock.tick(self.__frame_rate)
+                if profiler:
+                    profiler.mark("clock")
+        if self.__engine is not None:
+            self.__engine.close()
+        if self.__profiler is not None:
+            self.__profiler.frame()
+            self.__profiler.disable()
+            if self.__profile_path:
+                self.__profiler.save(self.__profile_path)
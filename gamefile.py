@@ -0,0 +1,197 @@
+"""
+Binary game files: games as arrays of 16 bit packed moves (rules.pack_move).
+
+The file is ``MAGIC`` followed by one record per game:
+
+    result      1 byte, index in RESULTS
+    start       1 byte, 0 for the usual start position, 1 if a packed start follows
+    plies       2 bytes, little endian
+    [position]  compact.PACKED_SIZE bytes, CompactBoard.pack() of the start position
+    moves       2 bytes per ply, little endian
+
+A 40 move game takes 164 bytes, a fifth or less of its PGN movetext and far less
+with the tag pairs, which the format leaves out. Records are appended, so a file
+grows game by game; reading copies each move array out of the file buffer with
+``array.frombytes``.
+
+    python gamefile.py convert games.bin archive.pgn.gz more.pgn
+    python gamefile.py stats games.bin
+"""
+
+import argparse
+import os
+import struct
+import sys
+import time
+from array import array
+
+from compact import CompactBoard, PACKED_SIZE
+from rules import Game, Position, START_FEN, BACKENDS, position_class, pack_move, unpack_move
+
+MAGIC = b"CHESSGM1"
+RECORD = struct.Struct("<BBH")  # result, start, plies
+RESULTS = ("*", "1-0", "0-1", "1/2-1/2")
+MAX_PLIES = 0xFFFF
+_SWAP = sys.byteorder != "little"
+
+
+class GameRecord(object):
+    """One game of a file: packed start position or None for the usual one, the packed moves and the result"""
+    __slots__ = ("start", "moves", "result")
+
+    def __init__(self, start: bytes or None, moves: array, result: str = "*"):
+        self.start = start
+        self.moves = moves
+        self.result = result
+
+    @classmethod
+    def from_game(cls, game: Game):
+        start = None if game.start.to_fen() == START_FEN else CompactBoard.from_position(game.start).pack()
+        return cls(start, array("H", game.packed), game.result())
+
+    def start_position(self, backend: str = "mailbox") -> Position:
+        if self.start is None:
+            return position_class(backend).from_fen(START_FEN)
+        return CompactBoard.unpack(self.start).to_position(backend)
+
+    def replay(self, backend: str = "mailbox") -> Game:
+        """:returns the game with every move played; the moves are not checked for legality"""
+        game = Game(self.start_position(backend))
+        for code in self.moves:
+            game.push(unpack_move(code))
+        return game
+
+
+def write_games(path: str, records, append: bool = True) -> int:
+    """
+    Write GameRecords to the file, after the games already in it unless append is False.
+    :returns number of games written
+    """
+    new = not append or not os.path.exists(path) or os.path.getsize(path) == 0
+    if not new:
+        with open(path, "rb") as f:
+            if f.read(len(MAGIC)) != MAGIC:
+                raise ValueError(f"{path} is not a game file")
+    count = 0
+    with open(path, "wb" if new else "ab") as out:
+        if new:
+            out.write(MAGIC)
+        for record in records:
+            if len(record.moves) > MAX_PLIES:
+                raise ValueError(f"a game file holds at most {MAX_PLIES} plies per game")
+            moves = array("H", record.moves)
+            if _SWAP:
+                moves.byteswap()
+            out.write(RECORD.pack(RESULTS.index(record.result), record.start is not None, len(moves)))
+            if record.start is not None:
+                out.write(record.start)
+            out.write(moves.tobytes())
+            count += 1
+    return count
+
+
+def read_games(path: str):
+    """Yield the GameRecord of every game of the file"""
+    with open(path, "rb") as f:
+        data = f.read()
+    if data[:len(MAGIC)] != MAGIC:
+        raise ValueError(f"{path} is not a game file")
+    offset = len(MAGIC)
+    while offset < len(data):
+        if offset + RECORD.size > len(data):
+            raise ValueError(f"{path} is cut short at byte {offset}")
+        result, has_start, plies = RECORD.unpack_from(data, offset)
+        offset += RECORD.size
+        start = None
+        if has_start:
+            start = data[offset:offset + PACKED_SIZE]
+            offset += PACKED_SIZE
+        end = offset + 2 * plies
+        if end > len(data) or result >= len(RESULTS):
+            raise ValueError(f"{path} is cut short or damaged at byte {offset}")
+        moves = array("H")
+        moves.frombytes(data[offset:end])
+        if _SWAP:
+            moves.byteswap()
+        offset = end
+        yield GameRecord(start, moves, RESULTS[result])
+
+
+def convert(paths: list, out_path: str, backend: str = "mailbox") -> dict:
+    """
+    Store the games of PGN files in a new game file.
+    :returns summary with games, bad games, PGN and game file bytes and seconds
+    """
+    from pgn import open_pgn, read_games as read_pgn_games, replay, PGNError  # only conversion needs PGN
+
+    start = time.perf_counter()
+    summary = {"games": 0, "bad": 0}
+
+    def records():
+        for path in paths:
+            stream = open_pgn(path)
+            try:
+                for pgn_game in read_pgn_games(stream):
+                    moves = array("H")
+                    try:
+                        for position, move in replay(pgn_game, backend):
+                            moves.append(pack_move(position, move))
+                    except PGNError:
+                        summary["bad"] += 1
+                        continue
+                    start_position = pgn_game.start_position(backend)
+                    start = None if start_position.to_fen() == START_FEN else \
+                        CompactBoard.from_position(start_position).pack()
+                    result = pgn_game.headers.get("Result", "*")
+                    summary["games"] += 1
+                    yield GameRecord(start, moves, result if result in RESULTS else "*")
+            finally:
+                if stream is not sys.stdin:
+                    stream.close()
+
+    write_games(out_path, records(), append=False)
+    summary.update(pgn_bytes=sum(os.path.getsize(path) for path in paths if path != "-"),
+                   bytes=os.path.getsize(out_path), seconds=round(time.perf_counter() - start, 3))
+    return summary
+
+
+def main(argv: list = None) -> int:
+    parser = argparse.ArgumentParser(description="Convert PGN to binary game files and read them back")
+    commands = parser.add_subparsers(dest="command", required=True)
+    convert_parser = commands.add_parser("convert", help="store the games of PGN files in a game file")
+    convert_parser.add_argument("out")
+    convert_parser.add_argument("pgn", nargs="+", help="PGN files, .gz allowed")
+    stats_parser = commands.add_parser("stats", help="count and replay the games of a game file")
+    stats_parser.add_argument("path")
+    stats_parser.add_argument("--no-replay", action="store_true", help="only read, do not play the moves")
+    for command in (convert_parser, stats_parser):
+        command.add_argument("--backend", choices=BACKENDS, default="mailbox")
+    args = parser.parse_args(argv)
+
+    if args.command == "convert":
+        summary = convert(args.pgn, args.out, args.backend)
+        print(f"{summary['games']} games ({summary['bad']} bad)  {summary['pgn_bytes']} PGN bytes -> "
+              f"{summary['bytes']} bytes  {summary['seconds']:.2f}s")
+        return 0
+
+    start = time.perf_counter()
+    games = plies = 0
+    results = dict.fromkeys(RESULTS, 0)
+    for record in read_games(args.path):
+        games += 1
+        plies += len(record.moves)
+        results[record.result] += 1
+    read_seconds = time.perf_counter() - start
+    print(f"{games} games  {plies} plies  {os.path.getsize(args.path)} bytes  "
+          f"{', '.join(f'{result} {count}' for result, count in results.items())}  read in {read_seconds:.3f}s")
+    if not args.no_replay:
+        start = time.perf_counter()
+        for record in read_games(args.path):
+            record.replay(args.backend)
+        seconds = time.perf_counter() - start
+        print(f"replayed in {seconds:.2f}s  {int(plies / seconds) if seconds else 0} plies/s")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,176 @@
+"""
+Frame phase timing and rules engine counters, for finding where a frame goes.
+
+    profiler = Profiler()
+    profiler.enable()                 # counters on
+    profiler.frame()                  # at the top of every frame
+    ...; profiler.mark("render")      # time since the last mark goes to the phase
+    profiler.save("run.json")         # or "run.prof" for pstats / snakeviz
+    profiler.disable()
+
+Counters are kept by wrapping the methods of the position classes while a
+profiler is enabled: ``legal_moves`` calls and the moves they returned,
+``copy`` calls (board copies), ``is_attacked`` calls (every King safety test of
+in_check, castling and the King and en passant moves) and ``make_move`` calls.
+disable() puts the plain methods back, so a game without a profiler runs the
+same code as before. They count the engine thread too.
+
+The .prof export is a pstats file: every phase is a function called once per
+frame from "frame", with its total time; the counted methods appear with their
+call counts and no time.
+"""
+
+import json
+import marshal
+import time
+
+from bitboard import BitboardPosition
+from rules import Position
+
+COUNTERS = ("legal_moves", "moves_generated", "copies", "legality_checks", "make_move")
+OVERLAY_FRAMES = 60  # the overlay shows the mean over this many frames
+
+counters = dict.fromkeys(COUNTERS, 0)
+_originals = {}  # (class, method name): plain method, while enabled
+
+
+def _counted_legal_moves(method):
+    def legal_moves(self):
+        moves = method(self)
+        counters["legal_moves"] += 1
+        counters["moves_generated"] += len(moves)
+        return moves
+    return legal_moves
+
+
+def _counted(method, counter: str):
+    def counted(self, *args, **kwargs):
+        counters[counter] += 1
+        return method(self, *args, **kwargs)
+    counted.__name__ = method.__name__
+    return counted
+
+
+_METHOD_COUNTERS = {"legal_moves": "legal_moves", "copy": "copies", "is_attacked": "legality_checks",
+                    "make_move": "make_move"}
+
+
+def _patch() -> None:
+    for cls in (Position, BitboardPosition):
+        for name, counter in _METHOD_COUNTERS.items():
+            if name in cls.__dict__ and (cls, name) not in _originals:
+                method = _originals[cls, name] = cls.__dict__[name]
+                setattr(cls, name, _counted_legal_moves(method) if name == "legal_moves" else _counted(method, counter))
+
+
+def _unpatch() -> None:
+    for (cls, name), method in _originals.items():
+        setattr(cls, name, method)
+    _originals.clear()
+
+
+class Profiler(object):
+    """Phase times of the frames since the last reset() and the counters while enabled"""
+
+    def __init__(self):
+        self.phases = {}  # name: [frames, total seconds, max seconds]
+        self.frames = 0
+        self.recent = []  # (frame seconds, {phase: seconds}) of the last OVERLAY_FRAMES frames
+        self.enabled = False
+        self._frame_start = None
+        self._mark = None
+        self._current = {}
+        self._font = None
+
+    def enable(self) -> None:
+        _patch()
+        self.enabled = True
+
+    def disable(self) -> None:
+        _unpatch()
+        self.enabled = False
+
+    def reset(self) -> None:
+        self.phases.clear()
+        self.frames = 0
+        self.recent = []
+        self._frame_start = None
+        for name in COUNTERS:
+            counters[name] = 0
+
+    def frame(self) -> None:
+        """End the frame going on, if any, and start the next one"""
+        now = time.perf_counter()
+        if self._frame_start is not None:
+            self.frames += 1
+            self.recent.append((now - self._frame_start, self._current))
+            del self.recent[:-OVERLAY_FRAMES]
+        self._frame_start = self._mark = now
+        self._current = {}
+
+    def mark(self, phase: str) -> None:
+        """Count the time since the frame start or the last mark to the phase"""
+        now = time.perf_counter()
+        seconds = now - self._mark
+        self._mark = now
+        self._current[phase] = self._current.get(phase, 0) + seconds
+        stats = self.phases.get(phase)
+        if stats is None:
+            self.phases[phase] = [1, seconds, seconds]
+        else:
+            stats[0] += 1
+            stats[1] += seconds
+            if seconds > stats[2]:
+                stats[2] = seconds
+
+    def report(self) -> dict:
+        """:returns frames, per phase calls / total / mean / max milliseconds and the counters"""
+        return {
+            "frames": self.frames,
+            "phases": {name: {"calls": calls, "total_ms": round(total * 1000, 3),
+                              "mean_ms": round(total * 1000 / calls, 4), "max_ms": round(most * 1000, 3)}
+                       for name, (calls, total, most) in self.phases.items()},
+            "counters": dict(counters),
+        }
+
+    def save(self, path: str) -> None:
+        """Write the report as JSON, or as a pstats file unless the path ends in .json"""
+        if path.endswith(".json"):
+            with open(path, "w", encoding="utf-8") as out:
+                json.dump(self.report(), out, indent=2)
+            return
+        frame = ("gameProcess.py", 0, "frame")
+        total = sum(stats[1] for stats in self.phases.values())
+        stats = {frame: (self.frames, self.frames, 0.0, total, {})}
+        for name, (calls, seconds, most) in self.phases.items():
+            stats["gameProcess.py", 0, name] = (calls, calls, seconds, seconds,
+                                                {frame: (calls, calls, seconds, seconds)})
+        for method, name in _METHOD_COUNTERS.items():
+            stats["rules.py", 0, method] = (counters[name], counters[name], 0.0, 0.0, {})
+        with open(path, "wb") as out:
+            marshal.dump(stats, out)
+
+    def overlay_lines(self) -> list:
+        """:returns text lines of the overlay: mean frame and phase milliseconds, counters"""
+        frames = len(self.recent)
+        lines = [f"frames {self.frames}"]
+        if frames:
+            lines.append(f"frame {1000 * sum(seconds for seconds, phases in self.recent) / frames:.3f} ms")
+            totals = {}
+            for seconds, phases in self.recent:
+                for name, spent in phases.items():
+                    totals[name] = totals.get(name, 0) + spent
+            lines += [f"  {name} {1000 * spent / frames:.3f} ms" for name, spent in totals.items()]
+        lines += [f"{name} {counters[name]}" for name in COUNTERS]
+        return lines
+
+    def draw_overlay(self, surface, rect, background: tuple = (50, 90, 50)):
+        """Draw the overlay lines into the pygame rect. :returns the rect"""
+        import pygame  # headless users of the counters do without
+
+        if self._font is None:
+            self._font = pygame.font.Font("freesansbold.ttf", 13)
+        surface.fill(background, rect)
+        for i, line in enumerate(self.overlay_lines()):
+            surface.blit(self._font.render(line, True, (255, 255, 0)), (rect[0] + 4, rect[1] + 4 + 16 * i))
+        return rect
@@ -1,12 +1,32 @@
 from gameProcess import GameProcess
 from models import *
+import argparse
 import pygame
 
 if __name__ == '__main__':
-    game = GameProcess()
+    parser = argparse.ArgumentParser(description="Chess on pygame")
+    parser.add_argument("--engine", choices=["w", "b"], help="let the computer play this color")
+    parser.add_argument("--engine-time", type=float, default=1.0, help="seconds per computer move")
+    parser.add_argument("--fen", help="start from this position instead of the usual one")
+    parser.add_argument("--book", help="opening book built with book.py")
+    parser.add_argument("--tablebases", help="directory of tables built with tablebase.py")
+    parser.add_argument("--ponder", action="store_true", help="let the computer think on your time too")
+    parser.add_argument("--fps", type=int, help="frame rate cap")
+    parser.add_argument("--poll", action="store_true", help="poll for events instead of sleeping until one comes")
+    parser.add_argument("--profile", help="write frame phase times and counters here on exit, .json or pstats")
+    parser.add_argument("--overlay", action="store_true", help="show the profiler overlay (F3 toggles it)")
+    parser.add_argument("--load", help="start from the end of a game of a gamefile.py file")
+    parser.add_argument("--game", type=int, default=-1, help="game in the --load file counted from 0, the last by default")
+    parser.add_argument("--save", help="Ctrl+S appends the game to this gamefile.py file")
+    args = parser.parse_args()
+
+    game = GameProcess(engine_color=args.engine, engine_time=args.engine_time, fen=args.fen, book_path=args.book,
+                       tablebase_dir=args.tablebases, frame_rate=args.fps, event_driven=not args.poll,
+                       ponder=args.ponder, profile_path=args.profile, overlay=args.overlay,
+                       load_path=args.load, load_index=args.game, save_path=args.save)
     game.start()
 
 
 # -убийство на проходе
 # -превращение пешки в фигуру
-# -рокировка
\ No newline at end of file
+# -рокировка
@@ -1,6 +1,5 @@
 import pygame
-from abc import ABC, abstractmethod
-from PIL import Image
+from sprites import sprite
 
 
 class RectField(object):
@@ -23,35 +22,16 @@ class RectField(object):
         return self._width
 
 
-class Piece(ABC):
+class Piece(object):
+    __slots__ = ("_symbol", "_moves_count", "_x_tile", "_y_tile", "_color", "_figure_pic")
+
     def __init__(self, x_tile: int, y_tile: int, color: str, symbol: str):
         self._symbol = symbol
         self._moves_count = 0
         self._x_tile = x_tile
         self._y_tile = y_tile
         self._color = color
-        self._figure_pic = pygame.image.load(f"img/{self.color}{self._symbol}.png")
-        self._DIRECTIONS = {
-            "N": (0, -1),
-            "NE": (1, -1),
-            "E": (1, 0),
-            "SE": (1, 1),
-            "S": (0, 1),
-            "SW": (-1, 1),
-            "W": (-1, 0),
-            "NW": (-1, -1)
-        }
-        self.directions_change()
-
-    def directions_change(self):
-
-        if self.color == "b":
-            new_directions = self._DIRECTIONS
-            for k in self._DIRECTIONS:
-                if k[0] == "N" or k[0] == "S":
-                    val = self._DIRECTIONS[k]
-                    new_val = (val[0], -1 * val[1])
-                    new_directions[k] = new_val
+        self._figure_pic = sprite(f"{color}{symbol}")  # shared with every piece of the kind
 
     def set_new_tile(self, new_tile: tuple):
         self._x_tile, self._y_tile = new_tile
@@ -85,251 +65,63 @@ class Piece(ABC):
     def tiles(self):
         return self._x_tile, self._y_tile
 
-    @abstractmethod
-    def get_possible_moves(self, field):
-        pass
 
+class King(Piece):
+    __slots__ = ()
 
-class King(Piece):  # ############# add castle
     def __init__(self, x_tile: int, y_tile: int, color: str):
         super().__init__(x_tile, y_tile, color, symbol="K")
 
-    def get_possible_moves(self, field: list, last_move: tuple = None):
-        possible_moves = []
-        current_pos = self._x_tile, self._y_tile
-        for direc in self._DIRECTIONS.values():
-            option = optionx, optiony = tuple(map(sum, list(zip(direc, current_pos))))
-            try:
-                if 0 <= optionx < len(field[0]) and 0 <= optiony < len(field):
-                    if field[optiony][optionx] == 0 or field[optiony][optionx].color != self.color:
-                        possible_moves.append(option)
-            except IndexError:
-                pass
-
-        # castle
-        if self.moves_count == 0:
-            # 0-0-0 castle
-            if field[self._y_tile][0] != 0 and field[self._y_tile][0].moves_count == 0:
-                empty = True
-                for i in range(1, self._x_tile):
-                    if field[self._y_tile][i] != 0:
-                        empty = False
-                        break
-                if empty:
-                    option = tuple(map(sum, list(zip(self._DIRECTIONS["W"], current_pos))))
-
-                    next_option = tuple(map(sum, list(zip(self._DIRECTIONS["W"], option))))
-                    # print(current_pos, self._DIRECTIONS["W"], option, next_option)
-
-                    possible_moves.append(next_option)
-
-            # 0-0 castle
-            if field[self._y_tile][7] != 0 and field[self._y_tile][7].moves_count == 0:
-                empty = True
-                for i in range(self._x_tile + 1, 7):
-                    if field[self._y_tile][i] != 0:
-                        empty = False
-                        break
-                if empty:
-                    option = tuple(map(sum, list(zip(self._DIRECTIONS["E"], current_pos))))
-
-                    next_option = tuple(map(sum, list(zip(self._DIRECTIONS["E"], option))))
-                    possible_moves.append(next_option)
-
-        return possible_moves
-
-
-class Pawn(Piece):  # ############# add weird capture and transformation
+
+class Pawn(Piece):
+    __slots__ = ()
+
     def __init__(self, x_tile: int, y_tile: int, color: str):
         super().__init__(x_tile, y_tile, color, symbol="P")
 
-    def get_possible_moves(self, field: list, last_move: tuple = None):
-        possible_moves = []
-        current_pos = self._x_tile, self._y_tile
-
-        try:
-            option = optionx, optiony = tuple(map(sum, list(zip(self._DIRECTIONS["N"], current_pos))))
-            if 0 <= optionx < len(field[0]) and 0 <= optiony < len(field):
-                if field[optiony][optionx] == 0:
-                    possible_moves.append(option)
-
-                    # first pawn move on 2 spaces
-                    option_dbl = optionx, optiony = tuple(map(sum, list(zip(self._DIRECTIONS["N"], option))))
-                    if 0 <= optionx < len(field[0]) and 0 <= optiony < len(field):
-                        if field[optiony][optionx] == 0 and field[self._y_tile][self._x_tile].moves_count == 0:
-                            possible_moves.append(option_dbl)
-        except IndexError:
-            pass
-
-        try:
-            option = optionx, optiony = tuple(map(sum, list(zip(self._DIRECTIONS["NW"], current_pos))))
-            near_option = near_optionx, near_optiony = tuple(map(sum, list(zip(self._DIRECTIONS["W"], current_pos))))
-            if 0 <= optionx < len(field[0]) and 0 <= optiony < len(field):
-                if field[optiony][optionx] != 0 and field[optiony][optionx].color != self.color:
-                    possible_moves.append(option)
-
-            if 0 <= near_optionx < len(field[0]) and 0 <= near_optiony < len(field):
-                if field[near_optiony][near_optionx] != 0 and \
-                        field[near_optiony][near_optionx].color != self.color and \
-                        field[near_optiony][near_optionx].moves_count == 1 and \
-                        near_optiony in [3, len(field) - 3] and \
-                        field[near_optiony][near_optionx].symbol == "P" and \
-                        near_option == last_move:
-                    possible_moves.append(option)
-        except IndexError:
-            pass
-
-        try:
-            option = optionx, optiony = tuple(map(sum, list(zip(self._DIRECTIONS["NE"], current_pos))))
-            near_option = near_optionx, near_optiony = tuple(map(sum, list(zip(self._DIRECTIONS["E"], current_pos))))
-
-            if 0 <= optionx < len(field[0]) and 0 <= optiony < len(field):
-                if field[optiony][optionx] != 0 and field[optiony][optionx].color != self.color:
-                    possible_moves.append(option)
-            if 0 <= near_optionx < len(field[0]) and 0 <= near_optiony < len(field):
-                if field[near_optiony][near_optionx] != 0 and \
-                        field[near_optiony][near_optionx].color != self.color and \
-                        field[near_optiony][near_optionx].moves_count == 1 and \
-                        near_optiony in [3, len(field) - 3] and \
-                        field[near_optiony][near_optionx].symbol == "P" and \
-                        near_option == last_move:
-                    possible_moves.append(option)
-        except IndexError:
-            pass
-
-        return possible_moves
-
 
 class Rook(Piece):
+    __slots__ = ()
+
     def __init__(self, x_tile: int, y_tile: int, color: str):
         super().__init__(x_tile, y_tile, color, symbol="R")
 
-    def get_possible_moves(self, field: list, last_move: tuple = None):
-        possible_moves = []
-
-        for direc in self._DIRECTIONS:
-            if len(direc) == 1:
-                current_pos = None
-                while True:
-                    if not current_pos:
-                        current_pos = self._x_tile, self._y_tile
-
-                    option = optionx, optiony = tuple(map(sum, list(zip(self._DIRECTIONS[direc], current_pos))))
-
-                    try:
-                        if 0 <= optionx < len(field[0]) and 0 <= optiony < len(field):
-                            if field[optiony][optionx] == 0:
-                                possible_moves.append(option)
-                                current_pos = option
-                                continue
-                            elif field[optiony][optionx].color != self.color:
-                                possible_moves.append(option)
-                                break
-                            else:
-                                break
-                        else:
-                            break
-                    except IndexError:
-                        break
-
-        return possible_moves
-
 
 class Bishop(Piece):
+    __slots__ = ()
+
     def __init__(self, x_tile: int, y_tile: int, color: str):
         super().__init__(x_tile, y_tile, color, symbol="B")
 
-    def get_possible_moves(self, field: list, last_move: tuple = None):
-        possible_moves = []
-
-        for direc in self._DIRECTIONS:
-            if len(direc) == 2:
-                current_pos = None
-                while True:
-                    if not current_pos:
-                        current_pos = self._x_tile, self._y_tile
-
-                    option = optionx, optiony = tuple(map(sum, list(zip(self._DIRECTIONS[direc], current_pos))))
-
-                    try:
-                        if 0 <= optionx < len(field[0]) and 0 <= optiony < len(field):
-                            if field[optiony][optionx] == 0:
-                                possible_moves.append(option)
-                                current_pos = option
-                                continue
-                            elif field[optiony][optionx].color != self.color:
-                                possible_moves.append(option)
-                                break
-                            else:
-                                break
-                        else:
-                            break
-                    except IndexError:
-                        break
-
-        return possible_moves
-
 
 class Queen(Piece):
+    __slots__ = ()
+
     def __init__(self, x_tile: int, y_tile: int, color: str):
         super().__init__(x_tile, y_tile, color, symbol="Q")
 
-    def get_possible_moves(self, field: list, last_move: tuple = None):
-        possible_moves = []
 
-        for direc in self._DIRECTIONS:
-            current_pos = None
-            while True:
-                if not current_pos:
-                    current_pos = self._x_tile, self._y_tile
+class Knight(Piece):
+    __slots__ = ()
 
-                option = optionx, optiony = tuple(map(sum, list(zip(self._DIRECTIONS[direc], current_pos))))
+    def __init__(self, x_tile: int, y_tile: int, color: str):
+        super().__init__(x_tile, y_tile, color, symbol="N")
 
-                try:
-                    if 0 <= optionx < len(field[0]) and 0 <= optiony < len(field):
-                        if field[optiony][optionx] == 0:
-                            possible_moves.append(option)
-                            current_pos = option
-                            continue
-                        elif field[optiony][optionx].color != self.color:
-                            possible_moves.append(option)
-                            break
-                        else:
-                            break
-                    else:
-                        break
-                except IndexError:
-                    break
 
-        return possible_moves
+PIECE_CLASSES = {"K": King, "P": Pawn, "R": Rook, "B": Bishop, "Q": Queen, "N": Knight}
 
+_fonts = {}
+_texts = {}
 
-class Knight(Piece):
-    def __init__(self, x_tile: int, y_tile: int, color: str):
-        super().__init__(x_tile, y_tile, color, symbol="N")
-        self._DIRECTIONS = [
-            (-1, -2),
-            (1, -2),
-            (2, -1),
-            (2, 1),
-            (-1, 2),
-            (1, 2),
-            (-2, -1),
-            (-2, 1),
-        ]  # only for knight
-
-    def get_possible_moves(self, field: list, last_move: tuple = None):
-        possible_moves = []
-        current_pos = self._x_tile, self._y_tile
-        for direc in self._DIRECTIONS:
-            option = optionx, optiony = tuple(map(sum, list(zip(direc, current_pos))))
-            try:
-                if 0 <= optionx < len(field[0]) and 0 <= optiony < len(field):
-                    if field[optiony][optionx] == 0 or field[optiony][optionx].color != self.color:
-                        possible_moves.append(option)
-            except IndexError:
-                pass
-        return possible_moves
+
+def render_text(text: str, size: int, color: tuple) -> pygame.Surface:
+    """:returns the text rendered in the default font, cached with the font"""
+    key = text, size, color
+    if key not in _texts:
+        if size not in _fonts:
+            _fonts[size] = pygame.font.Font("freesansbold.ttf", size)
+        _texts[key] = _fonts[size].render(text, True, color)
+    return _texts[key]
 
 
 class ChessBoard(RectField):
@@ -350,11 +142,17 @@ class ChessBoard(RectField):
         self._active_tile_color = (200, 200, 0)
         self._active_tile = None
         self._possible_moves = []
+        self._book_moves = []
         self._surface = surface
         self._field = field
         self._last_move_from = None
         self._last_move_to = None
         self._is_check = False
+        self._verdict = None  # tablebase outcome of the ending on the board
+        self._game_end = None  # "Stalemate!" or "Draw!" once the game is drawn
+        self._board_layer = None
+        self._grid_layer = None
+        self._rendered = None  # (tile states, panel state) of the last render
 
     def get_margin(self):
         return self._x, self._y
@@ -371,87 +169,127 @@ class ChessBoard(RectField):
     def set_last_move(self, last_move: tuple):
         self._last_move_to = last_move
 
-    def draw_board(self):
-        # black \ white tiles
-        for i, row in enumerate(self._field):
-            for j, el in enumerate(row):
-                if (i + j) % 2 == 0:
-                    pygame.draw.rect(self._surface, self._white_tile_color,
-                                     [self._x + (self._cell_size * j), self._y + (self._cell_size * i),
-                                      self._cell_size, self._cell_size])
-                elif (i + j) % 2 == 1:
-                    pygame.draw.rect(self._surface, self._black_tile_color,
-                                     [self._x + (self._cell_size * j), self._y + (self._cell_size * i),
-                                      self._cell_size, self._cell_size])
-
+    def set_last_move_from(self, last_move_from: tuple or None):
+        self._last_move_from = last_move_from
+
+    def set_book_moves(self, book_moves: list):
+        self._book_moves = book_moves
+
+    def set_verdict(self, verdict: str or None):
+        self._verdict = verdict
+
+    def set_game_end(self, game_end: str or None):
+        self._game_end = game_end
+
+    def _layers(self) -> tuple:
+        """:returns (checkerboard with grid, grid alone on a transparent surface), drawn on first use"""
+        if self._board_layer is None:
+            size = self._width, self._height
+            self._board_layer = pygame.Surface(size)
+            self._board_layer.fill(self._color)
+            self._grid_layer = pygame.Surface(size, pygame.SRCALPHA)
+            for i, row in enumerate(self._field):
+                for j, el in enumerate(row):
+                    pygame.draw.rect(self._board_layer,
+                                     self._white_tile_color if (i + j) % 2 == 0 else self._black_tile_color,
+                                     [self._cell_size * j, self._cell_size * i, self._cell_size, self._cell_size])
+            for layer in (self._board_layer, self._grid_layer):
+                for hor in range(len(self._field) + 1):
+                    pygame.draw.line(layer, (0, 0, 0), (0, hor * self._cell_size),
+                                     (len(self._field[0]) * self._cell_size, hor * self._cell_size), 1)
+                for ver in range(len(self._field[0]) + 1):
+                    pygame.draw.line(layer, (0, 0, 0), (ver * self._cell_size, 0),
+                                     (ver * self._cell_size, len(self._field) * self._cell_size), 1)
+        return self._board_layer, self._grid_layer
+
+    def _highlights(self) -> dict:
+        """:returns {tile: color} of the highlighted tiles, later highlights over earlier ones"""
+        highlights = {}
         # checked King
-        if self._is_check:
-            if self._is_check == "Mate":
-                text = "CheckMate!"
-            else:
-                text = "Check!"
-                pygame.draw.rect(self._surface, (230, 20, 10),
-                                 [self._x + (self._cell_size * self._is_check[0]), self._y +
-                                  (self._cell_size * self._is_check[1]),
-                                  self._cell_size, self._cell_size])
-
-            font = pygame.font.Font("freesansbold.ttf", 32)
-            check = font.render(f"{text}", True, (255, 0, 0))
-            self._surface.blit(check, (self._x + self._cell_size * 9, self._y + self._cell_size * 0))
-
+        if self._is_check and self._is_check != "Mate":
+            highlights[tuple(self._is_check)] = (230, 20, 10)
         # Picked piece
         if self._active_tile:
-            pygame.draw.rect(self._surface, self._active_tile_color,
-                             [
-                                 self._x + (self._cell_size * self._active_tile[0]),
-                                 self._y + (self._cell_size * self._active_tile[1]),
-                                 self._cell_size,
-                                 self._cell_size
-                             ]
-                             )
-
+            highlights[self._active_tile] = self._active_tile_color
         # last move
         if self._last_move_from:
-            pygame.draw.rect(self._surface, (0, 170, 10),
-                             [
-                                 self._x + (self._cell_size * self._last_move_to[0]),
-                                 self._y + (self._cell_size * self._last_move_to[1]),
-                                 self._cell_size,
-                                 self._cell_size
-                             ]
-                             )
-
-            pygame.draw.rect(self._surface, (0, 170, 10),
-                             [
-                                 self._x + (self._cell_size * self._last_move_from[0]),
-                                 self._y + (self._cell_size * self._last_move_from[1]),
-                                 self._cell_size,
-                                 self._cell_size
-                             ]
-                             )
-
+            highlights[self._last_move_to] = (0, 170, 10)
+            highlights[self._last_move_from] = (0, 170, 10)
         # Options to move
-        if self._possible_moves:
-            for i in self._possible_moves:
-                pygame.draw.rect(self._surface, self._active_tile_color,
-                                 [
-                                     self._x + (self._cell_size * i[0]),
-                                     self._y + (self._cell_size * i[1]),
-                                     self._cell_size,
-                                     self._cell_size
-                                 ]
-                                 )
-
-        # grid
-        for hor in range(len(self._field) + 1):
-            pygame.draw.line(self._surface, (0, 0, 0),
-                             (0 + self._x, hor * self._cell_size + self._y),
-                             (len(self._field[0]) * self._cell_size + self._x, hor * self._cell_size + self._y), 1)
-
-        for ver in range(len(self._field[0]) + 1):
-            pygame.draw.line(self._surface, (0, 0, 0),
-                             (ver * self._cell_size + self._x, 0 + self._y),
-                             (ver * self._cell_size + self._x, len(self._field) * self._cell_size + self._y), 1)
+        for i in self._possible_moves:
+            highlights[i] = self._active_tile_color
+        return highlights
+
+    def _panel(self, promotion_color: str or None) -> tuple:
+        """:returns what the side panel shows: check text, tablebase verdict, promotion color"""
+        check = self._game_end
+        if self._is_check and not check:
+            check = "CheckMate!" if self._is_check == "Mate" else "Check!"
+        return check, self._verdict, promotion_color
+
+    def _draw_panel(self, check: str or None, verdict: str or None, promotion_color: str or None) -> None:
+        if check:
+            self._surface.blit(render_text(check, 32, (255, 0, 0)),
+                               (self._x + self._cell_size * 9, self._y + self._cell_size * 0))
+        if verdict:
+            self._surface.blit(render_text(verdict, 20, (255, 255, 255)),
+                               (self._x + self._cell_size * 9, self._y + self._cell_size * 1))
+        if promotion_color:
+            self.draw_transformation_options(promotion_color, self._surface)
+
+    def render(self, promotion_color: str = None, background: tuple = (50, 90, 50)) -> list:
+        """
+        Draw what changed since the last render: the tiles whose piece or highlight is
+        different and the side panel. The first call draws the whole window.
+        :returns rects to pass to pygame.display.update, empty if nothing changed
+        """
+        board_layer, grid_layer = self._layers()
+        highlights = self._highlights()
+        book_moves = set(self._book_moves)
+        tiles = {}
+        for y, row in enumerate(self._field):
+            for x, el in enumerate(row):
+                tiles[x, y] = str(el) if el != 0 else None, highlights.get((x, y)), (x, y) in book_moves
+        panel = self._panel(promotion_color)
+
+        dirty = []
+        if self._rendered is None:
+            self._surface.fill(background)
+            self._surface.blit(board_layer, (self._x, self._y))
+            changed = list(tiles)
+            dirty.append(self._surface.get_rect())
+        else:
+            rendered_tiles, rendered_panel = self._rendered
+            changed = [key for key, state in tiles.items() if rendered_tiles[key] != state]
+            if rendered_panel != panel:
+                left = self._x + self._cell_size * len(self._field[0]) + 1
+                panel_rect = pygame.Rect(left, 0, self._surface.get_width() - left, self._surface.get_height())
+                self._surface.fill(background, panel_rect)
+                dirty.append(panel_rect)
+
+        for x, y in changed:
+            code, color, book = tiles[x, y]
+            area = pygame.Rect(self._cell_size * x, self._cell_size * y, self._cell_size, self._cell_size)
+            rect = area.move(self._x, self._y)
+            self._surface.blit(board_layer, rect, area)
+            if color:
+                pygame.draw.rect(self._surface, color, rect)
+            if book:
+                pygame.draw.rect(self._surface, (0, 90, 220), rect, 4)
+            self._surface.blit(grid_layer, rect, area)
+            if code:
+                self._field[y][x].draw_piece(self._surface, self._cell_size, self)
+            if self._rendered is not None:
+                dirty.append(rect)
+
+        if self._rendered is None or self._rendered[1] != panel:
+            self._draw_panel(*panel)
+        self._rendered = tiles, panel
+        return dirty
+
+    def invalidate(self) -> None:
+        """Make the next render draw the whole window again"""
+        self._rendered = None
 
     def draw_transformation_options(self, color: str, surface: pygame.Surface) -> None:
         pieces = ["Q", "N", "B", "R"]
@@ -465,49 +303,34 @@ class ChessBoard(RectField):
                               self._y + (self._cell_size * (((len(self._field) - 4) / 2) + j)),
                               self._cell_size, self._cell_size], 1)
 
-            img = pygame.image.load(f"{color}{pieces[j]}.png")
-            surface.blit(img, (
+            surface.blit(sprite(f"{color}{pieces[j]}"), (
                 self._x + (self._cell_size * 8), self._y + (self._cell_size * (((len(self._field) - 4) / 2) + j))))
 
-    def make_field_prediction(self, destination_tile: tuple, tile_to_try) -> list:
-        x, y = tile_to_try
-        temporary_field = [[0 for __ in range(len(self._field[0]))] for _ in
-                           range(len(self._field))]  # copy of the field for returning to consideration
-        destx, desty = destination_tile
-
-        for i, row in enumerate(self._field):
-            for j, el in enumerate(row):
-                if self._field[i][j] != 0:
-                    temporary_field[i][j] = self._field[i][j]
-
-        temporary_field[desty][destx] = temporary_field[y][x]
-        temporary_field[y][x] = 0
-
-        return temporary_field
-
     def make_move(self, destination_tile: tuple) -> None:
+        """Move the active piece in place, if the tile is one of its possible moves"""
         if destination_tile in self._possible_moves:
             x, y = self._active_tile
             destx, desty = destination_tile
+            piece = self._field[y][x]
+            rook_hop = None
 
-            self._field[y][x].upgrade_moves_count()
-            if self._field[y][x].symbol == "P" and destx != x and self._field[desty][destx] == 0:
+            piece.upgrade_moves_count()
+            if piece.symbol == "P" and destx != x and self._field[desty][destx] == 0:
                 self._field[y][destx] = 0
-            if self._field[y][x].symbol == "K" and abs(destx - x) == 2:
+            if piece.symbol == "K" and abs(destx - x) == 2:
                 if destx - x < 0:  # 0-0-0
-                    self._field[y][x - 1] = self._field[y][0]
-                    self._field[y][0] = 0
-                    self._field[y][x - 1].set_new_tile((x - 1, y))
-
+                    rook_hop = (0, y), (x - 1, y)
                 if destx - x > 0:  # 0-0
-                    self._field[y][x + 1] = self._field[y][7]
-                    self._field[y][7] = 0
-                    self._field[y][x + 1].set_new_tile((x + 1, y))
+                    rook_hop = (7, y), (x + 1, y)
+                (rookx, rooky), (hopx, hopy) = rook_hop
+                self._field[hopy][hopx] = self._field[rooky][rookx]
+                self._field[rooky][rookx] = 0
+                self._field[hopy][hopx].set_new_tile((hopx, hopy))
 
-            self._field[desty][destx] = self._field[y][x]
+            self._field[desty][destx] = piece
             self._field[y][x] = 0
 
-            self._field[desty][destx].set_new_tile((destx, desty))
+            piece.set_new_tile((destx, desty))
             self._last_move_from = x, y
             # print(self._last_move_from)
             self._is_check = False
@@ -530,9 +353,3 @@ class ChessBoard(RectField):
         x, y, c, s = piece.get_piece_data()
         self._field[y][x] = piece
         # print(self._field)
-
-    def draw_all_pieces(self):
-        for i in self._field:
-            for j in i:
-                if j != 0:
-                    j.draw_piece(self._surface, self._cell_size, self)
@@ -0,0 +1,221 @@
+"""
+Multi-core search by root move splitting over worker processes.
+
+Every depth searches the first root move, the best of the depth before, with a
+full window, then the other moves with a null window at its score; the moves
+that fail high are searched again with a window above it. Every root move has
+a Searcher of its own, with its table, killers and history, kept for all the
+depths of a search by the worker the move belongs to (move i of
+``Position.legal_moves`` to worker i mod workers). What a move's search sees
+depends only on that move and the score of the first move, never on the other
+moves of its worker or on timing, so fixed depth results are the same for any
+number of workers. Ties go to the earlier move.
+
+    python parallel_search.py startpos --depth 4 --workers 1 2 4 8
+
+prints the single-process ``Searcher`` time next to the pool for every worker
+count, with speedup and whether the pool found the same move and score.
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+
+from rules import Position, START_FEN, BACKENDS, move_name
+from search import Searcher, SearchTimeout, MATE_BOUND, MAX_DEPTH, INFINITY, format_score
+
+# (search number, root position, {root move: Searcher}) of a worker process, kept between the jobs of a search
+_worker_search = None
+
+
+def _search_root_move(number: int, fen: str, backend: str, history: tuple, table_size_mb: float,
+                      move: tuple, depth: int, alpha: int, beta: int, deadline: float or None) -> tuple:
+    """
+    Worker side: score one root move within the window, with the Searcher of the move.
+    :returns (move, score or None if out of time, nodes)
+    """
+    global _worker_search
+    if _worker_search is None or _worker_search[0] != number:
+        _worker_search = number, Position.from_fen(fen).to_backend(backend), {}
+    number, position, searchers = _worker_search
+    searcher = searchers.get(move)
+    if searcher is None:
+        searcher = searchers[move] = Searcher(table_size_mb)
+        searcher.new_search(history + (position.hash,))
+
+    time_limit = None
+    if deadline is not None:
+        time_limit = deadline - time.time()
+        if time_limit <= 0:
+            return move, None, 0
+    nodes = searcher.nodes
+    undo = position.make_move(move)
+    try:
+        score = -searcher.score(position, depth - 1, -beta, -alpha, ply=1, time_limit=time_limit)
+    except SearchTimeout:
+        return move, None, searcher.nodes - nodes
+    finally:
+        position.unmake_move(move, undo)
+    return move, score, searcher.nodes - nodes
+
+
+class ParallelSearcher(object):
+    """
+    Keeps its worker processes between searches. Use as a context manager
+    or call close() when done.
+    """
+
+    def __init__(self, workers: int = None, backend: str = "mailbox", table_size_mb: float = 1):
+        """:param table_size_mb: table of every root move"""
+        self.workers = workers or os.cpu_count() or 1
+        self.backend = backend
+        self.table_size_mb = table_size_mb
+        # one single process pool per worker, so a root move goes to the worker that holds its Searcher
+        self._pools = [ProcessPoolExecutor(max_workers=1) for _ in range(self.workers)]
+        self._searches = 0
+        self._owners = {}  # root move: worker, for the search going on
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self) -> None:
+        for pool in self._pools:
+            pool.shutdown(wait=True, cancel_futures=True)
+
+    def search(self, position: Position, max_depth: int = None, time_limit: float = None,
+               history: list = (), info=None) -> dict:
+        """
+        Same result dict as Searcher.search, plus "scores" with the root move scores
+        of the last finished depth: exact for the best move and the moves searched
+        again, an upper bound for the others. With only max_depth it is deterministic,
+        whatever the number of workers.
+        """
+        if max_depth is None and time_limit is None:
+            raise ValueError("search needs a max_depth or time_limit")
+        start = time.perf_counter()
+        deadline = time.time() + time_limit if time_limit is not None else None
+        moves = position.legal_moves()
+        result = {"move": moves[0] if moves else None, "score": 0, "depth": 0, "pv": [], "scores": {},
+                  "nodes": 0, "seconds": 0.0, "nps": 0, "workers": self.workers}
+        if len(moves) <= 1:
+            return result
+
+        self._searches += 1
+        self._owners = {move: i % self.workers for i, move in enumerate(moves)}
+        job = (self._searches, position.to_fen(), self.backend, tuple(history), self.table_size_mb)
+        nodes = 0
+        depth = 0
+        max_depth = MAX_DEPTH if max_depth is None else min(max_depth, MAX_DEPTH)
+        while depth < max_depth:
+            depth += 1
+            scores, depth_nodes = self._search_depth(job, moves, depth, deadline)
+            nodes += depth_nodes
+            if scores is None:
+                break
+
+            index = {move: i for i, move in enumerate(moves)}
+            best = max(moves, key=lambda move: (scores[move], -index[move]))
+            seconds = time.perf_counter() - start
+            result = {
+                "move": best,
+                "score": scores[best],
+                "depth": depth,
+                "pv": [best],
+                "scores": scores,
+                "nodes": nodes,
+                "seconds": round(seconds, 6),
+                "nps": int(nodes / seconds) if seconds else 0,
+                "workers": self.workers,
+            }
+            if info:
+                info(result)
+            if abs(scores[best]) >= MATE_BOUND:
+                break
+            # the best move first at the next depth, then the others by their scores
+            moves = sorted(moves, key=lambda move: (move != best, -scores[move], index[move]))
+        result["nodes"] = nodes
+        return result
+
+    def _submit(self, job: tuple, move: tuple, depth: int, alpha: int, beta: int, deadline):
+        return self._pools[self._owners[move]].submit(_search_root_move, *job, move, depth, alpha, beta, deadline)
+
+    def _search_depth(self, job: tuple, moves: list, depth: int, deadline: float or None) -> tuple:
+        """:returns ({move: score}, nodes) of one depth, the scores None if the time ran out"""
+        scores = {}
+        nodes = 0
+        pending = {self._submit(job, moves[0], depth, -INFINITY, INFINITY, deadline)}
+        researched = set()
+        alpha = None
+        timed_out = False
+        while pending and not timed_out:
+            timeout = max(0.0, deadline - time.time()) if deadline is not None else None
+            done, pending = wait(pending, timeout=timeout, return_when=FIRST_COMPLETED)
+            timed_out = not done
+            for future in done:
+                move, score, move_nodes = future.result()
+                nodes += move_nodes
+                if score is None:
+                    timed_out = True
+                elif alpha is None:
+                    alpha = scores[move] = score
+                    pending |= {self._submit(job, other, depth, alpha, alpha + 1, deadline) for other in moves[1:]}
+                elif score > alpha and move not in researched:
+                    # beats the first move: find out by how much
+                    researched.add(move)
+                    pending.add(self._submit(job, move, depth, alpha, INFINITY, deadline))
+                else:
+                    scores[move] = score
+        if timed_out:
+            for future in pending:
+                future.cancel()
+            return None, nodes
+        return scores, nodes
+
+
+def benchmark(position: Position, depth: int, worker_counts: list, backend: str = "mailbox"):
+    """Yield a record for the single-process search and then for the pool at every worker count"""
+    single = Searcher().search(position.to_backend(backend), max_depth=depth)
+    yield {"mode": "single", "workers": 1, "depth": depth, "move": move_name(single["move"]),
+           "score": single["score"], "nodes": single["nodes"], "seconds": single["seconds"], "nps": single["nps"]}
+
+    for workers in worker_counts:
+        with ParallelSearcher(workers, backend) as searcher:
+            searcher.search(position, max_depth=1)  # start the worker processes outside the timing
+            result = searcher.search(position, max_depth=depth)
+        yield {"mode": "parallel", "workers": workers, "depth": depth, "move": move_name(result["move"]),
+               "score": result["score"],
+               "nodes": result["nodes"], "seconds": result["seconds"], "nps": result["nps"],
+               "speedup": round(single["seconds"] / result["seconds"], 3) if result["seconds"] else None,
+               "agrees": (result["move"], result["score"]) == (single["move"], single["score"])}
+
+
+def main(argv: list = None) -> int:
+    parser = argparse.ArgumentParser(description="Parallel search speedup over the single-process search")
+    parser.add_argument("fen", nargs="?", default="startpos", help='FEN or "startpos"')
+    parser.add_argument("--depth", type=int, default=4)
+    parser.add_argument("--workers", type=int, nargs="+", default=[os.cpu_count() or 1])
+    parser.add_argument("--backend", choices=BACKENDS, default="mailbox")
+    parser.add_argument("--json", action="store_true", help="one JSON record per line")
+    args = parser.parse_args(argv)
+
+    position = Position.from_fen(START_FEN if args.fen == "startpos" else args.fen)
+    for record in benchmark(position, args.depth, args.workers, args.backend):
+        if args.json:
+            print(json.dumps(record), flush=True)
+        else:
+            line = f"{record['mode']:<8} workers {record['workers']:>2}  {record['move']} " \
+                   f"{format_score(record['score'])}  {record['seconds']:.2f}s  {record['nps']} nps"
+            if record["mode"] == "parallel":
+                line += f"  speedup {record['speedup']}x" + ("" if record["agrees"] else "  RESULT DIFFERS")
+            print(line, flush=True)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
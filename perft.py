@@ -0,0 +1,159 @@
+"""
+Perft: count the leaf nodes of the legal move tree to a fixed depth.
+
+The counts of the reference positions below are known, so a mismatch points at
+a rule bug, and nodes per second measure the move generator.
+
+    python perft.py startpos 5
+    python perft.py "r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w KQkq -" 3 --divide
+    python perft.py --suite --max-nodes 1000000 --backend bitboard --json
+"""
+
+import argparse
+import json
+import sys
+import time
+
+from rules import Position, START_FEN, BACKENDS, move_name
+
+# (name, FEN, {depth: nodes})
+REFERENCE_POSITIONS = [
+    ("startpos", START_FEN,
+     {1: 20, 2: 400, 3: 8902, 4: 197281, 5: 4865609}),
+    ("kiwipete", "r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w KQkq - 0 1",
+     {1: 48, 2: 2039, 3: 97862, 4: 4085603}),
+    ("position 3", "8/2p5/3p4/KP5r/1R3p1k/8/4P1P1/8 w - - 0 1",
+     {1: 14, 2: 191, 3: 2812, 4: 43238, 5: 674624}),
+    ("position 4", "r3k2r/Pppp1ppp/1b3nbN/nP6/BBP1P3/q4N2/Pp1P2PP/R2Q1RK1 w kq - 0 1",
+     {1: 6, 2: 264, 3: 9467, 4: 422333}),
+    ("position 4 mirrored", "r2q1rk1/pP1p2pp/Q4n2/bbp1p3/Np6/1B3NBn/pPPP1PPP/R3K2R b KQ - 0 1",
+     {1: 6, 2: 264, 3: 9467, 4: 422333}),
+    ("position 5", "rnbq1k1r/pp1Pbppp/2p5/8/2B5/8/PPP1NnPP/RNBQK2R w KQ - 1 8",
+     {1: 44, 2: 1486, 3: 62379, 4: 2103487}),
+    ("position 6", "r4rk1/1pp1qppp/p1np1n2/2b1p1B1/2B1P1b1/P1NP1N2/1PP1QPPP/R4RK1 w - - 0 10",
+     {1: 46, 2: 2079, 3: 89890, 4: 3894594}),
+    # edge cases
+    ("illegal en passant, pinned on the rank", "3k4/3p4/8/K1P4r/8/8/8/8 b - - 0 1",
+     {6: 1134888}),
+    ("illegal en passant, pinned on the diagonal", "8/8/4k3/8/2p5/8/B2P2K1/8 w - - 0 1",
+     {6: 1015133}),
+    ("en passant capture checks", "8/8/1k6/2b5/2pP4/8/5K2/8 b - d3 0 1",
+     {6: 1440467}),
+    ("short castling gives check", "5k2/8/8/8/8/8/8/4K2R w K - 0 1",
+     {6: 661072}),
+    ("long castling gives check", "3k4/8/8/8/8/8/8/R3K3 w Q - 0 1",
+     {6: 803711}),
+    ("castling rights", "r3k2r/1b4bq/8/8/8/8/7B/R3K2R w KQkq - 0 1",
+     {4: 1274206}),
+    ("castling prevented", "r3k2r/8/3Q4/8/8/5q2/8/R3K2R b KQkq - 0 1",
+     {4: 1720476}),
+    ("promote out of check", "2K2r2/4P3/8/8/8/8/8/3k4 w - - 0 1",
+     {6: 3821001}),
+    ("discovered check", "8/8/1P2K3/8/2n5/1q6/8/5k2 b - - 0 1",
+     {5: 1004658}),
+    ("promote to give check", "4k3/1P6/8/8/8/8/K7/8 w - - 0 1",
+     {6: 217342}),
+    ("underpromote to check", "8/P1k5/K7/8/8/8/8/8 w - - 0 1",
+     {6: 92683}),
+    ("self stalemate", "K1k5/8/P7/8/8/8/8/8 w - - 0 1",
+     {6: 2217}),
+    ("stalemate and checkmate", "8/k1P5/8/1K6/8/8/8/8 w - - 0 1",
+     {7: 567584}),
+    ("double check", "8/8/2k5/5q2/5n2/8/5K2/8 b - - 0 1",
+     {4: 23527}),
+]
+
+
+def perft(position: Position, depth: int) -> int:
+    """:returns number of leaf nodes depth plies below the position"""
+    moves = position.legal_moves()
+    if depth <= 1:
+        return len(moves) if depth == 1 else 1
+    nodes = 0
+    for move in moves:
+        undo = position.make_move(move)
+        nodes += perft(position, depth - 1)
+        position.unmake_move(move, undo)
+    return nodes
+
+
+def divide(position: Position, depth: int) -> dict:
+    """:returns {move name: leaf nodes below it}, the usual way to find which move a count is off by"""
+    result = {}
+    for move in position.legal_moves():
+        undo = position.make_move(move)
+        result[move_name(move)] = perft(position, depth - 1)
+        position.unmake_move(move, undo)
+    return result
+
+
+def timed_perft(position: Position, depth: int, with_divide: bool = False) -> dict:
+    """:returns a machine readable record of one perft run"""
+    start = time.perf_counter()
+    if with_divide:
+        moves = divide(position, depth)
+        nodes = sum(moves.values())
+    else:
+        moves = None
+        nodes = perft(position, depth)
+    seconds = time.perf_counter() - start
+    record = {
+        "fen": position.to_fen(),
+        "depth": depth,
+        "nodes": nodes,
+        "seconds": round(seconds, 6),
+        "nps": int(nodes / seconds) if seconds else 0,
+    }
+    if moves is not None:
+        record["divide"] = moves
+    return record
+
+
+def run_suite(backend: str = "mailbox", max_depth: int = None, max_nodes: int = None):
+    """Yield a record for every reference count within the limits, with "ok" telling if it matched"""
+    for name, fen, counts in REFERENCE_POSITIONS:
+        for depth, expected in sorted(counts.items()):
+            if (max_depth is not None and depth > max_depth) or (max_nodes is not None and expected > max_nodes):
+                continue
+            record = timed_perft(Position.from_fen(fen).to_backend(backend), depth)
+            record.update(name=name, backend=backend, expected=expected, ok=record["nodes"] == expected)
+            yield record
+
+
+def main(argv: list = None) -> int:
+    parser = argparse.ArgumentParser(description="Move generator node counts and speed")
+    parser.add_argument("fen", nargs="?", default="startpos", help='FEN or "startpos"')
+    parser.add_argument("depth", nargs="?", type=int, default=4)
+    parser.add_argument("--divide", action="store_true", help="print the node count under every root move")
+    parser.add_argument("--suite", action="store_true", help="check all reference positions")
+    parser.add_argument("--max-depth", type=int, help="skip suite counts deeper than this")
+    parser.add_argument("--max-nodes", type=int, help="skip suite counts larger than this")
+    parser.add_argument("--backend", choices=BACKENDS, default="mailbox")
+    parser.add_argument("--json", action="store_true", help="one JSON record per line")
+    args = parser.parse_args(argv)
+
+    if args.suite:
+        failed = 0
+        for record in run_suite(args.backend, args.max_depth, args.max_nodes):
+            failed += not record["ok"]
+            if args.json:
+                print(json.dumps(record), flush=True)
+            else:
+                print(f"{'ok  ' if record['ok'] else 'FAIL'} {record['name']:<45} depth {record['depth']} "
+                      f"{record['nodes']:>10} (expected {record['expected']}) {record['nps']:>8} nps", flush=True)
+        return 1 if failed else 0
+
+    fen = START_FEN if args.fen == "startpos" else args.fen
+    record = timed_perft(Position.from_fen(fen).to_backend(args.backend), args.depth, args.divide)
+    record["backend"] = args.backend
+    if args.json:
+        print(json.dumps(record))
+    else:
+        for move, nodes in (record.get("divide") or {}).items():
+            print(f"{move}: {nodes}")
+        print(f"nodes {record['nodes']}  time {record['seconds']:.3f}s  nps {record['nps']}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
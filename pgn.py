@@ -0,0 +1,349 @@
+"""
+Streaming PGN reader and replayer.
+
+    for game in read_games(open_pgn("archive.pgn.gz")):
+        for position, move in replay(game):
+            ...
+
+``read_games`` yields one game at a time from any iterable of lines, so only the
+game being read is held in memory whatever the size of the archive. ``replay``
+resolves every SAN move against ``Position.legal_moves`` and raises ``PGNError``
+on an illegal, ambiguous or unreadable move; ``replay_games`` turns that into an
+error record and carries on with the next game.
+
+    python pgn.py archive.pgn.gz --workers 4 --errors-only
+
+replays a whole archive, sharding games over a process pool with ``--workers``,
+and prints a summary with games and plies per second to stderr.
+"""
+
+import argparse
+import gzip
+import json
+import os
+import re
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from rules import Position, START_FEN, BACKENDS, position_class, move_name, square_name
+
+RESULTS = ("1-0", "0-1", "1/2-1/2", "*")
+MAX_GAME_CHARS = 1 << 20  # movetext longer than this is not a game but a broken file
+
+_HEADER = re.compile(r'^\[\s*(\w+)\s+"((?:[^"\\]|\\.)*)"\s*\]\s*$')
+_SAN = re.compile(r"^([NBRQK])?([a-h])?([1-8])?x?([a-h][1-8])(?:=?([NBRQ]))?$")
+# comments, variations and NAGs are skipped; everything else is a move, a number or a result
+_TOKENS = re.compile(r"\{[^}]*\}?|;[^\n]*|\(|\)|\$\d+|[^\s(){};]+")
+_MOVE_NUMBER = re.compile(r"^\d+\.*$|^\.+$")
+
+
+class PGNError(ValueError):
+    """A game that can not be replayed, with the ply it broke at"""
+
+    def __init__(self, message: str, ply: int = None):
+        super().__init__(message)
+        self.ply = ply
+
+
+class PGNGame(object):
+    """Headers and unparsed movetext of one game, cheap to send to a worker process"""
+
+    def __init__(self, index: int, line: int, headers: dict, movetext: str, error: str = None):
+        self.index = index  # 1 based position of the game in the file
+        self.line = line  # first line of the game in the file
+        self.headers = headers
+        self.movetext = movetext
+        self.error = error  # why the movetext could not be read, replay raises it
+
+    def start_position(self, backend: str = "mailbox") -> Position:
+        """:returns the position of the FEN header, the usual start otherwise"""
+        return position_class(backend).from_fen(self.headers.get("FEN", START_FEN))
+
+    def sans(self) -> list:
+        """:returns the SAN moves of the main line"""
+        moves = []
+        depth = 0
+        for token in _TOKENS.findall(self.movetext):
+            if token == "(":
+                depth += 1
+            elif token == ")":
+                depth -= 1
+            elif depth or token[0] in "{;$" or token in RESULTS or _MOVE_NUMBER.match(token):
+                continue
+            else:
+                moves.append(re.sub(r"^\d+\.+", "", token))  # "12.e4" written without a space
+        return moves
+
+
+def open_pgn(path: str):
+    """:returns a text stream of the file, gunzipped if it ends in .gz, stdin for "-" """
+    if path == "-":
+        return sys.stdin
+    if path.endswith(".gz"):
+        return gzip.open(path, "rt", encoding="utf-8", errors="replace")
+    return open(path, encoding="utf-8", errors="replace")
+
+
+def _scan(line: str, in_comment: bool, depth: int) -> tuple:
+    """
+    Follow comments and variations through a movetext line.
+    :returns (end of the result token closing the game or None, in_comment, depth)
+    """
+    start = 0
+    if in_comment:
+        start = line.find("}") + 1
+        if not start:
+            return None, True, depth
+    for token in _TOKENS.finditer(line, start):
+        text = token.group()
+        if text[0] == "{":
+            if not text.endswith("}"):
+                return None, True, depth
+        elif text[0] == ";":
+            break
+        elif text == "(":
+            depth += 1
+        elif text == ")":
+            depth = max(0, depth - 1)
+        elif not depth and text in RESULTS:
+            return token.end(), False, 0
+    return None, False, depth
+
+
+def read_games(lines):
+    """
+    Yield a PGNGame for every game of an iterable of lines. A game ends at its
+    result token or at the headers of the next one, so games without headers
+    come apart too. A game longer than MAX_GAME_CHARS is skipped up to either
+    and yielded with its error set.
+    """
+    headers, movetext, size, start, error = {}, [], 0, None, None
+    in_comment, depth = False, 0
+    index = 0
+    for number, line in enumerate(lines, 1):
+        line = line.strip()
+        if not line or line.startswith("%"):
+            continue
+        header = _HEADER.match(line) if not in_comment or error else None
+        if header:
+            if movetext or error:
+                index += 1
+                yield PGNGame(index, start, headers, "\n".join(movetext), error)
+                headers, movetext, size, start, error = {}, [], 0, None, None
+            in_comment, depth = False, 0
+            headers[header.group(1)] = header.group(2).replace('\\"', '"').replace("\\\\", "\\")
+            start = start or number
+            continue
+        start = start or number
+        while line:
+            end, in_comment, depth = _scan(line, in_comment, depth)
+            text, line = (line, "") if end is None else (line[:end], line[end:].lstrip())
+            if error is None:
+                size += len(text)
+                if size > MAX_GAME_CHARS:
+                    error = f"game at line {start} is longer than {MAX_GAME_CHARS} characters"
+                    movetext = []
+                else:
+                    movetext.append(text)
+            if end is not None:
+                index += 1
+                yield PGNGame(index, start, headers, "\n".join(movetext), error)
+                headers, movetext, size, start, error = {}, [], 0, number if line else None, None
+    if movetext or headers or error:
+        yield PGNGame(index + 1, start, headers, "\n".join(movetext), error)
+
+
+def parse_san(position: Position, san: str, legal_moves: list = None) -> tuple:
+    """
+    :returns the legal move written as san in the position
+    :raises PGNError if no legal move or more than one fits
+    """
+    legal_moves = position.legal_moves() if legal_moves is None else legal_moves
+    text = san.rstrip("+#!?")
+    board = position.board
+
+    if text in ("O-O", "0-0", "O-O-O", "0-0-0"):
+        king = position.king_square(position.turn)
+        to = king + (2 if len(text) == 3 else -2) if king is not None else None
+        if (king, to, None) in legal_moves:
+            return king, to, None
+        raise PGNError(f"illegal castling {san}")
+
+    match = _SAN.match(text)
+    if not match:
+        raise PGNError(f"unreadable move {san!r}")
+    symbol, file, rank, target, promotion = match.groups()
+    symbol = symbol or "P"
+    to = "abcdefgh".index(target[0]) + (8 - int(target[1])) * 8
+    if symbol == "P" and promotion is None and to // 8 in (0, 7):
+        raise PGNError(f"promotion piece missing in {san}")
+
+    found = []
+    for move in legal_moves:
+        frm = move[0]
+        if move[1] == to and move[2] == promotion and board[frm][1] == symbol and \
+                (file is None or square_name(frm)[0] == file) and (rank is None or square_name(frm)[1] == rank):
+            found.append(move)
+    if len(found) != 1:
+        raise PGNError(f"{'ambiguous' if found else 'illegal'} move {san}")
+    return found[0]
+
+
+def move_san(position: Position, move: tuple, legal_moves: list = None) -> str:
+    """:returns the move in SAN, check and mate signs included"""
+    legal_moves = position.legal_moves() if legal_moves is None else legal_moves
+    frm, to, promotion = move
+    board = position.board
+    symbol = board[frm][1]
+    capture = board[to] != 0 or (symbol == "P" and to == position.en_passant)
+
+    if symbol == "K" and abs(to - frm) == 2:
+        san = "O-O" if to > frm else "O-O-O"
+    elif symbol == "P":
+        san = (square_name(frm)[0] + "x" if capture else "") + square_name(to) + (f"={promotion}" if promotion else "")
+    else:
+        rivals = [other[0] for other in legal_moves
+                  if other[1] == to and other[0] != frm and board[other[0]][1] == symbol]
+        prefix = ""
+        if rivals:
+            if all(other % 8 != frm % 8 for other in rivals):
+                prefix = square_name(frm)[0]
+            elif all(other // 8 != frm // 8 for other in rivals):
+                prefix = square_name(frm)[1]
+            else:
+                prefix = square_name(frm)
+        san = symbol + prefix + ("x" if capture else "") + square_name(to)
+
+    undo = position.make_move(move)
+    if position.in_check():
+        san += "+" if position.legal_moves() else "#"
+    position.unmake_move(move, undo)
+    return san
+
+
+def replay(game: PGNGame, backend: str = "mailbox"):
+    """
+    Yield (position, move) before every move of the main line; the position object
+    is the same one played on, so copy it to keep it.
+    :raises PGNError at the first move that does not fit
+    """
+    if game.error:
+        raise PGNError(game.error, 0)
+    try:
+        position = game.start_position(backend)
+    except ValueError as error:
+        raise PGNError(f"bad FEN header: {error}", 0)
+    problems = position.problems()
+    if problems:
+        raise PGNError(f"bad FEN header: {'; '.join(problems)}", 0)
+    for ply, san in enumerate(game.sans()):
+        try:
+            move = parse_san(position, san)
+        except PGNError as error:
+            raise PGNError(f"ply {ply + 1}: {error}", ply + 1)
+        yield position, move
+        position.make_move(move)
+
+
+def replay_game(game: PGNGame, backend: str = "mailbox", with_moves: bool = False) -> dict:
+    """:returns a summary record of the game, with "error" set if it could not be replayed"""
+    headers = game.headers
+    record = {"game": game.index, "line": game.line, "white": headers.get("White", "?"),
+              "black": headers.get("Black", "?"), "result": headers.get("Result", "*"), "plies": 0}
+    moves = []
+    position = None
+    try:
+        for position, move in replay(game, backend):
+            moves.append(move_name(move))
+        if position is None:
+            position = game.start_position(backend)
+        legal = position.legal_moves()
+        record.update(plies=len(moves), fen=position.to_fen(),
+                      end="checkmate" if not legal and position.in_check() else "stalemate" if not legal else None)
+    except PGNError as error:
+        record.update(plies=error.ply - 1 if error.ply else 0, error=str(error))
+    if with_moves:
+        record["moves"] = moves
+    return record
+
+
+def _replay_chunk(games: list, backend: str, with_moves: bool) -> list:
+    return [replay_game(game, backend, with_moves) for game in games]
+
+
+def _chunks(games, size: int):
+    chunk = []
+    for game in games:
+        chunk.append(game)
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def replay_games(games, backend: str = "mailbox", workers: int = 1, chunk_size: int = 64,
+                 with_moves: bool = False):
+    """
+    Yield the replay_game record of every game, in file order. With more than one
+    worker, chunks of games are replayed in a process pool; at most two chunks per
+    worker are read ahead, so memory stays bounded.
+    """
+    if workers <= 1:
+        for game in games:
+            yield replay_game(game, backend, with_moves)
+        return
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        pending = []
+        for chunk in _chunks(games, chunk_size):
+            pending.append(pool.submit(_replay_chunk, chunk, backend, with_moves))
+            if len(pending) >= 2 * workers:
+                yield from pending.pop(0).result()
+        for future in pending:
+            yield from future.result()
+
+
+def main(argv: list = None) -> int:
+    parser = argparse.ArgumentParser(description="Replay every game of a PGN file through the rules engine")
+    parser.add_argument("path", help='PGN file, .gz allowed, "-" for stdin')
+    parser.add_argument("--backend", choices=BACKENDS, default="mailbox")
+    parser.add_argument("--workers", type=int, default=1, help="processes, 0 for one per core")
+    parser.add_argument("--chunk-size", type=int, default=64, help="games sent to a worker at once")
+    parser.add_argument("--moves", action="store_true", help="include the UCI moves in the records")
+    parser.add_argument("--json", action="store_true", help="one JSON record per game")
+    parser.add_argument("--errors-only", action="store_true", help="report only the games that failed")
+    args = parser.parse_args(argv)
+
+    workers = args.workers or os.cpu_count() or 1
+    start = time.perf_counter()
+    games = bad = plies = 0
+    stream = open_pgn(args.path)
+    try:
+        for record in replay_games(read_games(stream), args.backend, workers, args.chunk_size, args.moves):
+            games += 1
+            plies += record["plies"]
+            bad += "error" in record
+            if args.errors_only and "error" not in record:
+                continue
+            if args.json:
+                print(json.dumps(record))
+            elif "error" in record:
+                print(f"game {record['game']} (line {record['line']}): {record['error']}")
+            else:
+                print(f"game {record['game']}: {record['white']} - {record['black']} {record['result']}  "
+                      f"{record['plies']} plies" + (f"  {record['end']}" if record["end"] else ""))
+    finally:
+        if stream is not sys.stdin:
+            stream.close()
+
+    seconds = time.perf_counter() - start
+    print(f"{games} games  {bad} bad  {plies} plies  {seconds:.2f}s  "
+          f"{int(games / seconds) if seconds else 0} games/s  {int(plies / seconds) if seconds else 0} plies/s",
+          file=sys.stderr)
+    return 1 if bad else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
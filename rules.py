@@ -0,0 +1,733 @@
+"""
+Headless chess rules.
+
+Pure Python board state, move generation and game result detection. Nothing in
+here touches pygame, fonts or images, so positions can be created, moved and
+judged on machines without a display. The pygame ``GameProcess``/``ChessBoard``
+pair is a view over a ``Game`` from this module.
+
+Squares are numbered ``y * 8 + x`` with the same ``(x, y)`` tiles ``ChessBoard``
+uses: ``(0, 0)`` is the black queen-side rook corner, white pawns move towards
+``y == 0``. Pieces are the same ``"wP"``/``"bK"`` codes as ``str(Piece)`` and
+empty squares are ``0``, like in ``ChessBoard.get_field()``.
+"""
+
+from array import array
+
+from zobrist import PIECE_KEYS, CASTLING_KEYS, BLACK_TO_MOVE_KEY, en_passant_key, hash_position
+from tables import KNIGHT_TARGETS, KING_TARGETS, PAWN_TARGETS, ROOK_RAYS, BISHOP_RAYS, QUEEN_RAYS
+
+WHITE = "w"
+BLACK = "b"
+EMPTY = 0
+
+# castling rights bits
+WHITE_KINGSIDE = 1
+WHITE_QUEENSIDE = 2
+BLACK_KINGSIDE = 4
+BLACK_QUEENSIDE = 8
+
+# promotion options in the order ChessBoard.draw_transformation_options shows them
+PROMOTION_SYMBOLS = ("Q", "N", "B", "R")
+
+_FEN_CASTLING = {"K": WHITE_KINGSIDE, "Q": WHITE_QUEENSIDE, "k": BLACK_KINGSIDE, "q": BLACK_QUEENSIDE}
+
+# rook corner that loses its castling right when a piece leaves or arrives there
+_CORNER_RIGHTS = {
+    63: WHITE_KINGSIDE,
+    56: WHITE_QUEENSIDE,
+    7: BLACK_KINGSIDE,
+    0: BLACK_QUEENSIDE,
+}
+# King and rook home squares with the rights that need the piece there unmoved
+_HOME_RIGHTS = {
+    60: WHITE_KINGSIDE | WHITE_QUEENSIDE,
+    4: BLACK_KINGSIDE | BLACK_QUEENSIDE,
+    **_CORNER_RIGHTS,
+}
+
+
+def square(x: int, y: int) -> int:
+    """:returns square index of the (x, y) tile"""
+    return y * 8 + x
+
+
+def tile(sq: int) -> tuple:
+    """:returns (x, y) tile of the square index"""
+    return sq % 8, sq // 8
+
+
+def opponent(color: str) -> str:
+    return BLACK if color == WHITE else WHITE
+
+
+def square_name(sq: int) -> str:
+    """:returns algebraic name of the square, "e2" for the white King's pawn"""
+    return "abcdefgh"[sq % 8] + str(8 - sq // 8)
+
+
+def parse_square(name: str) -> int:
+    """:returns square index of the algebraic name"""
+    if len(name) != 2 or name[0] not in "abcdefgh" or name[1] not in "12345678":
+        raise ValueError(f"bad square {name!r}")
+    return square("abcdefgh".index(name[0]), 8 - int(name[1]))
+
+
+def move_name(move: tuple) -> str:
+    """:returns the move in long algebraic (UCI) form, like e2e4 or e7e8q"""
+    frm, to, promotion = move
+    return square_name(frm) + square_name(to) + (promotion.lower() if promotion else "")
+
+
+def parse_move_name(name: str) -> tuple:
+    """:returns the move tuple of a long algebraic (UCI) move"""
+    promotion = name[4:].upper() or None
+    if promotion is not None and promotion not in PROMOTION_SYMBOLS:
+        raise ValueError(f"bad promotion in {name!r}")
+    return parse_square(name[:2]), parse_square(name[2:4]), promotion
+
+
+# 16 bit packed moves: from square in bits 0-5, to square in bits 6-11 and a 4 bit flag
+QUIET = 0
+DOUBLE_PUSH = 1
+KING_CASTLE = 2
+QUEEN_CASTLE = 3
+CAPTURE = 4  # set in every capturing flag
+EN_PASSANT = 5
+PROMOTION = 8  # + index in PROMOTION_SYMBOLS, + CAPTURE if it takes
+
+
+def pack_move(position, move: tuple) -> int:
+    """:returns the 16 bit code of a move of the position, with its flag"""
+    frm, to, promotion = move
+    board = position.board
+    if promotion:
+        flag = PROMOTION | PROMOTION_SYMBOLS.index(promotion) | (CAPTURE if board[to] != EMPTY else 0)
+    elif board[to] != EMPTY:
+        flag = CAPTURE
+    elif board[frm] != EMPTY and board[frm][1] == "P":
+        flag = EN_PASSANT if to == position.en_passant else DOUBLE_PUSH if abs(to - frm) == 16 else QUIET
+    elif board[frm] != EMPTY and board[frm][1] == "K" and abs(to - frm) == 2:
+        flag = KING_CASTLE if to > frm else QUEEN_CASTLE
+    else:
+        flag = QUIET
+    return frm | to << 6 | flag << 12
+
+
+def unpack_move(code: int) -> tuple:
+    """:returns the move tuple of a packed move; no position needed"""
+    flag = code >> 12
+    return code & 63, code >> 6 & 63, PROMOTION_SYMBOLS[flag & 3] if flag & PROMOTION else None
+
+
+START_FEN = "rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1"
+
+
+BACKENDS = ("mailbox", "bitboard")
+
+
+def position_class(backend: str = "mailbox"):
+    """:returns the Position implementation of the given move generator backend"""
+    if backend == "bitboard":
+        from bitboard import BitboardPosition
+        return BitboardPosition
+    if backend != "mailbox":
+        raise ValueError(f"unknown backend {backend!r}, expected one of {BACKENDS}")
+    return Position
+
+
+class Position(object):
+    """
+    Full state of a chess position: piece placement, side to move, castling
+    rights, en passant square and move counters.
+
+    Moves are ``(from_square, to_square, promotion)`` tuples, ``promotion``
+    being one of ``PROMOTION_SYMBOLS`` or ``None``.
+    """
+
+    def __init__(self, board: list = None, turn: str = WHITE, castling: int = 0,
+                 en_passant: int or None = None, halfmove: int = 0, fullmove: int = 1):
+        self.board = board if board is not None else [EMPTY] * 64
+        self.turn = turn
+        self.castling = castling
+        self.en_passant = en_passant
+        self.halfmove = halfmove
+        self.fullmove = fullmove
+        self.hash = hash_position(self.board, turn, castling, en_passant)  # Zobrist, kept up to date by make_move
+
+    @classmethod
+    def initial(cls):
+        """:returns the position GameProcess.chess_board_fill sets up"""
+        board = [EMPTY] * 64
+        for x, symbol in enumerate("RNBQKBNR"):
+            board[square(x, 0)] = BLACK + symbol
+            board[square(x, 1)] = BLACK + "P"
+            board[square(x, 6)] = WHITE + "P"
+            board[square(x, 7)] = WHITE + symbol
+        return cls(board, WHITE, WHITE_KINGSIDE | WHITE_QUEENSIDE | BLACK_KINGSIDE | BLACK_QUEENSIDE)
+
+    @classmethod
+    def from_field(cls, field: list, turn: str = WHITE, last_move: tuple = None):
+        """
+        Build a position from a ``ChessBoard.get_field()`` layout of Piece objects.
+
+        Castling rights come from unmoved kings and rooks on their home squares and
+        the en passant square from a pawn that has just made its double step to
+        ``last_move``, which is how GameProcess tracks both.
+        """
+        board = [EMPTY] * 64
+        for y, row in enumerate(field):
+            for x, el in enumerate(row):
+                if el != 0:
+                    board[square(x, y)] = f"{el.color}{el.symbol}"
+
+        def unmoved(x, y, code):
+            el = field[y][x]
+            return el != 0 and f"{el.color}{el.symbol}" == code and el.moves_count == 0
+
+        castling = 0
+        for color, y, kingside, queenside in ((WHITE, 7, WHITE_KINGSIDE, WHITE_QUEENSIDE),
+                                              (BLACK, 0, BLACK_KINGSIDE, BLACK_QUEENSIDE)):
+            if unmoved(4, y, color + "K"):
+                if unmoved(7, y, color + "R"):
+                    castling |= kingside
+                if unmoved(0, y, color + "R"):
+                    castling |= queenside
+
+        turn = turn[0]
+        en_passant = None
+        if last_move:
+            x, y = last_move
+            el = field[y][x]
+            if el != 0 and el.symbol == "P" and el.color != turn and el.moves_count == 1 and \
+                    y == (4 if el.color == WHITE else 3):
+                en_passant = square(x, y + 1 if el.color == WHITE else y - 1)
+
+        return cls(board, turn, castling, en_passant)
+
+    @classmethod
+    def from_fen(cls, fen: str):
+        """
+        :returns the position described by a FEN string; the move counters may be left out (EPD)
+        :raises ValueError on a malformed FEN
+        """
+        parts = fen.split()
+        if len(parts) < 4:
+            raise ValueError(f"FEN needs at least 4 fields: {fen!r}")
+        placement, turn, castling_field, en_passant_field = parts[:4]
+
+        board = []
+        rows = placement.split("/")
+        if len(rows) != 8:
+            raise ValueError(f"FEN needs 8 rows: {placement!r}")
+        for row in rows:
+            width = 0
+            for ch in row:
+                if ch in "12345678":
+                    board += [EMPTY] * int(ch)
+                    width += int(ch)
+                elif ch.upper() in "PNBRQK":
+                    board.append((WHITE if ch.isupper() else BLACK) + ch.upper())
+                    width += 1
+                else:
+                    raise ValueError(f"bad piece {ch!r} in FEN")
+            if width != 8:
+                raise ValueError(f"FEN row {row!r} is not 8 squares wide")
+
+        if turn not in (WHITE, BLACK):
+            raise ValueError(f"bad side to move {turn!r}")
+
+        castling = 0
+        if castling_field != "-":
+            for ch in castling_field:
+                if ch not in _FEN_CASTLING:
+                    raise ValueError(f"bad castling field {castling_field!r}")
+                castling |= _FEN_CASTLING[ch]
+
+        en_passant = None if en_passant_field == "-" else parse_square(en_passant_field)
+        try:
+            halfmove = int(parts[4]) if len(parts) > 4 else 0
+            fullmove = int(parts[5]) if len(parts) > 5 else 1
+        except ValueError:
+            raise ValueError(f"bad move counters in FEN {fen!r}")
+        return cls(board, turn, castling, en_passant, halfmove, fullmove)
+
+    def to_field(self) -> tuple:
+        """
+        Inverse of from_field, without the Piece objects which need pygame.
+        :returns (pieces, last_move): pieces is a list of (x, y, color, symbol, moves_count)
+        where moves_count is 0 exactly for the kings and rooks that keep a castling right
+        and the pawns on their start row; last_move is the tile of the pawn that may be
+        taken en passant or None
+        """
+        pieces = []
+        for sq, el in enumerate(self.board):
+            if el == EMPTY:
+                continue
+            x, y = tile(sq)
+            color, symbol = el[0], el[1]
+            if symbol == "K" or symbol == "R":
+                at_home = sq in _HOME_RIGHTS and (y == 7) == (color == WHITE)
+                moves_count = 0 if at_home and self.castling & _HOME_RIGHTS[sq] else 1
+            elif symbol == "P":
+                moves_count = 0 if y == (6 if color == WHITE else 1) else 1
+            else:
+                moves_count = 0
+            pieces.append((x, y, color, symbol, moves_count))
+
+        last_move = None
+        if self.en_passant is not None:
+            last_move = tile(self.en_passant + (8 if self.turn == WHITE else -8))
+        return pieces, last_move
+
+    def problems(self) -> list:
+        """:returns what makes the position impossible to play from, empty if nothing"""
+        board = self.board
+        problems = []
+        for color, name in ((WHITE, "white"), (BLACK, "black")):
+            kings = board.count(color + "K")
+            if kings != 1:
+                problems.append(f"{name} has {kings} kings")
+        for sq in list(range(8)) + list(range(56, 64)):
+            if board[sq] != EMPTY and board[sq][1] == "P":
+                problems.append(f"pawn on {square_name(sq)}")
+        if not problems and self.in_check(opponent(self.turn)):
+            problems.append("the side not to move is in check")
+
+        for ch, bit in _FEN_CASTLING.items():
+            if self.castling & bit:
+                color = WHITE if ch.isupper() else BLACK
+                king, rook = [sq for sq, rights in _HOME_RIGHTS.items() if rights & bit]
+                if board[king] != color + "K" or board[rook] != color + "R":
+                    problems.append(f"castling right {ch} without king and rook at home")
+
+        if self.en_passant is not None:
+            step = 8 if self.turn == WHITE else -8
+            pawn = self.en_passant + step
+            if self.en_passant // 8 != (2 if self.turn == WHITE else 5) or \
+                    board[pawn] != opponent(self.turn) + "P" or \
+                    board[self.en_passant] != EMPTY or board[self.en_passant - step] != EMPTY:
+                problems.append(f"no pawn can be taken en passant on {square_name(self.en_passant)}")
+        return problems
+
+    def to_fen(self) -> str:
+        rows = []
+        for y in range(8):
+            row = ""
+            empty = 0
+            for el in self.board[y * 8:y * 8 + 8]:
+                if el == EMPTY:
+                    empty += 1
+                    continue
+                if empty:
+                    row += str(empty)
+                    empty = 0
+                row += el[1] if el[0] == WHITE else el[1].lower()
+            rows.append(row + (str(empty) if empty else ""))
+        castling = "".join(ch for ch, bit in _FEN_CASTLING.items() if self.castling & bit) or "-"
+        en_passant = square_name(self.en_passant) if self.en_passant is not None else "-"
+        return f"{'/'.join(rows)} {self.turn} {castling} {en_passant} {self.halfmove} {self.fullmove}"
+
+    def to_backend(self, backend: str):
+        """:returns a copy of this position held by the given backend"""
+        return position_class(backend)(self.board[:], self.turn, self.castling, self.en_passant,
+                                       self.halfmove, self.fullmove)
+
+    def copy(self):
+        position = Position.__new__(Position)
+        position.board = self.board[:]
+        position.turn = self.turn
+        position.castling = self.castling
+        position.en_passant = self.en_passant
+        position.halfmove = self.halfmove
+        position.fullmove = self.fullmove
+        position.hash = self.hash
+        return position
+
+    def king_square(self, color: str) -> int or None:
+        """:returns square of the King of given color"""
+        try:
+            return self.board.index(color + "K")
+        except ValueError:
+            return None
+
+    def is_attacked(self, sq: int, by_color: str) -> bool:
+        """True if any piece of by_color hits the square"""
+        board = self.board
+
+        # a pawn of by_color hits sq if a pawn of the other color on sq would hit it back
+        pawn = by_color + "P"
+        for target in PAWN_TARGETS[opponent(by_color)][sq]:
+            if board[target] == pawn:
+                return True
+
+        knight = by_color + "N"
+        for target in KNIGHT_TARGETS[sq]:
+            if board[target] == knight:
+                return True
+
+        king = by_color + "K"
+        for target in KING_TARGETS[sq]:
+            if board[target] == king:
+                return True
+
+        for rays, sliders in ((ROOK_RAYS, (by_color + "R", by_color + "Q")),
+                              (BISHOP_RAYS, (by_color + "B", by_color + "Q"))):
+            for ray in rays[sq]:
+                for target in ray:
+                    el = board[target]
+                    if el != EMPTY:
+                        if el in sliders:
+                            return True
+                        break
+        return False
+
+    def in_check(self, color: str = None) -> bool:
+        """True if the King of given color (side to move by default) is hit"""
+        color = color or self.turn
+        king = self.king_square(color)
+        return king is not None and self.is_attacked(king, opponent(color))
+
+    def pseudo_legal_moves(self) -> list:
+        """:returns all moves of the side to move, ignoring whether they leave the King hit"""
+        board = self.board
+        us = self.turn
+        them = opponent(us)
+        moves = []
+
+        for frm, el in enumerate(board):
+            if el == EMPTY or el[0] != us:
+                continue
+            symbol = el[1]
+
+            if symbol == "P":
+                step = -8 if us == WHITE else 8
+                to = frm + step
+                if not 0 <= to < 64:
+                    continue
+                targets = []
+                if board[to] == EMPTY:
+                    targets.append(to)
+                    if frm // 8 == (6 if us == WHITE else 1) and board[to + step] == EMPTY:
+                        moves.append((frm, to + step, None))
+                for to in PAWN_TARGETS[us][frm]:
+                    if (board[to] != EMPTY and board[to][0] == them) or to == self.en_passant:
+                        targets.append(to)
+                promotes = (frm + step) // 8 in (0, 7)
+                for to in targets:
+                    if promotes:
+                        for promotion in PROMOTION_SYMBOLS:
+                            moves.append((frm, to, promotion))
+                    else:
+                        moves.append((frm, to, None))
+
+            elif symbol == "N" or symbol == "K":
+                for to in (KNIGHT_TARGETS if symbol == "N" else KING_TARGETS)[frm]:
+                    if board[to] == EMPTY or board[to][0] == them:
+                        moves.append((frm, to, None))
+
+            else:
+                rays = ROOK_RAYS if symbol == "R" else BISHOP_RAYS if symbol == "B" else QUEEN_RAYS
+                for ray in rays[frm]:
+                    for to in ray:
+                        if board[to] == EMPTY:
+                            moves.append((frm, to, None))
+                        else:
+                            if board[to][0] == them:
+                                moves.append((frm, to, None))
+                            break
+
+        moves += self._castling_moves()
+        return moves
+
+    def _castling_moves(self) -> list:
+        """King may not castle out of, through or (checked later) into check"""
+        us = self.turn
+        if us == WHITE:
+            king, kingside, queenside = 60, WHITE_KINGSIDE, WHITE_QUEENSIDE
+        else:
+            king, kingside, queenside = 4, BLACK_KINGSIDE, BLACK_QUEENSIDE
+        if not self.castling & (kingside | queenside) or self.board[king] != us + "K":
+            return []
+
+        board = self.board
+        them = opponent(us)
+        moves = []
+        if self.castling & kingside and board[king + 1] == EMPTY and board[king + 2] == EMPTY and \
+                board[king + 3] == us + "R":
+            if not self.is_attacked(king, them) and not self.is_attacked(king + 1, them):
+                moves.append((king, king + 2, None))
+        if self.castling & queenside and board[king - 1] == EMPTY and board[king - 2] == EMPTY and \
+                board[king - 3] == EMPTY and board[king - 4] == us + "R":
+            if not self.is_attacked(king, them) and not self.is_attacked(king - 1, them):
+                moves.append((king, king - 2, None))
+        return moves
+
+    def checks_and_pins(self) -> tuple:
+        """
+        Look from the King of the side to move along every line once.
+        :returns (checkers, evasions, pins): squares of the pieces giving check, squares
+        a non-King move must land on to answer a single check (capture or block) and
+        {pinned square: squares along its pin line, pinner included}
+        """
+        board = self.board
+        us = self.turn
+        them = opponent(us)
+        king = self.king_square(us)
+        checkers = []
+        evasions = set()
+        pins = {}
+
+        for targets, attacker in ((PAWN_TARGETS[us], them + "P"), (KNIGHT_TARGETS, them + "N")):
+            for target in targets[king]:
+                if board[target] == attacker:
+                    checkers.append(target)
+                    evasions.add(target)
+
+        for rays, sliders in ((ROOK_RAYS, (them + "R", them + "Q")), (BISHOP_RAYS, (them + "B", them + "Q"))):
+            for ray in rays[king]:
+                pinned = None
+                for i, target in enumerate(ray):
+                    el = board[target]
+                    if el == EMPTY:
+                        continue
+                    if el[0] == us:
+                        if pinned is not None:
+                            break
+                        pinned = target
+                        continue
+                    if el in sliders:
+                        if pinned is None:
+                            checkers.append(target)
+                            evasions.update(ray[:i + 1])
+                        else:
+                            pins[pinned] = ray[:i + 1]
+                    break
+        return checkers, evasions, pins
+
+    def legal_moves(self) -> list:
+        """
+        :returns all moves of the side to move that don't leave its King hit.
+
+        Checkers and pins are found once per position, so most moves are judged by
+        a set lookup. Only King moves and en passant captures, which can uncover a
+        line through two squares at once, are tried on the board.
+        """
+        us = self.turn
+        king = self.king_square(us)
+        if king is None:
+            return self.pseudo_legal_moves()
+
+        board = self.board
+        them = opponent(us)
+        checkers, evasions, pins = self.checks_and_pins()
+        double_check = len(checkers) > 1
+        legal = []
+        for move in self.pseudo_legal_moves():
+            frm, to = move[0], move[1]
+            if frm == king or (to == self.en_passant and board[frm][1] == "P"):
+                undo = self.make_move(move)
+                if not self.is_attacked(self.king_square(us), them):
+                    legal.append(move)
+                self.unmake_move(move, undo)
+            elif double_check or (checkers and to not in evasions) or (frm in pins and to not in pins[frm]):
+                continue
+            else:
+                legal.append(move)
+        return legal
+
+    def make_move(self, move: tuple) -> tuple:
+        """
+        Play the move in place and update the Zobrist hash. The move is not checked for legality.
+        :returns undo record for unmake_move: (captured piece, castling rights,
+        en passant square, halfmove clock, fullmove number, hash) before the move
+        """
+        frm, to, promotion = move
+        board = self.board
+        el = board[frm]
+        moved = el[1]
+        us = self.turn
+        captured = board[to]
+        undo = captured, self.castling, self.en_passant, self.halfmove, self.fullmove, self.hash
+        key = self.hash ^ BLACK_TO_MOVE_KEY ^ CASTLING_KEYS[self.castling] ^ \
+            en_passant_key(board, self.en_passant, us) ^ PIECE_KEYS[el][frm]
+
+        board[frm] = EMPTY
+        if captured != EMPTY:
+            key ^= PIECE_KEYS[captured][to]
+        if moved == "P":
+            if to == self.en_passant:
+                taken = to + 8 if us == WHITE else to - 8
+                key ^= PIECE_KEYS[board[taken]][taken]
+                board[taken] = EMPTY
+            if promotion:
+                el = us + promotion
+        elif moved == "K":
+            self.castling &= ~(WHITE_KINGSIDE | WHITE_QUEENSIDE if us == WHITE else BLACK_KINGSIDE | BLACK_QUEENSIDE)
+            if to - frm == 2:  # 0-0
+                key ^= PIECE_KEYS[board[frm + 3]][frm + 3] ^ PIECE_KEYS[board[frm + 3]][frm + 1]
+                board[frm + 1], board[frm + 3] = board[frm + 3], EMPTY
+            elif frm - to == 2:  # 0-0-0
+                key ^= PIECE_KEYS[board[frm - 4]][frm - 4] ^ PIECE_KEYS[board[frm - 4]][frm - 1]
+                board[frm - 1], board[frm - 4] = board[frm - 4], EMPTY
+        board[to] = el
+
+        if self.castling:
+            self.castling &= ~(_CORNER_RIGHTS.get(frm, 0) | _CORNER_RIGHTS.get(to, 0))
+
+        self.en_passant = (frm + to) // 2 if moved == "P" and abs(to - frm) == 16 else None
+        self.halfmove = 0 if moved == "P" or captured != EMPTY else self.halfmove + 1
+        if us == BLACK:
+            self.fullmove += 1
+        self.turn = them = opponent(us)
+        self.hash = key ^ PIECE_KEYS[el][to] ^ CASTLING_KEYS[self.castling] ^ \
+            en_passant_key(board, self.en_passant, them)
+        return undo
+
+    def unmake_move(self, move: tuple, undo: tuple) -> None:
+        """Take back the move make_move returned the undo record for"""
+        frm, to, promotion = move
+        board = self.board
+        captured, self.castling, self.en_passant, self.halfmove, self.fullmove, self.hash = undo
+        us = self.turn = opponent(self.turn)
+
+        el = us + "P" if promotion else board[to]
+        board[frm] = el
+        board[to] = captured
+        if el[1] == "P" and to == self.en_passant:
+            board[to + 8 if us == WHITE else to - 8] = opponent(us) + "P"
+        elif el[1] == "K":
+            if to - frm == 2:  # 0-0
+                board[frm + 3], board[frm + 1] = board[frm + 1], EMPTY
+            elif frm - to == 2:  # 0-0-0
+                board[frm - 4], board[frm - 1] = board[frm - 1], EMPTY
+
+class Game(object):
+    """
+    A game played from a Position: legal move lookup by tile, move history and
+    check, checkmate, stalemate, repetition and fifty move rule detection.
+
+    Legal moves of the side to move are generated once per position and kept
+    until the next push, so highlighting, input validation and result checks all
+    share them. Change the position through push and pop only, or the cache goes stale.
+
+    Next to every move the game keeps the hash of the position before it and how
+    often the position after it has occurred. A repetition can only go back to
+    the last capture or pawn move (the halfmove clock) and stops at the nearest
+    earlier occurrence, whose count it extends, so a push costs a handful of
+    integer comparisons.
+    """
+
+    def __init__(self, position: Position = None, backend: str = "mailbox"):
+        self.position = position if position is not None else position_class(backend).initial()
+        self.start = self.position.copy()  # the position before the first move
+        self.moves = []
+        self.packed = array("H")  # the moves again, packed 16 bits each (pack_move)
+        self.history = []  # hashes of the positions before each move, as Searcher.search takes them
+        self._undo = []  # make_move undo records of the moves
+        self._repetitions = [1]  # occurrences of the start position and the position after each move
+        self._legal_moves = None
+        self._destinations = None
+        self._in_check = None
+
+    @property
+    def turn(self) -> str:
+        return self.position.turn
+
+    def legal_moves(self) -> list:
+        if self._legal_moves is None:
+            self._legal_moves = self.position.legal_moves()
+        return self._legal_moves
+
+    def legal_destinations(self, from_tile: tuple) -> list:
+        """:returns tiles the piece on from_tile may go to"""
+        if self._destinations is None:
+            self._destinations = {}
+            for frm, to, promotion in self.legal_moves():
+                destinations = self._destinations.setdefault(frm, [])
+                if tile(to) not in destinations:
+                    destinations.append(tile(to))
+        return self._destinations.get(square(*from_tile), [])
+
+    def find_move(self, from_tile: tuple, to_tile: tuple, promotion: str = None) -> tuple or None:
+        """:returns the legal move between the tiles or None"""
+        move = square(*from_tile), square(*to_tile), promotion
+        return move if move in self.legal_moves() else None
+
+    def push(self, move: tuple) -> None:
+        self.packed.append(pack_move(self.position, move))
+        self.history.append(self.position.hash)
+        self._undo.append(self.position.make_move(move))
+        self.moves.append(move)
+        self._repetitions.append(self._occurrences())
+        self._legal_moves = None
+        self._destinations = None
+        self._in_check = None
+
+    def pop(self) -> tuple:
+        """Take back the last move. :returns it"""
+        move = self.moves.pop()
+        self.packed.pop()
+        self.position.unmake_move(move, self._undo.pop())
+        self.history.pop()
+        self._repetitions.pop()
+        self._legal_moves = None
+        self._destinations = None
+        self._in_check = None
+        return move
+
+    def _occurrences(self) -> int:
+        key = self.position.hash
+        history = self.history
+        # history[i] is the position after i moves; the side to move matches every second one
+        for i in range(len(history) - 2, max(len(history) - self.position.halfmove - 1, -1), -2):
+            if history[i] == key:
+                return self._repetitions[i] + 1
+        return 1
+
+    def king_tile(self, color: str = None) -> tuple or None:
+        """:returns tile of the King of given color (side to move by default)"""
+        king = self.position.king_square(color or self.turn)
+        return tile(king) if king is not None else None
+
+    def is_check(self) -> bool:
+        if self._in_check is None:
+            self._in_check = self.position.in_check()
+        return self._in_check
+
+    def is_checkmate(self) -> bool:
+        return self.is_check() and not self.legal_moves()
+
+    def is_stalemate(self) -> bool:
+        return not self.is_check() and not self.legal_moves()
+
+    def is_repetition(self, times: int = 3) -> bool:
+        """True if the position has occurred times times in the game"""
+        return self._repetitions[-1] >= times
+
+    def is_fifty_moves(self) -> bool:
+        """True after fifty moves of each side without a capture or pawn move"""
+        return self.position.halfmove >= 100
+
+    def termination(self) -> str or None:
+        """:returns "checkmate", "stalemate", "repetition", "fifty moves" or None while the game goes on"""
+        if not self.legal_moves():
+            return "checkmate" if self.is_check() else "stalemate"
+        if self.is_repetition():
+            return "repetition"
+        if self.is_fifty_moves():
+            return "fifty moves"
+        return None
+
+    def is_game_over(self) -> bool:
+        """True on checkmate, stalemate, threefold repetition or the fifty move rule"""
+        return self.termination() is not None
+
+    def result(self) -> str:
+        """:returns "1-0", "0-1", "1/2-1/2" or "*" for a game still going on"""
+        termination = self.termination()
+        if termination is None:
+            return "*"
+        if termination == "checkmate":
+            return "0-1" if self.turn == WHITE else "1-0"
+        return "1/2-1/2"
@@ -0,0 +1,364 @@
+"""
+Alpha-beta search: negamax with iterative deepening, a transposition table,
+quiescence search on captures and MVV-LVA / killer / history move ordering.
+
+    searcher = Searcher()
+    result = searcher.search(Position.from_fen(fen), max_depth=5, time_limit=2.0)
+    result["move"], result["score"], result["nps"]
+
+A search stops at whichever of max_depth, time_limit (seconds) and node_limit
+comes first. With only max_depth given it is deterministic.
+"""
+
+import time
+
+from evaluation import evaluate, PIECE_VALUES
+from rules import Position, EMPTY, move_name
+from tablebase import Tablebase
+from transposition import TranspositionTable, EXACT, LOWER, UPPER
+
+MATE = 100000
+INFINITY = 1000000
+MAX_PLY = 128
+MAX_DEPTH = 64  # iterative deepening stops here whatever the limits, the table keeps depths in a byte
+# a mate found this close to MATE is stored in the table relative to the node
+MATE_BOUND = MATE - MAX_PLY
+
+TT_MOVE_ORDER = 10000000
+CAPTURE_ORDER = 1000000
+KILLER_ORDER = 900000
+
+
+class SearchTimeout(Exception):
+    """Raised inside the tree when the time or node budget is spent"""
+
+
+class Searcher(object):
+    def __init__(self, table_size_mb: float = 16, table: TranspositionTable = None, tablebase: Tablebase = None):
+        self.table = table if table is not None else TranspositionTable(table_size_mb)
+        self.tablebase = tablebase  # exact scores of the endings it covers
+        self.nodes = 0
+        self._killers = [[None, None] for _ in range(MAX_PLY)]
+        self._history = {}
+        self._path = []
+        self._deadline = None
+        self._node_limit = None
+        self.stop = False  # set from another thread to abort the search, cleared when it has ended
+
+    def search(self, position: Position, max_depth: int = None, time_limit: float = None,
+               node_limit: int = None, history: list = (), info=None, on_start=None) -> dict:
+        """
+        Search the position, which is left unchanged.
+        :param history: hashes of the earlier positions of the game, for repetitions
+        :param info: called with the result dict after every finished depth
+        :param on_start: called once the limits are in force, before the first depth
+        :returns dict with the best move, its score for the side to move, reached
+        depth, principal variation, nodes, seconds and nodes per second
+        """
+        if max_depth is None and time_limit is None and node_limit is None:
+            raise ValueError("search needs a max_depth, time_limit or node_limit")
+        try:
+            return self._search(position.copy(), max_depth, time_limit, node_limit, history, info, on_start)
+        finally:
+            self.stop = False
+
+    def _search(self, position: Position, max_depth: int or None, time_limit: float or None,
+                node_limit: int or None, history, info, on_start) -> dict:
+        start = time.perf_counter()
+        self._reset(start, time_limit, node_limit, history)
+        if on_start:
+            on_start()
+
+        moves = position.legal_moves()
+        result = {"move": moves[0] if moves else None, "score": 0, "depth": 0, "pv": [],
+                  "nodes": 0, "seconds": 0.0, "nps": 0}
+        if len(moves) <= 1:
+            return result
+        if self.tablebase is not None:
+            scores = self._tablebase_scores(position, moves)
+            if scores is not None:
+                best = max(moves, key=lambda move: scores[move])
+                seconds = time.perf_counter() - start
+                result.update(move=best, score=scores[best], depth=1, pv=[best], nodes=len(moves),
+                              seconds=round(seconds, 6), nps=int(len(moves) / seconds) if seconds else 0)
+                return result
+
+        depth = 0
+        max_depth = MAX_DEPTH if max_depth is None else min(max_depth, MAX_DEPTH)
+        while depth < max_depth:
+            depth += 1
+            try:
+                score = self._negamax(position, depth, -INFINITY, INFINITY, 0)
+            except SearchTimeout:
+                break
+            seconds = time.perf_counter() - start
+            pv = self.principal_variation(position, depth)
+            result = {
+                "move": pv[0] if pv else result["move"],
+                "score": score,
+                "depth": depth,
+                "pv": pv,
+                "nodes": self.nodes,
+                "seconds": round(seconds, 6),
+                "nps": int(self.nodes / seconds) if seconds else 0,
+            }
+            if info:
+                info(result)
+            if abs(score) >= MATE_BOUND:
+                break
+        result["nodes"] = self.nodes
+        return result
+
+    def new_search(self, history: list = ()) -> None:
+        """
+        Begin a search made of score() calls: fresh killers and history, a new
+        table generation. history ends with the hash of the root position.
+        """
+        self._reset(time.perf_counter(), None, None, history)
+
+    def score(self, position: Position, depth: int, alpha: int = -INFINITY, beta: int = INFINITY,
+              ply: int = 0, time_limit: float = None) -> int:
+        """
+        :returns negamax score of the position for the side to move, searched
+        depth plies deep; outside the alpha-beta window it is only a bound. The
+        table, killers and history of the search begun by new_search() carry over
+        between calls, so scoring the root moves one by one, a ply deeper every
+        iteration, reuses what the earlier calls found. ply is the distance from
+        the root the position hangs from, so mate scores come out relative to it.
+        :raises SearchTimeout if the time limit runs out first
+        """
+        position = position.copy()
+        self._deadline = time.perf_counter() + time_limit if time_limit is not None else None
+        try:
+            if depth <= 0:
+                return self._quiescence(position, alpha, beta, ply)
+            return self._negamax(position, depth, alpha, beta, ply)
+        finally:
+            self.stop = False
+
+    def principal_variation(self, position: Position, depth: int) -> list:
+        """:returns the best line stored in the transposition table"""
+        pv = []
+        undo_stack = []
+        for _ in range(depth):
+            entry = self.table.probe(position.hash)
+            if entry is None or entry[3] is None or entry[3] not in position.legal_moves():
+                break
+            move = entry[3]
+            pv.append(move)
+            undo_stack.append((move, position.make_move(move)))
+        for move, undo in reversed(undo_stack):
+            position.unmake_move(move, undo)
+        return pv
+
+    def _reset(self, start: float, time_limit: float or None, node_limit: int or None, history) -> None:
+        self._deadline = start + time_limit if time_limit is not None else None
+        self._node_limit = node_limit
+        self._path = list(history)
+        self.nodes = 0
+        self.table.new_search()
+        self._killers = [[None, None] for _ in range(MAX_PLY)]
+        self._history = {}
+
+    def set_time_limit(self, time_limit: float or None) -> None:
+        """Give the search going on time_limit seconds from now, or no time limit"""
+        self._deadline = time.perf_counter() + time_limit if time_limit is not None else None
+
+    def _tablebase_score(self, position: Position, ply: int) -> int or None:
+        if 64 - position.board.count(EMPTY) > 3:
+            return None
+        probed = self.tablebase.probe(position)
+        if probed is None:
+            return None
+        wdl, plies = probed
+        return 0 if not wdl else MATE - ply - plies if wdl > 0 else -MATE + ply + plies
+
+    def _tablebase_scores(self, position: Position, moves: list) -> dict or None:
+        """:returns {move: exact score} if the tablebase covers every root move"""
+        scores = {}
+        for move in moves:
+            undo = position.make_move(move)
+            score = self._tablebase_score(position, 1)
+            position.unmake_move(move, undo)
+            if score is None:
+                return None
+            scores[move] = -score
+        return scores
+
+    def _check_budget(self) -> None:
+        if self.stop or \
+                (self._node_limit is not None and self.nodes >= self._node_limit) or \
+                (self._deadline is not None and time.perf_counter() >= self._deadline):
+            raise SearchTimeout()
+
+    def _is_repetition(self, position: Position) -> bool:
+        # only positions since the last capture or pawn move can repeat
+        key = position.hash
+        path = self._path
+        for i in range(len(path) - 2, max(len(path) - position.halfmove - 1, -1), -2):
+            if path[i] == key:
+                return True
+        return False
+
+    def _order(self, position: Position, moves: list, tt_move, ply: int) -> list:
+        board = position.board
+        killers = self._killers[ply]
+        history = self._history
+        scored = []
+        for move in moves:
+            frm, to, promotion = move
+            if move == tt_move:
+                order = TT_MOVE_ORDER
+            elif board[to] != EMPTY or promotion or (to == position.en_passant and board[frm][1] == "P"):
+                victim = PIECE_VALUES[board[to][1]] if board[to] != EMPTY else PIECE_VALUES["P"]
+                order = CAPTURE_ORDER + victim * 10 - PIECE_VALUES[board[frm][1]] + \
+                    (PIECE_VALUES[promotion] if promotion else 0)
+            elif move == killers[0]:
+                order = KILLER_ORDER
+            elif move == killers[1]:
+                order = KILLER_ORDER - 1
+            else:
+                order = history.get((frm, to), 0)
+            scored.append((order, move))
+        scored.sort(key=lambda item: item[0], reverse=True)
+        return [move for order, move in scored]
+
+    def _negamax(self, position: Position, depth: int, alpha: int, beta: int, ply: int) -> int:
+        self.nodes += 1
+        if not self.nodes & 1023:
+            self._check_budget()
+
+        if ply and (position.halfmove >= 100 or self._is_repetition(position)):
+            return 0
+        if ply and self.tablebase is not None:
+            score = self._tablebase_score(position, ply)
+            if score is not None:
+                return score
+        if ply >= MAX_PLY - 1:  # no killers beyond, and mate scores need ply < MAX_PLY
+            return evaluate(position)
+
+        # mate distance pruning
+        alpha = max(alpha, -MATE + ply)
+        beta = min(beta, MATE - ply)
+        if alpha >= beta:
+            return alpha
+
+        alpha_start = alpha
+        tt_move = None
+        entry = self.table.probe(position.hash)
+        if entry is not None:
+            entry_depth, score, flag, tt_move = entry
+            if ply and entry_depth >= depth:
+                score = _score_from_table(score, ply)
+                if flag == EXACT or (flag == LOWER and score >= beta) or (flag == UPPER and score <= alpha):
+                    return score
+
+        in_check = position.in_check()
+        if in_check:
+            depth += 1
+        if depth <= 0:
+            return self._quiescence(position, alpha, beta, ply)
+
+        moves = position.legal_moves()
+        if not moves:
+            return -MATE + ply if in_check else 0
+
+        best_score = -INFINITY
+        best_move = None
+        board = position.board
+        self._path.append(position.hash)
+        try:
+            for move in self._order(position, moves, tt_move, ply):
+                quiet = board[move[1]] == EMPTY and not move[2] and \
+                    not (move[1] == position.en_passant and board[move[0]][1] == "P")
+                undo = position.make_move(move)
+                try:
+                    score = -self._negamax(position, depth - 1, -beta, -alpha, ply + 1)
+                finally:
+                    position.unmake_move(move, undo)
+                if score > best_score:
+                    best_score = score
+                    best_move = move
+                if score > alpha:
+                    alpha = score
+                if alpha >= beta:
+                    if quiet:
+                        killers = self._killers[ply]
+                        if killers[0] != move:
+                            killers[1] = killers[0]
+                            killers[0] = move
+                        key = move[0], move[1]
+                        self._history[key] = self._history.get(key, 0) + depth * depth
+                    break
+        finally:
+            self._path.pop()
+
+        if best_score <= alpha_start:
+            flag = UPPER
+        elif best_score >= beta:
+            flag = LOWER
+        else:
+            flag = EXACT
+        self.table.store(position.hash, depth, _score_to_table(best_score, ply), flag, best_move)
+        return best_score
+
+    def _quiescence(self, position: Position, alpha: int, beta: int, ply: int) -> int:
+        """Only captures and promotions, so the static evaluation is not taken mid-exchange"""
+        self.nodes += 1
+        if not self.nodes & 1023:
+            self._check_budget()
+
+        stand_pat = evaluate(position)
+        if stand_pat >= beta:
+            return stand_pat
+        if stand_pat > alpha:
+            alpha = stand_pat
+        if ply >= MAX_PLY - 1:
+            return stand_pat
+
+        board = position.board
+        captures = [move for move in position.legal_moves()
+                    if board[move[1]] != EMPTY or move[2] or
+                    (move[1] == position.en_passant and board[move[0]][1] == "P")]
+        for move in self._order(position, captures, None, ply):
+            undo = position.make_move(move)
+            try:
+                score = -self._quiescence(position, -beta, -alpha, ply + 1)
+            finally:
+                position.unmake_move(move, undo)
+            if score >= beta:
+                return score
+            if score > alpha:
+                alpha = score
+        return alpha
+
+
+def _score_to_table(score: int, ply: int) -> int:
+    """mate scores are stored as distance from the node, not from the root"""
+    if score >= MATE_BOUND:
+        return score + ply
+    if score <= -MATE_BOUND:
+        return score - ply
+    return score
+
+
+def _score_from_table(score: int, ply: int) -> int:
+    if score >= MATE_BOUND:
+        return score - ply
+    if score <= -MATE_BOUND:
+        return score + ply
+    return score
+
+
+def format_score(score: int) -> str:
+    """:returns "+0.35" style pawns or "mate 3" style moves to mate"""
+    if abs(score) >= MATE_BOUND:
+        plies = MATE - abs(score)
+        return f"mate {(plies + 1) // 2 if score > 0 else -((plies + 1) // 2)}"
+    return f"{score / 100:+.2f}"
+
+
+def format_result(result: dict) -> str:
+    pv = " ".join(move_name(move) for move in result["pv"])
+    return f"depth {result['depth']} score {format_score(result['score'])} nodes {result['nodes']} " \
+           f"nps {result['nps']} pv {pv}"
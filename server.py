@@ -0,0 +1,367 @@
+"""
+Headless asyncio server hosting many games at once, plus a load generator.
+
+Clients speak newline separated JSON over TCP:
+
+    {"op": "new", "fen": "..."}            -> {"op": "position", "game": 7, ...}   fen optional
+    {"op": "join", "game": 7}              -> position now and after every move
+    {"op": "move", "game": 7, "move": "e2e4"}
+    {"op": "close", "game": 7}             -> the game is forgotten
+    {"op": "stats"} / {"op": "stats", "game": 7}
+
+A move is checked against ``Position.legal_moves``; the mover gets the new
+position back and every other client that joined the game gets it pushed. A
+position message carries the FEN, the move, the ply and "status": "ok", "check",
+"checkmate" or "stalemate". Bad requests get {"op": "error", "error": "..."}. A
+watcher that does not read its pushes, with more than WATCHER_BUFFER bytes of
+them waiting, stops getting them until it joins again.
+
+A game is held as its packed position (compact.CompactBoard, 36 bytes), the
+start FEN and the moves packed 16 bits each; a Position is only built to check a
+move or to write the FEN of a message.
+
+    python server.py serve --port 8765
+    python server.py load --port 8765 --connections 200 --games 5
+    python server.py bench --connections 200 --games 5
+
+``bench`` starts a server process, runs the load generator against it and
+reports the server's CPU per move, the p99 move validation latency and how many
+games one core would host at a human pace of one move per ``--move-interval``
+seconds per game.
+"""
+
+import argparse
+import asyncio
+import itertools
+import json
+import multiprocessing
+import random
+import sys
+import time
+from array import array
+from collections import deque
+
+from compact import CompactBoard
+from rules import Position, START_FEN, BACKENDS, position_class, move_name, parse_move_name, pack_move
+
+LATENCY_SAMPLES = 100000  # latest move validation times kept for the percentiles
+WATCHER_BUFFER = 1 << 18  # bytes of pushes waiting for a watcher before it is dropped
+
+
+class ServerGame(object):
+    """A hosted game: the packed position, its moves packed 16 bits each, watchers and latency counters"""
+    __slots__ = ("id", "start_fen", "board", "moves", "status", "watchers", "validations", "total_us", "max_us")
+
+    def __init__(self, game_id: int, position: Position, start_fen: str):
+        self.id = game_id
+        self.start_fen = start_fen  # START_FEN itself is shared by all games from the usual start
+        self.board = CompactBoard.from_position(position).pack()
+        self.moves = array("H")
+        self.status = _status(position)
+        self.watchers = set()
+        self.validations = 0
+        self.total_us = 0
+        self.max_us = 0
+
+    def position(self, backend: str = "mailbox") -> Position:
+        return CompactBoard.unpack(self.board).to_position(backend)
+
+    def message(self, move: tuple = None, position: Position = None) -> dict:
+        """:param position: the game's position if already built"""
+        position = position if position is not None else self.position()
+        message = {"op": "position", "game": self.id, "fen": position.to_fen(), "ply": len(self.moves),
+                   "status": self.status}
+        if move is not None:
+            message["move"] = move_name(move)
+        return message
+
+    def stats(self) -> dict:
+        return {"game": self.id, "ply": len(self.moves), "status": self.status, "watchers": len(self.watchers),
+                "validations": self.validations, "max_us": self.max_us,
+                "mean_us": round(self.total_us / self.validations, 1) if self.validations else 0}
+
+
+def _status(position: Position) -> str:
+    check = position.in_check()
+    if not position.legal_moves():
+        return "checkmate" if check else "stalemate"
+    return "check" if check else "ok"
+
+
+def _percentile(ordered: list, fraction: float) -> int:
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))] if ordered else 0
+
+
+class GameServer(object):
+    def __init__(self, backend: str = "mailbox"):
+        self.backend = backend
+        self.games = {}
+        self._ids = itertools.count(1)
+        self.latencies = deque(maxlen=LATENCY_SAMPLES)  # microseconds per validated move
+        self.moves = 0
+        self.rejected = 0
+        self.games_started = 0
+        self.connections = 0
+        self._started = time.perf_counter()
+        self._cpu_started = time.process_time()
+
+    def new_game(self, fen: str = None) -> ServerGame:
+        if fen is not None and not isinstance(fen, str):
+            raise ValueError("fen is a string")
+        position = position_class(self.backend).from_fen(fen or START_FEN)
+        problems = position.problems()
+        if problems:
+            raise ValueError("; ".join(problems))
+        game = ServerGame(next(self._ids), position, START_FEN if not fen else position.to_fen())
+        self.games[game.id] = game
+        self.games_started += 1
+        return game
+
+    def game(self, request: dict) -> ServerGame:
+        game_id = request.get("game")
+        if not isinstance(game_id, int) or isinstance(game_id, bool):
+            raise ValueError("game is a number")
+        game = self.games.get(game_id)
+        if game is None:
+            raise ValueError(f"no game {game_id}")
+        return game
+
+    def play(self, game: ServerGame, text: str) -> tuple:
+        """
+        Validate and play a move.
+        :returns (move tuple, the position after it)
+        :raises ValueError if it is not legal
+        """
+        start = time.perf_counter()
+        if game.status in ("checkmate", "stalemate"):
+            raise ValueError("the game is over")
+        move = parse_move_name(text)
+        position = game.position(self.backend)
+        if move not in position.legal_moves():
+            raise ValueError(f"illegal move {text}")
+        game.moves.append(pack_move(position, move))
+        position.make_move(move)
+        game.board = CompactBoard.from_position(position).pack()
+        game.status = _status(position)
+        micros = int((time.perf_counter() - start) * 1000000)
+        game.validations += 1
+        game.total_us += micros
+        game.max_us = max(game.max_us, micros)
+        self.latencies.append(micros)
+        self.moves += 1
+        return move, position
+
+    def stats(self) -> dict:
+        ordered = sorted(self.latencies)
+        cpu = time.process_time() - self._cpu_started
+        return {
+            "games": len(self.games),
+            "games_started": self.games_started,
+            "connections": self.connections,
+            "moves": self.moves,
+            "rejected": self.rejected,
+            "p50_us": _percentile(ordered, 0.5),
+            "p99_us": _percentile(ordered, 0.99),
+            "max_us": ordered[-1] if ordered else 0,
+            "mean_us": round(sum(ordered) / len(ordered), 1) if ordered else 0,
+            "uptime": round(time.perf_counter() - self._started, 3),
+            "cpu_seconds": round(cpu, 3),
+            "moves_per_cpu_second": int(self.moves / cpu) if cpu else 0,
+        }
+
+    def handle(self, request: dict, writer) -> dict:
+        """:returns the reply to one request; pushes positions to the game's other watchers"""
+        if not isinstance(request, dict):
+            raise ValueError("a request is a JSON object")
+        op = request.get("op")
+        if op == "new":
+            game = self.new_game(request.get("fen"))
+            game.watchers.add(writer)
+            return game.message()
+        if op == "join":
+            game = self.game(request)
+            game.watchers.add(writer)
+            return game.message()
+        if op == "move":
+            game = self.game(request)
+            text = request.get("move")
+            if not isinstance(text, str):
+                raise ValueError("move is a string like e2e4")
+            try:
+                move, position = self.play(game, text)
+            except ValueError:
+                self.rejected += 1
+                raise
+            message = game.message(move, position)
+            data = (json.dumps(message) + "\n").encode()
+            for watcher in list(game.watchers):
+                if watcher is writer:
+                    continue
+                if watcher.is_closing() or watcher.transport.get_write_buffer_size() > WATCHER_BUFFER:
+                    game.watchers.discard(watcher)  # gone, or not reading: no pushes pile up for it
+                else:
+                    watcher.write(data)
+            return message
+        if op == "close":
+            game = self.games.pop(self.game(request).id)
+            return {"op": "closed", "game": game.id}
+        if op == "stats":
+            if "game" in request:
+                return dict(self.game(request).stats(), op="stats")
+            return dict(self.stats(), op="stats")
+        raise ValueError(f"unknown op {op!r}")
+
+    async def client(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        self.connections += 1
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                try:
+                    reply = self.handle(json.loads(line), writer)
+                except (ValueError, TypeError) as error:
+                    reply = {"op": "error", "error": str(error)}
+                writer.write((json.dumps(reply) + "\n").encode())
+                await writer.drain()
+        except (ConnectionError, ValueError):  # gone, or a line over the stream limit
+            pass
+        finally:
+            self.connections -= 1
+            for game in self.games.values():
+                game.watchers.discard(writer)
+            writer.close()
+
+    async def serve(self, host: str = "127.0.0.1", port: int = 8765) -> asyncio.AbstractServer:
+        return await asyncio.start_server(self.client, host, port, limit=1 << 16)
+
+
+async def _serve_forever(host: str, port: int, backend: str, ready=None) -> None:
+    server = await GameServer(backend).serve(host, port)
+    if ready is not None:
+        ready.set()
+    async with server:
+        await server.serve_forever()
+
+
+def serve(host: str, port: int, backend: str = "mailbox", ready=None) -> None:
+    asyncio.run(_serve_forever(host, port, backend, ready))
+
+
+async def _request(reader, writer, request: dict) -> dict:
+    writer.write((json.dumps(request) + "\n").encode())
+    await writer.drain()
+    return json.loads(await reader.readline())
+
+
+async def _player(host: str, port: int, games: int, max_plies: int, rng: random.Random, round_trips: list) -> tuple:
+    """One connection playing random games one after another. :returns (games, moves)"""
+    reader, writer = await asyncio.open_connection(host, port, limit=1 << 16)
+    played = moves = 0
+    try:
+        for _ in range(games):
+            reply = await _request(reader, writer, {"op": "new"})
+            game = reply["game"]
+            position = Position.initial()
+            for _ in range(max_plies):
+                legal = position.legal_moves()
+                if not legal:
+                    break
+                move = rng.choice(legal)
+                start = time.perf_counter()
+                reply = await _request(reader, writer, {"op": "move", "game": game, "move": move_name(move)})
+                round_trips.append(time.perf_counter() - start)
+                if reply["op"] != "position":
+                    raise RuntimeError(f"server refused {move_name(move)}: {reply}")
+                position.make_move(move)
+                moves += 1
+            await _request(reader, writer, {"op": "close", "game": game})
+            played += 1
+    finally:
+        writer.close()
+    return played, moves
+
+
+async def run_load(host: str = "127.0.0.1", port: int = 8765, connections: int = 100, games: int = 5,
+                   max_plies: int = 80, seed: int = 1) -> dict:
+    """
+    Play games on connections concurrent connections, each one game at a time.
+    :returns client side totals and round trip percentiles plus the server's stats
+    """
+    round_trips = []
+    start = time.perf_counter()
+    results = await asyncio.gather(*(_player(host, port, games, max_plies, random.Random(seed + i), round_trips)
+                                     for i in range(connections)))
+    seconds = time.perf_counter() - start
+    reader, writer = await asyncio.open_connection(host, port)
+    server_stats = await _request(reader, writer, {"op": "stats"})
+    writer.close()
+    ordered = sorted(round_trips)
+    return {
+        "connections": connections,
+        "games": sum(played for played, moves in results),
+        "moves": sum(moves for played, moves in results),
+        "seconds": round(seconds, 3),
+        "moves_per_second": int(len(ordered) / seconds) if seconds else 0,
+        "round_trip_p50_ms": round(_percentile(ordered, 0.5) * 1000, 3),
+        "round_trip_p99_ms": round(_percentile(ordered, 0.99) * 1000, 3),
+        "server": server_stats,
+    }
+
+
+def bench(connections: int, games: int, max_plies: int, move_interval: float, port: int = 8765,
+          backend: str = "mailbox") -> dict:
+    """Run a server process and the load generator against it. :returns the load report with per core figures"""
+    ready = multiprocessing.Event()
+    process = multiprocessing.Process(target=serve, args=("127.0.0.1", port, backend, ready), daemon=True)
+    process.start()
+    try:
+        if not ready.wait(10):
+            raise RuntimeError("server did not start")
+        report = asyncio.run(run_load("127.0.0.1", port, connections, games, max_plies))
+    finally:
+        process.terminate()
+        process.join()
+    server = report["server"]
+    cpu_per_move = server["cpu_seconds"] / server["moves"] if server["moves"] else 0
+    report["server_cpu_us_per_move"] = round(cpu_per_move * 1000000, 1)
+    report["move_interval"] = move_interval
+    report["games_per_core"] = int(move_interval / cpu_per_move) if cpu_per_move else 0
+    return report
+
+
+def main(argv: list = None) -> int:
+    parser = argparse.ArgumentParser(description="Multi-game chess server and its load generator")
+    commands = parser.add_subparsers(dest="command", required=True)
+    serve_parser = commands.add_parser("serve", help="host games until interrupted")
+    load_parser = commands.add_parser("load", help="play random games against a running server")
+    bench_parser = commands.add_parser("bench", help="start a server and load it")
+    for command in (serve_parser, load_parser, bench_parser):
+        command.add_argument("--host", default="127.0.0.1")
+        command.add_argument("--port", type=int, default=8765)
+    for command in (serve_parser, bench_parser):
+        command.add_argument("--backend", choices=BACKENDS, default="mailbox")
+    for command in (load_parser, bench_parser):
+        command.add_argument("--connections", type=int, default=100, help="concurrent clients, one game each")
+        command.add_argument("--games", type=int, default=5, help="games per connection")
+        command.add_argument("--max-plies", type=int, default=80)
+    bench_parser.add_argument("--move-interval", type=float, default=10.0,
+                              help="seconds between moves of a game at human pace")
+    args = parser.parse_args(argv)
+
+    if args.command == "serve":
+        try:
+            serve(args.host, args.port, args.backend)
+        except KeyboardInterrupt:
+            pass
+        return 0
+    if args.command == "load":
+        report = asyncio.run(run_load(args.host, args.port, args.connections, args.games, args.max_plies))
+    else:
+        report = bench(args.connections, args.games, args.max_plies, args.move_interval, args.port, args.backend)
+    print(json.dumps(report, indent=2))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,38 @@
+"""
+Piece images, cut out of ``img/ChessPiecesArray.png`` once and shared.
+
+The atlas has the black pieces in the top row and the white ones in the bottom
+row, each row in ``ATLAS_ORDER``, every cell ``CELL_SIZE`` pixels square. The
+first call to sprite() loads it and makes one subsurface per piece; every Piece
+then holds a reference to the same surface.
+"""
+
+import os
+
+import pygame
+
+ATLAS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "img", "ChessPiecesArray.png")
+ATLAS_ORDER = ("Q", "K", "R", "N", "B", "P")
+ATLAS_ROWS = ("b", "w")
+CELL_SIZE = 60
+
+_sprites = {}
+
+
+def load_atlas(path: str = ATLAS_PATH) -> dict:
+    """:returns {"wQ": surface, ...} cut from the atlas, converted for fast blits once a window exists"""
+    atlas = pygame.image.load(path)
+    if pygame.display.get_surface() is not None:
+        atlas = atlas.convert_alpha()
+    sprites = {}
+    for row, color in enumerate(ATLAS_ROWS):
+        for column, symbol in enumerate(ATLAS_ORDER):
+            sprites[color + symbol] = atlas.subsurface((column * CELL_SIZE, row * CELL_SIZE, CELL_SIZE, CELL_SIZE))
+    return sprites
+
+
+def sprite(code: str) -> pygame.Surface:
+    """:returns the shared image of the piece code, like "wK" """
+    if not _sprites:
+        _sprites.update(load_atlas())
+    return _sprites[code]
@@ -0,0 +1,277 @@
+"""
+Endgame tablebases for king and one piece against king (KQK, KRK, KPK), built by
+retrograde analysis over the moves of rules.py.
+
+Every table holds one byte per position: the distance to mate in plies for the
+side to move, odd if it mates and even if it gets mated (0 = mated now), or
+``DRAW``. The strong side is stored as white; a position with the piece on the
+black side is probed colour flipped. Files are mirrored so the white King stands
+on files a-d, and without a pawn also flipped so it stands on rows 1-4, which
+leaves 131072 entries for KQK/KRK and 262144 for KPK.
+
+    python tablebase.py generate --dir tablebases --workers 4
+    python tablebase.py probe "8/8/8/4k3/8/8/8/4K2R w - - 0 1"
+
+Generation collects the legal moves of every position in a process pool, one
+white King square per job, then resolves distances ply by ply with NumPy.
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+from array import array
+from concurrent.futures import ProcessPoolExecutor
+
+from rules import Position, WHITE, BLACK, EMPTY, BACKENDS, position_class, opponent
+
+TABLES = ("KQK", "KRK", "KPK")  # in build order, KPK promotes into the others
+DRAWN = ("KK", "KBK", "KNK")  # no mate possible, no table needed
+DIRECTORY = "tablebases"
+DRAW = 255
+INVALID = 254
+_UNKNOWN = 253  # only while generating
+
+
+def table_size(name: str) -> int:
+    return (32 if "P" in name else 16) * 64 * 64 * 2
+
+
+def index(name: str, white_king: int, black_king: int, piece: int, black_to_move: bool) -> int:
+    """:returns entry of the table for the squares, after mirroring to the stored part of the board"""
+    if white_king % 8 > 3:
+        white_king, black_king, piece = white_king ^ 7, black_king ^ 7, piece ^ 7
+    if "P" in name:
+        king = white_king // 8 * 4 + white_king % 8
+    else:
+        if white_king // 8 < 4:
+            white_king, black_king, piece = white_king ^ 56, black_king ^ 56, piece ^ 56
+        king = (white_king // 8 - 4) * 4 + white_king % 8
+    return ((king * 64 + black_king) * 64 + piece) * 2 + black_to_move
+
+
+def _white_king_squares(name: str) -> list:
+    if "P" in name:
+        return [y * 8 + x for y in range(8) for x in range(4)]
+    return [y * 8 + x for y in range(4, 8) for x in range(4)]
+
+
+def _successors(name: str, white_king: int, directory: str, backend: str) -> tuple:
+    """
+    Worker side: legal moves of every position with the white King on the square.
+    :returns (open entries, successor counts, successors, mated entries, stalemated entries)
+    as bytes of int32 arrays. A successor >= table size stands for the fixed value
+    (successor - size), for captures and promotions that leave the table.
+    """
+    size = table_size(name)
+    piece_code = WHITE + name[1]
+    promotions = Tablebase(directory) if "P" in name else None
+    cls = position_class(backend)
+    open_entries, counts, successors, mated, stalemated = (array("i") for _ in range(5))
+    for black_king in range(64):
+        for piece in range(64):
+            if len({white_king, black_king, piece}) < 3 or \
+                    (name[1] == "P" and piece // 8 in (0, 7)):
+                continue
+            for turn in (WHITE, BLACK):
+                board = [EMPTY] * 64
+                board[white_king], board[black_king], board[piece] = WHITE + "K", BLACK + "K", piece_code
+                position = cls(board, turn)
+                if position.in_check(opponent(turn)):
+                    continue
+                entry = index(name, white_king, black_king, piece, turn == BLACK)
+                moves = position.legal_moves()
+                if not moves:
+                    (mated if position.in_check() else stalemated).append(entry)
+                    continue
+                open_entries.append(entry)
+                counts.append(len(moves))
+                for frm, to, promotion in moves:
+                    if turn == BLACK:
+                        if to == piece:  # the piece is taken, bare kings
+                            successors.append(size + DRAW)
+                        else:
+                            successors.append(index(name, white_king, to, piece, False))
+                    elif frm == white_king:
+                        successors.append(index(name, to, black_king, piece, True))
+                    elif promotion:
+                        value = promotions.value("K" + promotion + "K", white_king, black_king, to, True)
+                        successors.append(size + value)
+                    else:
+                        successors.append(index(name, white_king, black_king, to, True))
+    return tuple(a.tobytes() for a in (open_entries, counts, successors, mated, stalemated))
+
+
+def generate(name: str, directory: str = DIRECTORY, workers: int = 1, backend: str = "mailbox") -> dict:
+    """
+    Build one table into directory/name.tb; the tables it promotes into must exist.
+    :returns report with positions, wins, draws, losses, longest mate, seconds and bytes
+    """
+    import numpy as np  # only generation needs it, probing works without
+
+    if "P" in name:
+        tablebase = Tablebase(directory)
+        missing = [table for table in TABLES if "P" not in table and tablebase._table(table) is None]
+        if missing:
+            raise ValueError(f"{name} promotes into {', '.join(missing)}: generate them in {directory} first")
+
+    start = time.perf_counter()
+    size = table_size(name)
+    jobs = [(name, white_king, directory, backend) for white_king in _white_king_squares(name)]
+    if workers > 1:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            parts = list(pool.map(_successors, *zip(*jobs)))
+    else:
+        parts = [_successors(*job) for job in jobs]
+    open_entries, counts, successors, mated, stalemated = (
+        np.concatenate([np.frombuffer(part[i], dtype=np.int32) for part in parts]) for i in range(5))
+    parts = None
+
+    values = np.full(size, INVALID, dtype=np.uint8)
+    values[mated] = 0
+    values[stalemated] = DRAW
+    values[open_entries] = _UNKNOWN
+    offsets = np.concatenate(([0], np.cumsum(counts)[:-1]))
+    fixed = successors[successors >= size] - size
+    last_fixed = int(fixed[fixed < _UNKNOWN].max()) if (fixed < _UNKNOWN).any() else 0
+    constants = np.arange(256, dtype=np.uint8)
+
+    ply = 0
+    last_change = 0
+    while ply < _UNKNOWN - 1 and (ply <= last_fixed + 1 or ply - last_change < 2):
+        ply += 1
+        child = np.concatenate((values, constants))[successors]
+        unknown = values[open_entries] == _UNKNOWN
+        if ply % 2:  # mates in ply: some move reaches a position lost in ply - 1
+            found = unknown & np.logical_or.reduceat(child == ply - 1, offsets)
+        else:  # mated in ply: every move reaches a won position, the longest in ply - 1
+            won = (child < _UNKNOWN) & (child % 2 == 1)
+            found = unknown & np.logical_and.reduceat(won, offsets) & \
+                (np.maximum.reduceat(child, offsets) == ply - 1)
+        if found.any():
+            values[open_entries[found]] = ply
+            last_change = ply
+    values[values == _UNKNOWN] = DRAW
+
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, name + ".tb")
+    with open(path, "wb") as out:
+        out.write(values.tobytes())
+    valid = values != INVALID
+    decided = valid & (values != DRAW)
+    return {
+        "table": name,
+        "positions": int(valid.sum()),
+        "wins": int((decided & (values % 2 == 1)).sum()),
+        "draws": int((values == DRAW).sum()),
+        "losses": int((decided & (values % 2 == 0)).sum()),
+        "longest_mate": int(values[decided].max()) if decided.any() else 0,
+        "seconds": round(time.perf_counter() - start, 3),
+        "bytes": os.path.getsize(path),
+    }
+
+
+class Tablebase(object):
+    """
+    Tables of a directory, read on first use. probe() costs a material count and
+    one byte lookup.
+    """
+
+    def __init__(self, directory: str = DIRECTORY):
+        self.directory = directory
+        self._tables = {}
+
+    def _table(self, name: str) -> bytes or None:
+        if name not in self._tables:
+            path = os.path.join(self.directory, name + ".tb")
+            table = None
+            if os.path.exists(path):
+                with open(path, "rb") as f:
+                    table = f.read()
+                if len(table) != table_size(name):
+                    raise ValueError(f"{path} is not a {name} table")
+            self._tables[name] = table
+        return self._tables[name]
+
+    def value(self, name: str, white_king: int, black_king: int, piece: int, black_to_move: bool) -> int or None:
+        """:returns the stored byte of the squares, DRAW for the drawn material, None without the table"""
+        if name in DRAWN:
+            return DRAW
+        table = self._table(name)
+        if table is None:
+            return None
+        return table[index(name, white_king, black_king, piece, black_to_move)]
+
+    def probe(self, position: Position) -> tuple or None:
+        """
+        :returns (wdl, plies to mate) for the side to move, wdl being 1, 0 or -1 and
+        plies None for a draw; None if the position is not covered
+        """
+        board = position.board
+        pieces = 64 - board.count(EMPTY)
+        if pieces > 3 or position.castling:
+            return None
+        if pieces == 2:
+            return 0, None
+        piece = next(sq for sq, el in enumerate(board) if el != EMPTY and el[1] != "K")
+        color, symbol = board[piece]
+        white_king, black_king = board.index(WHITE + "K"), board.index(BLACK + "K")
+        black_to_move = position.turn == BLACK
+        if color == BLACK:  # store the strong side as white
+            white_king, black_king, piece = black_king ^ 56, white_king ^ 56, piece ^ 56
+            black_to_move = not black_to_move
+        value = self.value("K" + symbol + "K", white_king, black_king, piece, black_to_move)
+        if value is None or value == INVALID:
+            return None
+        if value == DRAW:
+            return 0, None
+        return (1 if value % 2 else -1), value
+
+
+def main(argv: list = None) -> int:
+    parser = argparse.ArgumentParser(description="Build or probe the endgame tablebases")
+    commands = parser.add_subparsers(dest="command", required=True)
+    generate_parser = commands.add_parser("generate", help="build tables by retrograde analysis")
+    generate_parser.add_argument("tables", nargs="*", default=list(TABLES), help=f"any of {', '.join(TABLES)}")
+    generate_parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    generate_parser.add_argument("--backend", choices=BACKENDS, default="mailbox")
+    generate_parser.add_argument("--json", action="store_true", help="one JSON report per table")
+    probe_parser = commands.add_parser("probe", help="look up a position")
+    probe_parser.add_argument("fen")
+    for command in (generate_parser, probe_parser):
+        command.add_argument("--dir", default=DIRECTORY, help="tablebase directory")
+    args = parser.parse_args(argv)
+
+    if args.command == "generate":
+        unknown = set(args.tables) - set(TABLES)
+        if unknown:
+            parser.error(f"no such table: {', '.join(sorted(unknown))}")
+        for name in TABLES:
+            if name not in args.tables:
+                continue
+            try:
+                report = generate(name, args.dir, args.workers, args.backend)
+            except ValueError as error:
+                parser.error(str(error))
+            if args.json:
+                print(json.dumps(report), flush=True)
+            else:
+                print(f"{name}: {report['positions']} positions, {report['wins']} won, {report['draws']} drawn, "
+                      f"{report['losses']} lost, longest mate {report['longest_mate']} plies, "
+                      f"{report['seconds']:.1f}s, {report['bytes']} bytes", flush=True)
+        return 0
+
+    position = Position.from_fen(args.fen)
+    probed = Tablebase(args.dir).probe(position)
+    if probed is None:
+        print("not in the tablebases")
+    elif probed[0] == 0:
+        print("draw")
+    else:
+        print(f"{'mates' if probed[0] > 0 else 'gets mated'} in {probed[1]} plies")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,77 @@
+"""
+Attack and ray tables, built once at import time and shared by every piece.
+
+Squares are ``y * 8 + x`` like in rules.py. Each table comes as tuples of target
+squares (for the list-walking generators in models.py and rules.py) and as
+64-bit masks (for bitboard.py).
+"""
+
+# the same compass Piece used to keep per instance, from white's point of view
+DIRECTIONS = {
+    "N": (0, -1),
+    "NE": (1, -1),
+    "E": (1, 0),
+    "SE": (1, 1),
+    "S": (0, 1),
+    "SW": (-1, 1),
+    "W": (-1, 0),
+    "NW": (-1, -1)
+}
+ROOK_DIRECTIONS = tuple(DIRECTIONS[k] for k in ("N", "E", "S", "W"))
+BISHOP_DIRECTIONS = tuple(DIRECTIONS[k] for k in ("NE", "SE", "SW", "NW"))
+QUEEN_DIRECTIONS = ROOK_DIRECTIONS + BISHOP_DIRECTIONS
+KNIGHT_OFFSETS = ((-1, -2), (1, -2), (2, -1), (2, 1), (-1, 2), (1, 2), (-2, -1), (-2, 1))
+
+# (x, y) tile of every square
+TILES = tuple((sq % 8, sq // 8) for sq in range(64))
+
+
+def _leaper_targets(offsets) -> tuple:
+    targets = []
+    for x, y in TILES:
+        targets.append(tuple((y + dy) * 8 + x + dx for dx, dy in offsets if 0 <= x + dx < 8 and 0 <= y + dy < 8))
+    return tuple(targets)
+
+
+def _ray(sq: int, dx: int, dy: int) -> tuple:
+    """:returns squares from sq (excluded) to the edge of the board, nearest first"""
+    x, y = TILES[sq]
+    ray = []
+    x, y = x + dx, y + dy
+    while 0 <= x < 8 and 0 <= y < 8:
+        ray.append(y * 8 + x)
+        x, y = x + dx, y + dy
+    return tuple(ray)
+
+
+def _mask(squares) -> int:
+    bits = 0
+    for sq in squares:
+        bits |= 1 << sq
+    return bits
+
+
+KNIGHT_TARGETS = _leaper_targets(KNIGHT_OFFSETS)
+KING_TARGETS = _leaper_targets(QUEEN_DIRECTIONS)
+# squares a pawn of the color standing on a square hits
+PAWN_TARGETS = {
+    "w": _leaper_targets((DIRECTIONS["NW"], DIRECTIONS["NE"])),
+    "b": _leaper_targets((DIRECTIONS["SW"], DIRECTIONS["SE"])),
+}
+
+# non-empty rays of every square, nearest square first
+ROOK_RAYS = tuple(tuple(r for r in (_ray(sq, dx, dy) for dx, dy in ROOK_DIRECTIONS) if r) for sq in range(64))
+BISHOP_RAYS = tuple(tuple(r for r in (_ray(sq, dx, dy) for dx, dy in BISHOP_DIRECTIONS) if r) for sq in range(64))
+QUEEN_RAYS = tuple(ROOK_RAYS[sq] + BISHOP_RAYS[sq] for sq in range(64))
+
+# the same tables as bitboards
+KNIGHT_ATTACKS = tuple(_mask(t) for t in KNIGHT_TARGETS)
+KING_ATTACKS = tuple(_mask(t) for t in KING_TARGETS)
+PAWN_ATTACKS = {color: tuple(_mask(t) for t in targets) for color, targets in PAWN_TARGETS.items()}
+
+# (ray mask per square, rising) for each direction; a ray towards higher squares
+# stops at its lowest blocker, any other at its highest one
+ROOK_RAY_MASKS = tuple((tuple(_mask(_ray(sq, dx, dy)) for sq in range(64)), dy * 8 + dx > 0)
+                       for dx, dy in ROOK_DIRECTIONS)
+BISHOP_RAY_MASKS = tuple((tuple(_mask(_ray(sq, dx, dy)) for sq in range(64)), dy * 8 + dx > 0)
+                         for dx, dy in BISHOP_DIRECTIONS)
@@ -0,0 +1,14 @@
+from parallel_search import ParallelSearcher
+from rules import Position, START_FEN
+
+KIWIPETE = "r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w KQkq - 0 1"
+
+
+def test_fixed_depth_result_is_the_same_for_any_worker_count():
+    for fen, depth in ((START_FEN, 3), (KIWIPETE, 2)):
+        outcomes = []
+        for workers in (1, 2, 3):
+            with ParallelSearcher(workers) as searcher:
+                result = searcher.search(Position.from_fen(fen), max_depth=depth)
+            outcomes.append((result["move"], result["score"], result["scores"], result["nodes"]))
+        assert outcomes[0] == outcomes[1] == outcomes[2]
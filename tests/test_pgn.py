@@ -0,0 +1,25 @@
+from pgn import read_games, replay_game, replay_games
+
+BAD_EN_PASSANT = """[Event "bad"]
+[SetUp "1"]
+[FEN "rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq e6 0 1"]
+
+1. e4 e5 *
+
+[Event "good"]
+
+1. e4 e5 2. Nf3 *
+"""
+
+
+def test_bad_en_passant_header_is_reported_and_the_next_game_replays():
+    records = list(replay_games(read_games(BAD_EN_PASSANT.splitlines())))
+    assert len(records) == 2
+    assert records[0]["plies"] == 0
+    assert "bad FEN header" in records[0]["error"] and "en passant" in records[0]["error"]
+    assert "error" not in records[1] and records[1]["plies"] == 3
+
+
+def test_bad_en_passant_header_single_game():
+    game = next(read_games(BAD_EN_PASSANT.splitlines()))
+    assert "error" in replay_game(game, "bitboard")
@@ -0,0 +1,9 @@
+from rules import Position, START_FEN
+from search import Searcher, MAX_PLY
+
+
+def test_search_stops_at_the_ply_limit():
+    for ply in range(MAX_PLY - 4, MAX_PLY):
+        searcher = Searcher(1)
+        searcher.new_search()
+        searcher.score(Position.from_fen(START_FEN), 3, ply=ply)
@@ -0,0 +1,214 @@
+"""
+Engine against engine games in a process pool, for tuning and rule checks.
+
+    python tournament.py --games 200 --workers 4 --nodes 20000 --pgn games.pgn --jsonl games.jsonl
+    python tournament.py --openings openings.epd --time 0.5 --games 100
+
+Games start from the position GameProcess.chess_board_fill sets up, or cycle
+through the FEN/EPD lines of ``--openings``. Both sides are a Searcher with the
+same per-move limits and their own transposition table; ``--random-plies`` opens
+every game with that many random moves (seeded by the game number) so node or
+depth limited games do not all repeat each other.
+
+A game is adjudicated on checkmate, stalemate, threefold repetition, the fifty
+move rule and, as a safety net, ``--max-plies`` (scored a draw). Finished games
+are written to the PGN and JSONL files as they come in, in finishing order; the
+summary on stderr has the results, games per hour and how busy each worker was.
+"""
+
+import argparse
+import json
+import os
+import random
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+
+from pgn import move_san
+from rules import Game, Position, START_FEN, WHITE, BACKENDS, position_class, move_name
+from search import Searcher
+from validate_fen import read_lines, parse
+
+PGN_LINE = 79
+
+
+def play_game(number: int, fen: str, limits: dict, random_plies: int = 0, max_plies: int = 400,
+              backend: str = "mailbox", table_size_mb: float = 8) -> dict:
+    """
+    Play one game of Searcher against Searcher.
+    :param limits: Searcher.search keyword arguments for every move
+    :returns record with result, termination, the moves in UCI and SAN, plies,
+    nodes, seconds and the worker process id
+    """
+    start = time.perf_counter()
+    game = Game(position_class(backend).from_fen(fen))
+    searchers = [Searcher(table_size_mb), Searcher(table_size_mb)]
+    rng = random.Random(number)
+    sans = []
+    nodes = 0
+    while True:
+        termination = game.termination()
+        if termination is not None:
+            result = game.result()
+            break
+        if len(game.moves) >= max_plies:
+            result, termination = "1/2-1/2", "ply limit"
+            break
+        position = game.position
+        if len(game.moves) < random_plies:
+            move = rng.choice(game.legal_moves())
+        else:
+            found = searchers[position.turn != WHITE].search(position, history=game.history, **limits)
+            move = found["move"]
+            nodes += found["nodes"]
+        sans.append(move_san(position, move, game.legal_moves()))
+        game.push(move)
+    moves = [move_name(move) for move in game.moves]
+    return {"game": number, "fen": fen, "result": result, "termination": termination, "plies": len(moves),
+            "moves": moves, "san": sans, "nodes": nodes, "seconds": round(time.perf_counter() - start, 3),
+            "worker": os.getpid()}
+
+
+def game_pgn(record: dict, event: str = "Engine tournament") -> str:
+    """:returns the record as a PGN game"""
+    headers = [("Event", event), ("Site", "?"), ("Date", time.strftime("%Y.%m.%d")),
+               ("Round", str(record["game"])), ("White", "Searcher"), ("Black", "Searcher"),
+               ("Result", record["result"])]
+    if record["fen"] != START_FEN:
+        headers += [("SetUp", "1"), ("FEN", record["fen"])]
+    headers += [("PlyCount", str(record["plies"])), ("Termination", record["termination"])]
+
+    fen_parts = record["fen"].split()
+    black_first = fen_parts[1] != WHITE
+    number = int(fen_parts[5]) if len(fen_parts) > 5 else 1
+    tokens = []
+    for ply, san in enumerate(record["san"]):
+        if ply == 0 and black_first:
+            tokens.append(f"{number}...")
+        elif (ply + black_first) % 2 == 0:
+            tokens.append(f"{number + (ply + black_first) // 2}.")
+        tokens.append(san)
+    tokens.append(record["result"])
+
+    lines, line = [], ""
+    for token in tokens:
+        if line and len(line) + 1 + len(token) > PGN_LINE:
+            lines.append(line)
+            line = token
+        else:
+            line = f"{line} {token}" if line else token
+    lines.append(line)
+    return "".join(f'[{name} "{value}"]\n' for name, value in headers) + "\n" + "\n".join(lines) + "\n\n"
+
+
+def load_openings(path: str, backend: str = "mailbox") -> list:
+    """:returns FENs of the playable positions of a FEN/EPD file, the others are reported on stderr"""
+    openings = []
+    for number, fen, operations, position, error in parse(read_lines(path), backend):
+        if position is None:
+            print(f"line {number}: skipped, {error}", file=sys.stderr)
+        elif not position.legal_moves():
+            print(f"line {number}: skipped, no legal moves", file=sys.stderr)
+        else:
+            openings.append(position.to_fen())
+    return openings
+
+
+def run(openings: list, games: int, limits: dict, workers: int = 1, random_plies: int = 0,
+        max_plies: int = 400, backend: str = "mailbox", table_size_mb: float = 8):
+    """
+    Yield the record of every game as it finishes. Game n starts from openings[(n - 1) % len(openings)].
+    With more than one worker at most two games per worker wait in the pool.
+    """
+    jobs = ((number, openings[(number - 1) % len(openings)], limits, random_plies, max_plies, backend,
+             table_size_mb) for number in range(1, games + 1))
+    if workers <= 1:
+        for job in jobs:
+            yield play_game(*job)
+        return
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        pending = set()
+        for job in jobs:
+            pending.add(pool.submit(play_game, *job))
+            if len(pending) >= 2 * workers:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    yield future.result()
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                yield future.result()
+
+
+def main(argv: list = None) -> int:
+    parser = argparse.ArgumentParser(description="Play engine against engine games in parallel")
+    parser.add_argument("--games", type=int, default=100)
+    parser.add_argument("--openings", help="FEN/EPD file of start positions, the usual start if not given")
+    parser.add_argument("--workers", type=int, default=0, help="processes, 0 for one per core")
+    parser.add_argument("--depth", type=int, help="search depth per move")
+    parser.add_argument("--nodes", type=int, help="nodes per move")
+    parser.add_argument("--time", type=float, help="seconds per move")
+    parser.add_argument("--random-plies", type=int, default=0, help="random moves opening every game")
+    parser.add_argument("--max-plies", type=int, default=400, help="draw a game that gets this long")
+    parser.add_argument("--table-mb", type=float, default=8, help="transposition table per side")
+    parser.add_argument("--backend", choices=BACKENDS, default="mailbox")
+    parser.add_argument("--pgn", help="append the games to this PGN file")
+    parser.add_argument("--jsonl", help="append one JSON record per game to this file")
+    parser.add_argument("--quiet", action="store_true", help="no line per game on stdout")
+    args = parser.parse_args(argv)
+
+    limits = {"max_depth": args.depth, "node_limit": args.nodes, "time_limit": args.time}
+    limits = {name: value for name, value in limits.items() if value is not None}
+    if not limits:
+        limits = {"node_limit": 10000}
+    openings = load_openings(args.openings, args.backend) if args.openings else [Position.initial().to_fen()]
+    if not openings:
+        parser.error(f"no playable position in {args.openings}")
+    workers = args.workers or os.cpu_count() or 1
+
+    pgn_out = open(args.pgn, "a", encoding="utf-8") if args.pgn else None
+    jsonl_out = open(args.jsonl, "a", encoding="utf-8") if args.jsonl else None
+    start = time.perf_counter()
+    scores = {"1-0": 0, "0-1": 0, "1/2-1/2": 0}
+    terminations = {}
+    busy = {}
+    plies = nodes = played = 0
+    try:
+        for record in run(openings, args.games, limits, workers, args.random_plies, args.max_plies,
+                          args.backend, args.table_mb):
+            played += 1
+            scores[record["result"]] += 1
+            terminations[record["termination"]] = terminations.get(record["termination"], 0) + 1
+            busy[record["worker"]] = busy.get(record["worker"], 0) + record["seconds"]
+            plies += record["plies"]
+            nodes += record["nodes"]
+            if pgn_out:
+                pgn_out.write(game_pgn(record))
+                pgn_out.flush()
+            if jsonl_out:
+                jsonl_out.write(json.dumps(record) + "\n")
+                jsonl_out.flush()
+            if not args.quiet:
+                print(f"game {record['game']}: {record['result']:<7} {record['termination']:<11} "
+                      f"{record['plies']} plies  {record['seconds']:.1f}s", flush=True)
+    except KeyboardInterrupt:
+        print("interrupted", file=sys.stderr)
+    finally:
+        for out in (pgn_out, jsonl_out):
+            if out:
+                out.close()
+
+    seconds = time.perf_counter() - start
+    print(f"{played} games  +{scores['1-0']} ={scores['1/2-1/2']} -{scores['0-1']} (white's view)  "
+          f"{', '.join(f'{name} {count}' for name, count in sorted(terminations.items()))}", file=sys.stderr)
+    print(f"{seconds:.1f}s  {played * 3600 / seconds if seconds else 0:.0f} games/hour  "
+          f"{plies / played if played else 0:.0f} plies/game  {int(nodes / seconds) if seconds else 0} nodes/s",
+          file=sys.stderr)
+    for worker, worker_busy in sorted(busy.items()):
+        print(f"worker {worker}: {100 * worker_busy / seconds if seconds else 0:.0f}% busy", file=sys.stderr)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
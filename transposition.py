@@ -0,0 +1,97 @@
+"""
+Fixed-size transposition table keyed by Zobrist hashes (see zobrist.py).
+
+Entries live in preallocated parallel arrays, one slot per ``hash & mask``, so
+the table never grows past the size it was created with. When two positions
+want the same slot, the one searched deeper wins, except that entries left over
+from an older search (``new_search`` bumps the age) are always replaced.
+"""
+
+from array import array
+
+EXACT = 0
+LOWER = 1  # score is at least this (fail high)
+UPPER = 2  # score is at most this (fail low)
+
+# key + depth + score + flag + age + move reference, rounded up
+ENTRY_SIZE = 32
+
+
+class TranspositionTable(object):
+    def __init__(self, size_mb: float = 16):
+        entries = 1
+        while entries * 2 * ENTRY_SIZE <= size_mb * 1024 * 1024:
+            entries *= 2
+        self._mask = entries - 1
+        self._keys = array("Q", bytes(8 * entries))
+        self._depths = array("b", bytes(entries))
+        self._scores = array("i", bytes(4 * entries))
+        self._flags = array("B", bytes(entries))
+        self._ages = array("B", bytes(entries))
+        self._moves = [None] * entries
+        self._age = 1  # age 0 marks an empty slot
+        self.hits = 0
+        self.misses = 0
+        self.stores = 0
+        self.overwrites = 0
+
+    @property
+    def size(self) -> int:
+        """number of slots"""
+        return self._mask + 1
+
+    def new_search(self) -> None:
+        """Mark everything stored so far as old, so the next search may overwrite it"""
+        self._age = self._age % 255 + 1
+
+    def clear(self) -> None:
+        entries = self.size
+        self._keys = array("Q", bytes(8 * entries))
+        self._ages = array("B", bytes(entries))
+        self._moves = [None] * entries
+        self.hits = self.misses = self.stores = self.overwrites = 0
+
+    def probe(self, key: int) -> tuple or None:
+        """:returns (depth, score, flag, move) stored for the position or None"""
+        i = key & self._mask
+        if self._ages[i] and self._keys[i] == key:
+            self.hits += 1
+            return self._depths[i], self._scores[i], self._flags[i], self._moves[i]
+        self.misses += 1
+        return None
+
+    def store(self, key: int, depth: int, score: int, flag: int, move=None) -> None:
+        i = key & self._mask
+        age = self._ages[i]
+        if age:
+            if self._keys[i] == key:
+                if move is None:
+                    move = self._moves[i]  # keep the best move of a shallower search of the same position
+            elif age == self._age and depth < self._depths[i]:
+                return
+            else:
+                self.overwrites += 1
+        self._keys[i] = key
+        self._depths[i] = depth
+        self._scores[i] = score
+        self._flags[i] = flag
+        self._ages[i] = self._age
+        self._moves[i] = move
+        self.stores += 1
+
+    def hashfull(self) -> int:
+        """permille of the first thousand slots filled by the current search, as UCI reports it"""
+        sample = min(1000, self.size)
+        return sum(1 for i in range(sample) if self._ages[i] == self._age) * 1000 // sample
+
+    def stats(self) -> dict:
+        probes = self.hits + self.misses
+        return {
+            "size": self.size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / probes if probes else 0.0,
+            "stores": self.stores,
+            "overwrites": self.overwrites,
+            "hashfull": self.hashfull(),
+        }
@@ -0,0 +1,120 @@
+"""
+Stream a FEN or EPD file through the rules engine, one position per line.
+
+    python validate_fen.py positions.epd
+    zcat big.fen.gz | python validate_fen.py - --json --invalid-only
+
+Every line goes through a chain of generators (read, parse, judge), so only one
+position is held at a time whatever the size of the file. Each line is reported
+with its legal move count and whether the side to move is in check, mated or
+stalemated, or with the reason it is not a playable position. A summary with
+lines per second goes to stderr at the end; the exit code is 1 if any line was
+invalid.
+
+EPD lines may carry operations after the four position fields (``bm e4; id "x";``);
+they are passed through in the record as text.
+"""
+
+import argparse
+import json
+import sys
+import time
+
+from rules import BACKENDS, position_class
+
+
+def read_lines(path: str):
+    """Yield (line number, text) of the non-empty, non-comment lines of a file, "-" for stdin"""
+    stream = sys.stdin if path == "-" else open(path, encoding="utf-8")
+    try:
+        for number, line in enumerate(stream, 1):
+            line = line.strip()
+            if line and not line.startswith("#"):
+                yield number, line
+    finally:
+        if stream is not sys.stdin:
+            stream.close()
+
+
+def split_epd(line: str) -> tuple:
+    """:returns (FEN part, EPD operations or "") of a FEN or EPD line"""
+    parts = line.split(None, 4)
+    if len(parts) > 4 and not parts[4].split(None, 1)[0].isdigit():
+        return " ".join(parts[:4]), parts[4]
+    return line, ""
+
+
+def parse(lines, backend: str = "mailbox"):
+    """Yield (line number, FEN, operations, position or None, error or None)"""
+    cls = position_class(backend)
+    for number, line in lines:
+        fen, operations = split_epd(line)
+        try:
+            position = cls.from_fen(fen)
+        except ValueError as error:
+            yield number, fen, operations, None, str(error)
+            continue
+        problems = position.problems()
+        if problems:
+            yield number, fen, operations, None, "; ".join(problems)
+        else:
+            yield number, fen, operations, position, None
+
+
+def judge(parsed):
+    """Yield one report dict per line"""
+    for number, fen, operations, position, error in parsed:
+        record = {"line": number, "fen": fen}
+        if operations:
+            record["epd"] = operations
+        if position is None:
+            record.update(valid=False, error=error)
+        else:
+            moves = len(position.legal_moves())
+            check = position.in_check()
+            status = ("mate" if check else "stalemate") if not moves else "check" if check else "ok"
+            record.update(valid=True, legal_moves=moves, check=check, status=status)
+        yield record
+
+
+def validate(path: str, backend: str = "mailbox"):
+    """Yield the report of every position line of the file"""
+    return judge(parse(read_lines(path), backend))
+
+
+def main(argv: list = None) -> int:
+    parser = argparse.ArgumentParser(description="Check every FEN/EPD line of a file and count legal moves")
+    parser.add_argument("path", help='FEN or EPD file, "-" for stdin')
+    parser.add_argument("--backend", choices=BACKENDS, default="mailbox")
+    parser.add_argument("--json", action="store_true", help="one JSON record per line")
+    parser.add_argument("--invalid-only", action="store_true", help="report only the invalid lines")
+    args = parser.parse_args(argv)
+
+    start = time.perf_counter()
+    lines = invalid = 0
+    statuses = {}
+    out = sys.stdout
+    for record in validate(args.path, args.backend):
+        lines += 1
+        if record["valid"]:
+            statuses[record["status"]] = statuses.get(record["status"], 0) + 1
+            if args.invalid_only:
+                continue
+        else:
+            invalid += 1
+        if args.json:
+            out.write(json.dumps(record) + "\n")
+        elif record["valid"]:
+            out.write(f"{record['line']}: {record['status']:<9} {record['legal_moves']:>3} moves  {record['fen']}\n")
+        else:
+            out.write(f"{record['line']}: INVALID   {record['error']}  {record['fen']}\n")
+
+    seconds = time.perf_counter() - start
+    counts = "  ".join(f"{status} {count}" for status, count in sorted(statuses.items()))
+    print(f"{lines} lines  {invalid} invalid  {counts}  {seconds:.2f}s  "
+          f"{int(lines / seconds) if seconds else 0} lines/s", file=sys.stderr)
+    return 1 if invalid else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
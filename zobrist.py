@@ -0,0 +1,46 @@
+"""
+Zobrist keys: one random 64-bit number per (piece, square), castling rights,
+en passant file and side to move. The hash of a position is the xor of the keys
+of everything in it, so a move changes it by xoring a handful of keys in and out.
+
+Keys come from a fixed seed so hashes stay the same between runs and processes
+(opening books and tablebases store them on disk).
+"""
+
+import random
+
+_random = random.Random(0x5EED)
+
+PIECE_KEYS = {color + symbol: tuple(_random.getrandbits(64) for _ in range(64))
+              for color in ("w", "b") for symbol in "PNBRQK"}
+# indexed by the castling rights bit mask
+CASTLING_KEYS = tuple(_random.getrandbits(64) if rights else 0 for rights in range(16))
+# indexed by the x of the en passant square
+EN_PASSANT_KEYS = tuple(_random.getrandbits(64) for _ in range(8))
+BLACK_TO_MOVE_KEY = _random.getrandbits(64)
+
+
+def en_passant_key(board: list, en_passant: int or None, turn: str) -> int:
+    """
+    The en passant file only counts if a pawn of the side to move can actually
+    take there, so positions that only differ by an unusable ep square match.
+    """
+    if en_passant is None:
+        return 0
+    pawn = turn + "P"
+    behind = en_passant + 8 if turn == "w" else en_passant - 8
+    x = en_passant % 8
+    if (x > 0 and board[behind - 1] == pawn) or (x < 7 and board[behind + 1] == pawn):
+        return EN_PASSANT_KEYS[x]
+    return 0
+
+
+def hash_position(board: list, turn: str, castling: int, en_passant: int or None) -> int:
+    """:returns the full hash of a position, computed from scratch"""
+    key = 0
+    for sq, el in enumerate(board):
+        if el != 0:
+            key ^= PIECE_KEYS[el][sq]
+    if turn == "b":
+        key ^= BLACK_TO_MOVE_KEY
+    return key ^ CASTLING_KEYS[castling] ^ en_passant_key(board, en_passant, turn)